@@ -5,69 +5,208 @@
 import requests
 import json
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from typing import Dict, Optional
 
+from llm_telemetry import get_llm_telemetry
+from key_pool import get_key_pool, parse_keys, primary_key
+from provider_failover import get_circuit_breakers, failover_targets, is_provider_fault
+from hedging import get_hedge_policy, get_deadline_timer
+from cancellation import CallCanceled, CancelToken, bind_token, cancellable_session, current_token, get_cancel_registry
+
+# 各模型每百万token的大致价格（美元，输入/输出），按模型名前缀匹配，仅用于估算费用
+MODEL_PRICES = (
+    ('gpt-3.5-turbo', 0.5, 1.5),
+    ('gpt-4o-mini', 0.15, 0.6),
+    ('gpt-4o', 2.5, 10.0),
+    ('gpt-4-turbo', 10.0, 30.0),
+    ('gpt-4', 30.0, 60.0),
+    ('deepseek-chat', 0.27, 1.1),
+    ('deepseek-reasoner', 0.55, 2.19),
+    ('qwen-turbo', 0.05, 0.2),
+    ('qwen-plus', 0.4, 1.2),
+    ('qwen-max', 1.6, 6.4),
+    ('gemini-1.5-flash', 0.075, 0.3),
+    ('gemini-1.5-pro', 1.25, 5.0),
+    ('gemini-pro', 0.5, 1.5),
+    ('grok', 3.0, 15.0),
+)
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """按 MODEL_PRICES 估算费用（美元），未知模型或无用量时返回None"""
+    if prompt_tokens is None and completion_tokens is None:
+        return None
+    for prefix, input_price, output_price in MODEL_PRICES:
+        if (model or '').startswith(prefix):
+            return ((prompt_tokens or 0) * input_price + (completion_tokens or 0) * output_price) / 1e6
+    return None
+
+
+class LLMCallResult:
+    """一次大模型调用的结果与耗时统计（时间单位为秒）"""
+
+    __slots__ = ('text', 'provider', 'model', 'queue_wait', 'ttfb', 'total', 'prompt_tokens',
+                 'completion_tokens', 'total_tokens', 'retries', 'cost', 'error', 'started_at', 'failover_from',
+                 'hedge', 'canceled')
+
+    def __init__(self, provider, model):
+        self.text = None
+        self.provider = provider
+        self.model = model
+        self.queue_wait = 0.0  # 提交后到开始调用的等待
+        self.ttfb = None  # 最后一次尝试发出请求到收到响应头
+        self.total = None  # 开始调用到结束（含重试和退避）
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.total_tokens = None
+        self.retries = 0
+        self.cost = None
+        self.error = None
+        self.started_at = None
+        self.failover_from = None  # 故障转移时原本请求的 provider/model
+        self.hedge = None  # 发出对冲请求时，先完成的是 'primary' 还是 'hedge'
+        self.canceled = False  # 因任务终止或对冲落后被中止
+
+    def set_usage(self, usage):
+        if not usage:
+            return
+        self.prompt_tokens = usage.get('prompt_tokens')
+        self.completion_tokens = usage.get('completion_tokens')
+        self.total_tokens = usage.get('total_tokens')
+        if self.total_tokens is None and (self.prompt_tokens is not None or self.completion_tokens is not None):
+            self.total_tokens = (self.prompt_tokens or 0) + (self.completion_tokens or 0)
+        self.cost = estimate_cost(self.model, self.prompt_tokens, self.completion_tokens)
+
+    def to_dict(self):
+        def seconds(value):
+            return round(value, 3) if value is not None else None
+        return {
+            'provider': self.provider,
+            'model': self.model,
+            'queue_wait': seconds(self.queue_wait),
+            'ttfb': seconds(self.ttfb),
+            'total': seconds(self.total),
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.total_tokens,
+            'retries': self.retries,
+            'cost': round(self.cost, 6) if self.cost is not None else None,
+            'error': self.error,
+            'started_at': self.started_at,
+            'failover_from': self.failover_from,
+            'hedge': self.hedge,
+            'canceled': self.canceled,
+        }
+
+
+KEY_ERROR_STATUSES = (401, 403, 429)  # 与Key相关的错误，池中有其他Key时换Key立即重试
+
+
+def _retry_after(response):
+    """429 响应的 Retry-After 秒数"""
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def failure_telemetry(error):
+    """失败调用的统计（call_agent_detailed 抛出的异常上的 llm_result），没有时返回None"""
+    llm_result = getattr(error, 'llm_result', None)
+    return llm_result.to_dict() if llm_result is not None else None
+
+
+HEDGE_WORKERS = 32
+
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+
+def _get_hedge_executor():
+    """对冲调用使用的线程池（只在开启对冲时创建）"""
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_executor_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='llm-hedge')
+    return _hedge_executor
+
+
+def _hedge_target(provider, api_key, model):
+    """对冲请求发往哪里：Key池有多个Key时发往同一提供商（会选到别的Key），否则发往故障转移链的下一个提供商"""
+    if len(parse_keys(api_key)) > 1:
+        return provider, api_key, model
+    targets = failover_targets(provider)
+    return targets[0] if targets else (provider, api_key, model)
+
+
+def _post_json(url, payload, headers=None, timeout=120):
+    """
+    POST JSON 并解析响应
+
+    Returns:
+        tuple: (响应JSON, 首字节耗时秒数)
+    """
+    started = time.monotonic()
+    if current_token() is None:
+        # stream=True 时 post 在收到响应头后返回，此时的耗时即首字节时间
+        response = requests.post(url, headers=headers, json=payload, timeout=timeout, stream=True)
+        ttfb = time.monotonic() - started
+        response.raise_for_status()
+        return response.json(), ttfb
+    # 绑定了取消令牌：连接登记到令牌，任务终止时立即中断
+    with cancellable_session() as session:
+        response = session.post(url, headers=headers, json=payload, timeout=timeout, stream=True)
+        ttfb = time.monotonic() - started
+        response.raise_for_status()
+        return response.json(), ttfb
+
+
+def _chat_completion(url, api_key, model, prompt):
+    """OpenAI兼容的 chat/completions 接口，返回 (文本, usage, 首字节耗时)"""
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    data = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.7
+    }
+    result, ttfb = _post_json(url, data, headers)
+    return result["choices"][0]["message"]["content"], result.get("usage"), ttfb
+
+
 class AIService:
-    """统一的AI服务调用类"""
+    """统一的AI服务调用类
+
+    各 call_xxx 返回 (文本, usage, 首字节耗时)，usage 统一为 prompt_tokens/completion_tokens/total_tokens。
+    """
     
     @staticmethod
-    def call_openai(api_key: str, model: str, prompt: str) -> str:
+    def call_openai(api_key: str, model: str, prompt: str):
         """调用OpenAI API"""
-        url = "https://api.openai.com/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.7
-        }
-        response = requests.post(url, headers=headers, json=data, timeout=120)
-        response.raise_for_status()
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
+        base_url = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1").rstrip("/")
+        return _chat_completion(f"{base_url}/chat/completions", api_key, model, prompt)
     
     @staticmethod
-    def call_deepseek(api_key: str, model: str, prompt: str) -> str:
+    def call_deepseek(api_key: str, model: str, prompt: str):
         """调用DeepSeek API"""
-        url = "https://api.deepseek.com/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.7
-        }
-        response = requests.post(url, headers=headers, json=data, timeout=120)
-        response.raise_for_status()
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
+        base_url = os.getenv("DEEPSEEK_API_BASE", "https://api.deepseek.com/v1").rstrip("/")
+        return _chat_completion(f"{base_url}/chat/completions", api_key, model, prompt)
     
     @staticmethod
-    def call_qwen(api_key: str, model: str, prompt: str) -> str:
+    def call_qwen(api_key: str, model: str, prompt: str):
         """调用通义千问API（兼容OpenAI模式）"""
         base_url = os.getenv("DASHSCOPE_API_BASE", "https://dashscope.aliyuncs.com/compatible-mode/v1").rstrip("/")
-        url = f"{base_url}/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.7
-        }
-        response = requests.post(url, headers=headers, json=data, timeout=120)
-        response.raise_for_status()
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
+        return _chat_completion(f"{base_url}/chat/completions", api_key, model, prompt)
     
     @staticmethod
-    def call_gemini(api_key: str, model: str, prompt: str) -> str:
+    def call_gemini(api_key: str, model: str, prompt: str):
         """调用Gemini API"""
         url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}"
         data = {
@@ -75,51 +214,155 @@ class AIService:
                 "parts": [{"text": prompt}]
             }]
         }
-        response = requests.post(url, json=data, timeout=120)
-        response.raise_for_status()
-        result = response.json()
-        return result["candidates"][0]["content"]["parts"][0]["text"]
+        result, ttfb = _post_json(url, data)
+        metadata = result.get("usageMetadata") or {}
+        usage = {
+            "prompt_tokens": metadata.get("promptTokenCount"),
+            "completion_tokens": metadata.get("candidatesTokenCount"),
+            "total_tokens": metadata.get("totalTokenCount"),
+        } if metadata else None
+        return result["candidates"][0]["content"]["parts"][0]["text"], usage, ttfb
     
     @staticmethod
-    def call_siliconflow(api_key: str, model: str, prompt: str) -> str:
+    def call_siliconflow(api_key: str, model: str, prompt: str):
         """调用硅基流动API"""
         base_url = os.getenv("SILICONFLOW_API_BASE", "https://api.siliconflow.cn").rstrip("/")
-        url = f"{base_url}/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.7
-        }
-        response = requests.post(url, headers=headers, json=data, timeout=120)
-        response.raise_for_status()
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
+        return _chat_completion(f"{base_url}/v1/chat/completions", api_key, model, prompt)
     
     @staticmethod
-    def call_grok(api_key: str, model: str, prompt: str) -> str:
+    def call_grok(api_key: str, model: str, prompt: str):
         """调用Grok API (x.ai)"""
-        url = "https://api.x.ai/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.7
-        }
-        response = requests.post(url, headers=headers, json=data, timeout=120)
-        response.raise_for_status()
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
+        base_url = os.getenv("GROK_API_BASE", "https://api.x.ai/v1").rstrip("/")
+        return _chat_completion(f"{base_url}/chat/completions", api_key, model, prompt)
     
     @classmethod
-    def call_agent(cls, provider: str, api_key: str, model: str, prompt: str) -> str:
-        """统一调用接口"""
+    def call_agent_detailed(cls, provider: str, api_key: str, model: str, prompt: str,
+                            queued_at: float = None, job_id: str = None, agent: str = None,
+                            failover: bool = True) -> LLMCallResult:
+        """
+        调用大模型并返回 LLMCallResult（耗时、token用量、重试次数、费用），同时计入全局统计
+
+        提供商熔断或调用失败时，按 ai_failover_chain 改用其他提供商（见 provider_failover），
+        结果的 provider/model 为实际提供服务的提供商，failover_from 为原本请求的提供商。
+
+        Args:
+            queued_at: 提交调用时的 time.monotonic()，用于计算排队等待
+            job_id / agent: 计入对应辩论任务/Agent 的统计；任务被终止时进行中的请求立即中断（见 cancellation）
+            failover: 为False时只调用指定的提供商（如测试连接）
+
+        失败时抛出原异常（任务终止时为 CallCanceled），异常上的 llm_result 属性为本次调用的统计。
+        """
+        if queued_at is None:
+            queued_at = time.monotonic()
+        token = get_cancel_registry().get(job_id) if job_id else None
+        targets = [(provider, api_key, model)]
+        if failover:
+            targets += failover_targets(provider)
+        breakers = get_circuit_breakers()
+
+        last_error = None
+        for index, (target, target_key, target_model) in enumerate(targets):
+            if not breakers.allow(target):
+                # 熔断中：有后备时跳过，最后一个也熔断时仍然尝试，避免无提供商可用
+                if index < len(targets) - 1 or last_error is not None:
+                    print(f"[熔断] {target} 熔断中，跳过")
+                    continue
+            try:
+                result = cls._call_hedged(target, target_key, target_model, prompt, queued_at, job_id, agent, token)
+            except CallCanceled:
+                breakers.release(target)
+                raise
+            except Exception as e:
+                if is_provider_fault(e):
+                    breakers.record_failure(target, e)
+                else:
+                    breakers.release(target)
+                last_error = e
+                if index < len(targets) - 1:
+                    print(f"[故障转移] {target}/{target_model} 调用失败: {e}")
+                continue
+            breakers.record_success(result.provider, result.total)
+            if result.provider != target:
+                breakers.release(target)  # 对冲请求发往其他提供商并先完成
+            if (result.provider, result.model) != (provider, model):
+                result.failover_from = f"{provider}/{model}"
+                print(f"[故障转移] {provider}/{model} -> {result.provider}/{result.model}")
+            return result
+        raise last_error
+
+    @classmethod
+    def _call_hedged(cls, provider, api_key, model, prompt, queued_at, job_id, agent, token=None):
+        """
+        调用单个提供商；开启对冲且超过等待时间仍未返回时再发一个对冲请求，取先成功的结果
+
+        原请求在当前线程执行，等待时间从原请求开始时计时，到期后对冲请求提交到线程池。
+        两个请求各用一个子令牌，先成功的返回后中断落后的请求。
+        """
+        policy = get_hedge_policy()
+        delay = policy.deadline(provider, model)
+        if delay is None:
+            return cls._call_provider(provider, api_key, model, prompt, queued_at, job_id, agent, token)
+
+        primary_token = token.child() if token is not None else CancelToken(job_id)
+        lock = threading.Lock()
+        state = {'finished': False, 'hedge': None, 'hedge_token': None}
+
+        def on_hedge_done(future):
+            # 对冲请求先成功：中断原请求，原请求以 CallCanceled 结束后取对冲结果
+            if not future.cancelled() and future.exception() is None:
+                primary_token.cancel()
+
+        def launch_hedge():
+            with lock:
+                if state['finished'] or not policy.try_spend():
+                    return
+                hedge_provider, hedge_key, hedge_model = _hedge_target(provider, api_key, model)
+                print(f"[对冲] {provider}/{model} 超过 {delay:.1f}s 未返回，对冲到 {hedge_provider}/{hedge_model}")
+                hedge_token = token.child() if token is not None else CancelToken(job_id)
+                state['hedge_token'] = hedge_token
+                state['hedge'] = _get_hedge_executor().submit(
+                    cls._call_provider, hedge_provider, hedge_key, hedge_model, prompt,
+                    time.monotonic(), job_id, agent, hedge_token)
+            state['hedge'].add_done_callback(on_hedge_done)
+
+        timer = get_deadline_timer()
+        handle = timer.schedule(delay, launch_hedge)
+        try:
+            result = cls._call_provider(provider, api_key, model, prompt, queued_at, job_id, agent, primary_token)
+        except Exception as e:
+            with lock:
+                state['finished'] = True
+                hedge = state['hedge']
+            if hedge is None or (token is not None and token.canceled):
+                raise
+            try:
+                result = hedge.result()
+            except Exception:
+                # 都失败时抛出原请求的异常（原请求被取消说明对冲成功，不会走到这里）
+                raise e
+            result.hedge = 'hedge'
+            policy.record_win(True)
+            return result
+        finally:
+            timer.cancel(handle)
+
+        with lock:
+            state['finished'] = True
+            hedge = state['hedge']
+        if hedge is not None:
+            hedge.cancel()
+            state['hedge_token'].cancel()
+            result.hedge = 'primary'
+            policy.record_win(False)
+        return result
+
+    @classmethod
+    def _call_provider(cls, provider, api_key, model, prompt, queued_at, job_id, agent, token=None):
+        """
+        调用单个提供商（连接类错误重试、Key池换Key），返回 LLMCallResult，失败时抛出原异常
+
+        token 被取消时中断进行中的请求，不再重试，抛出 CallCanceled。
+        """
         provider_map = {
             "openai": cls.call_openai,
             "deepseek": cls.call_deepseek,
@@ -132,26 +375,80 @@ class AIService:
         if provider not in provider_map:
             raise ValueError(f"不支持的AI提供商: {provider}")
 
+        result = LLMCallResult(provider, model)
+        started = time.monotonic()
+        result.started_at = datetime.now().isoformat()
+        result.queue_wait = max(started - queued_at, 0.0)
+
+        pool = get_key_pool()
+        tried_keys = set()
         last_error = None
         for attempt in range(3):
+            if token is not None and token.canceled:
+                break
+            result.retries = attempt
+            lease = pool.acquire(provider, api_key, exclude=tried_keys)
             try:
-                return provider_map[provider](api_key, model, prompt)
+                with bind_token(token):
+                    text, usage, ttfb = provider_map[provider](lease.key if lease else api_key, model, prompt)
+                result.text = text
+                result.ttfb = ttfb
+                result.set_usage(usage)
+                if lease:
+                    lease.release(tokens=result.total_tokens)
+                last_error = None
+                break
+            except requests.exceptions.HTTPError as e:
+                last_error = e
+                status = e.response.status_code if e.response is not None else None
+                if lease:
+                    lease.release(status=status, retry_after=_retry_after(e.response))
+                    if status in KEY_ERROR_STATUSES:
+                        tried_keys.add(lease.key)
+                        if pool.has_alternative(provider, api_key, tried_keys):
+                            continue
+                break
             except (requests.exceptions.ReadTimeout, requests.exceptions.ConnectionError) as e:
                 last_error = e
-                # 简单退避，避免短时间频繁超时
-                time.sleep(1 + attempt * 2)
+                # 简单退避，避免短时间频繁超时（最后一次失败后不再等待）
+                if attempt < 2:
+                    if token is not None:
+                        token.wait(1 + attempt * 2)
+                    else:
+                        time.sleep(1 + attempt * 2)
             except Exception as e:
                 last_error = e
                 break
+            finally:
+                if lease:
+                    lease.release()
 
-        raise last_error
+        result.total = time.monotonic() - started
+        if result.text is None and token is not None and token.canceled:
+            # 令牌取消导致的连接中断不算提供商错误
+            last_error = CallCanceled(f"调用已取消（任务 {token.job_id}）")
+            result.canceled = True
+        if last_error is not None:
+            result.error = f"{type(last_error).__name__}: {last_error}"
+        get_llm_telemetry().record(result, job_id=job_id, agent=agent)
+        if last_error is not None:
+            last_error.llm_result = result
+            raise last_error
+        return result
+
+    @classmethod
+    def call_agent(cls, provider: str, api_key: str, model: str, prompt: str, failover: bool = True) -> str:
+        """统一调用接口（只返回文本，统计见 call_agent_detailed）"""
+        return cls.call_agent_detailed(provider, api_key, model, prompt, failover=failover).text
     
     @staticmethod
     def get_models(provider: str, api_key: str) -> list:
         """获取指定提供商的可用模型列表"""
+        api_key = primary_key(api_key)  # 配置了多个Key时用第一个
         if provider == "openai":
             # OpenAI需要调用models API
-            url = "https://api.openai.com/v1/models"
+            base_url = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1").rstrip("/")
+            url = f"{base_url}/models"
             headers = {
                 "Authorization": f"Bearer {api_key}",
             }
@@ -168,7 +465,8 @@ class AIService:
                 return ["gpt-4o", "gpt-4-turbo", "gpt-4", "gpt-3.5-turbo"]
         elif provider == "deepseek":
             # DeepSeek兼容OpenAI模型列表接口
-            url = "https://api.deepseek.com/v1/models"
+            base_url = os.getenv("DEEPSEEK_API_BASE", "https://api.deepseek.com/v1").rstrip("/")
+            url = f"{base_url}/models"
             headers = {"Authorization": f"Bearer {api_key}"}
             try:
                 response = requests.get(url, headers=headers, timeout=30)
@@ -231,7 +529,8 @@ class AIService:
             ]
         elif provider == "grok":
             # Grok (x.ai) 兼容 OpenAI 模型列表接口
-            url = "https://api.x.ai/v1/models"
+            base_url = os.getenv("GROK_API_BASE", "https://api.x.ai/v1").rstrip("/")
+            url = f"{base_url}/models"
             headers = {"Authorization": f"Bearer {api_key}"}
             try:
                 response = requests.get(url, headers=headers, timeout=30)
@@ -262,7 +561,7 @@ class AIService:
             
             # 使用简单的测试prompt
             test_prompt = "Hello, please respond with 'OK' to confirm the connection."
-            result = AIService.call_agent(provider, api_key, model, test_prompt)
+            result = AIService.call_agent(provider, api_key, model, test_prompt, failover=False)
             
             return {
                 "success": True,
@@ -2,28 +2,99 @@
 # -*- coding: utf-8 -*-
 """API路由模块"""
 
-from flask import jsonify, request
+from flask import jsonify, request, Response
 import threading
+import time
 import uuid
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 import re
-from data_fetchers import get_realtime_data, get_timeline_data, get_minute_kline, get_daily_kline, get_money_flow, get_money_flow_history, get_money_flow_realtime_kline, get_fundamental_data, get_industry_comparison, get_news_from_stock, get_guba_posts
-from technical_indicators import get_comprehensive_data, get_comprehensive_data_with_indicators
-from data_formatters import format_for_ai, to_json
+from data_fetchers import get_realtime_data, get_timeline_data, get_minute_kline, get_daily_kline, get_money_flow, get_fundamental_data, get_industry_comparison, get_news_from_stock, get_guba_posts, get_sentiment_data
+from technical_indicators import get_comprehensive_data, get_comprehensive_data_with_indicators, get_indicator_snapshot
+from data_formatters import format_for_ai, to_json, build_raw_data, render_sections, assemble_sections, parse_sections, get_data_summary
+from json_serializer import iter_envelope_json, frame_to_columnar, frame_to_binary, dumps, DATE_FORMAT, DATETIME_FORMAT, COLUMNAR_DECIMALS, CHART_TIMEZONE
 import requests
-from datetime import date, timedelta
 from models import get_db, SessionLocal
 from db import (
     get_watchlist, add_to_watchlist, remove_from_watchlist, update_watchlist_order,
     get_config, set_config, get_all_configs,
     get_agents, get_agent, create_agent, update_agent, delete_agent,
     get_cached_analysis, save_analysis_cache,
-    create_debate_job, update_debate_job, get_debate_job, list_debate_jobs, cancel_debate_job, delete_debate_job
+    create_debate_job, update_debate_job, get_debate_job, list_debate_jobs, cancel_debate_job, delete_debate_job,
+    claim_debate_job, touch_debate_jobs
 )
-from ai_service import AIService
+from ai_service import AIService, failure_telemetry
+from key_pool import get_key_pool
+from provider_failover import get_circuit_breakers
+from hedging import get_hedge_policy
+from cancellation import CallCanceled, get_cancel_registry
+from llm_telemetry import get_llm_telemetry, summarize_calls
+from limit_screener import parse_screen_params, screen_limit_up
+from money_flow_store import get_money_flow_store, SUMMARY_WINDOWS
+from intraday_flow import get_intraday_flow_store, SUPPORTED_KLT as INTRADAY_FLOW_KLT
+from sentiment_crawler import get_sentiment_crawler, index_sentiment, query_sentiment, build_sentiment_context
+from debate_runner import AgentChain, run_analysis_chains
+from context_budget import HistoryItem, StepSummaries, fit_sections, prompt_budget, step_items
+from singleflight import get_singleflight
+from rate_limiter import get_rate_limiter
+
+JOB_HEARTBEAT_SECONDS = 30  # 运行中任务刷新 updated_at 的间隔
+JOB_STALE_SECONDS = 120  # 超过该时间没有刷新的 queued/running 任务视为原进程已退出，可以恢复
+
+_heartbeat_thread = None
+_heartbeat_lock = threading.Lock()
+
+
+def _job_heartbeat_loop():
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        job_ids = get_cancel_registry().job_ids()
+        if not job_ids:
+            continue
+        db = SessionLocal()
+        try:
+            touch_debate_jobs(db, job_ids)
+        except Exception as e:
+            print(f"[API] 刷新任务心跳失败: {e}")
+        finally:
+            db.close()
+
+
+def _ensure_job_heartbeat():
+    """启动任务心跳线程（每个进程一个），运行中的任务由此定期刷新 updated_at"""
+    global _heartbeat_thread
+    if _heartbeat_thread is None:
+        with _heartbeat_lock:
+            if _heartbeat_thread is None:
+                _heartbeat_thread = threading.Thread(target=_job_heartbeat_loop, name='debate-heartbeat', daemon=True)
+                _heartbeat_thread.start()
+
+
+def chart_data_response(envelope, df, datetime_format=DATETIME_FORMAT, tz=CHART_TIMEZONE):
+    """
+    图表数据响应，按 ?format= 选择输出格式：
+    - records（默认）: {..., data: [{字段: 值}, ...]}，流式输出
+    - columnar: {..., format: 'columnar', fields, time_fields, data: {字段: [...]}}，时间为epoch秒，浮点按 ?decimals= 取整
+    - binary: application/octet-stream，见 json_serializer.frame_to_binary，envelope放在 X-Chart-Meta 头中
+    """
+    fmt = request.args.get('format', 'records')
+    if fmt == 'columnar':
+        try:
+            decimals = min(max(int(request.args.get('decimals', COLUMNAR_DECIMALS)), 0), 6)
+        except ValueError:
+            decimals = COLUMNAR_DECIMALS
+        columnar = frame_to_columnar(df, decimals=decimals, tz=tz)
+        payload = dict(envelope, format='columnar', fields=columnar['fields'],
+                       time_fields=columnar['time_fields'], data=columnar['columns'])
+        return Response(dumps(payload), content_type='application/json; charset=utf-8')
+    if fmt == 'binary':
+        response = Response(frame_to_binary(df, tz=tz), content_type='application/octet-stream')
+        response.headers['X-Chart-Meta'] = json.dumps(envelope)
+        return response
+    return Response(iter_envelope_json(envelope, 'data', df, datetime_format),
+                    content_type='application/json; charset=utf-8')
+
 
 def register_routes(app):
     """注册所有API路由"""
@@ -38,12 +109,13 @@ def register_routes(app):
                 '/api/sina/comprehensive/<code>': '获取股票综合数据（实时、分钟K线、分时、日K线）',
                 '/api/sina/comprehensive_with_indicators/<code>': '获取股票综合数据（包含技术指标：MA/EMA/MACD/RSI/KDJ/BOLL/OBV）',
                 '/api/sina/realtime/<code>': '获取实时行情数据',
-                '/api/sina/timeline/<code>': '获取分时数据（每分钟）',
-                '/api/sina/minute/<code>': '获取分钟K线数据，参数: ?scale=5&datalen=240',
-                '/api/sina/daily/<code>': '获取日K线数据，参数: ?count=240',
+                '/api/sina/timeline/<code>': '获取分时数据（每分钟），参数: ?format=records|columnar|binary',
+                '/api/sina/minute/<code>': '获取分钟K线数据，参数: ?scale=5&datalen=240&format=records|columnar|binary&decimals=3',
+                '/api/sina/daily/<code>': '获取日K线数据，参数: ?count=240&format=records|columnar|binary&decimals=3',
                 '/api/sina/money_flow/<code>': '获取今日资金流向数据',
-                '/api/sina/money_flow/history/<code>': '获取历史资金流向数据（日线），参数: ?days=60',
-                '/api/sina/money_flow/realtime/<code>': '获取实时资金流向分钟线数据，参数: ?klt=1&lmt=0',
+                '/api/sina/money_flow/history/<code>': '获取历史资金流向数据（日线，本地存储增量更新），参数: ?days=60（0表示全部）',
+                '/api/sina/money_flow/summary/<code>': '获取资金流向趋势摘要（N日累计净流入、连续流入/流出天数），参数: ?windows=3,5,10,20,60',
+                '/api/sina/money_flow/realtime/<code>': '获取实时资金流向分钟线数据（当日累计，klt=1/5/15/30由1分钟数据重采样），参数: ?klt=1&lmt=0',
                 '/api/sina/fundamental/<code>': '获取基本面数据',
                 '/api/sina/industry_comparison/<code>': '获取行业对比数据',
                 '/api/sina/for_ai/<code>': '获取格式化的股票数据，用于AI分析',
@@ -51,7 +123,10 @@ def register_routes(app):
                 '/api/sentiment/news/<code>': '获取股票相关新闻，参数: ?days=7',
                 '/api/sentiment/posts/<code>': '获取股吧帖子（最新+热门），参数: ?latest=10&hot=10',
                 '/api/sentiment/all/<code>': '获取完整舆情数据（新闻+帖子），参数: ?days=7&latest=10&hot=10',
+                '/api/sentiment/search': '检索本地舆情索引，参数: ?q=关键词&code=000001&days=7&kind=news|post&sort=relevance|time|hot&limit=20',
+                '/api/sentiment/crawler': '舆情后台爬取状态（GET），POST 立即爬取（可选 {"codes": [...]}，默认自选股）',
                 '/api/strategy/strong_stocks': '获取强势股（前两个交易日10:30前涨停，当前未涨停）',
+                '/api/strategy/limit_up_screen': '涨停池多日筛选，参数: ?lookback=2&min_hits=2&limit_time=11:30&max_break=&min_consecutive=0&industry=',
                 '/api/watchlist': '自选股管理，GET获取列表，POST添加',
                 '/api/watchlist/<code>': '自选股管理，DELETE删除',
                 '/api/config': '配置管理，GET获取所有配置，POST设置配置',
@@ -65,6 +140,9 @@ def register_routes(app):
                 '/api/ai/debate/jobs': '获取辩论任务列表，参数: ?status=active|completed|failed|canceled',
                 '/api/ai/debate/stop/<job_id>': '终止辩论任务，POST请求',
                 '/api/ai/debate/delete/<job_id>': '删除辩论任务，DELETE请求',
+                '/api/ai/key-pool': 'API Key池状态（各Key的进行中请求、RPM/TPM、限流/鉴权失败暂停）',
+                '/api/metrics/upstream': '上游数据源调用统计（请求合并、限流）',
+                '/api/metrics/llm': '大模型调用统计（耗时分位数、token、重试、费用）、提供商熔断和请求对冲状态',
                 '/api/health': '健康检查',
             }
         })
@@ -80,6 +158,27 @@ def register_routes(app):
             'service': '新浪股票API服务'
         })
 
+    @app.route('/api/metrics/upstream')
+    def get_upstream_metrics():
+        """上游数据源调用统计（请求合并次数、各host限流状态）"""
+        response = jsonify({'success': True, 'data': {
+            'singleflight': get_singleflight().stats(),
+            'rate_limit': get_rate_limiter().stats(),
+            'intraday_flow': get_intraday_flow_store().stats(),
+        }})
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        return response
+
+    @app.route('/api/metrics/llm')
+    def get_llm_metrics():
+        """大模型调用统计（按 提供商/模型：调用数、错误、重试、token、费用、耗时分位数）、熔断和对冲状态"""
+        data = get_llm_telemetry().stats()
+        data['circuits'] = get_circuit_breakers().status()
+        data['hedging'] = get_hedge_policy().stats()
+        response = jsonify({'success': True, 'data': data})
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        return response
+
     @app.route('/api/sina/comprehensive/<code>')
     def get_sina_comprehensive(code):
         """获取股票的综合数据"""
@@ -158,20 +257,8 @@ def register_routes(app):
             print(f"[API] 获取分时数据，股票代码: {code_str}")
             df = get_timeline_data(code_str)
             
-            if df is None or len(df) == 0:
-                return jsonify({'code': code_str, 'data': [], 'count': 0})
-            
-            records = df.to_dict('records')
-            for record in records:
-                for key, value in record.items():
-                    if pd.isna(value):
-                        record[key] = None
-                    elif isinstance(value, pd.Timestamp):
-                        record[key] = value.strftime('%Y-%m-%d %H:%M:%S')
-            
-            response = jsonify({'code': code_str, 'data': records, 'count': len(records)})
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            envelope = {'code': code_str, 'count': 0 if df is None else len(df)}
+            return chart_data_response(envelope, df, DATETIME_FORMAT)
         except Exception as e:
             error_msg = str(e)
             print(f"[API] 获取分时数据失败: {error_msg}")
@@ -194,20 +281,8 @@ def register_routes(app):
             print(f"[API] 获取分钟K线，股票代码: {code_str}, scale: {scale}, datalen: {datalen}")
             df = get_minute_kline(code_str, scale=scale, datalen=datalen)
             
-            if df is None or len(df) == 0:
-                return jsonify({'code': code_str, 'scale': scale, 'data': [], 'count': 0})
-            
-            records = df.to_dict('records')
-            for record in records:
-                for key, value in record.items():
-                    if pd.isna(value):
-                        record[key] = None
-                    elif isinstance(value, pd.Timestamp):
-                        record[key] = value.strftime('%Y-%m-%d %H:%M:%S')
-            
-            response = jsonify({'code': code_str, 'scale': scale, 'data': records, 'count': len(records)})
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            envelope = {'code': code_str, 'scale': scale, 'count': 0 if df is None else len(df)}
+            return chart_data_response(envelope, df, DATETIME_FORMAT)
         except Exception as e:
             error_msg = str(e)
             print(f"[API] 获取分钟K线失败: {error_msg}")
@@ -226,20 +301,9 @@ def register_routes(app):
             print(f"[API] 获取日K线，股票代码: {code_str}, count: {count}")
             df = get_daily_kline(code_str, count=count)
             
-            if df is None or len(df) == 0:
-                return jsonify({'code': code_str, 'data': [], 'count': 0})
-            
-            records = df.to_dict('records')
-            for record in records:
-                for key, value in record.items():
-                    if pd.isna(value):
-                        record[key] = None
-                    elif isinstance(value, pd.Timestamp):
-                        record[key] = value.strftime('%Y-%m-%d')
-            
-            response = jsonify({'code': code_str, 'data': records, 'count': len(records)})
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
+            # 日线按UTC零点编码epoch，前端转日期时不受时区影响
+            envelope = {'code': code_str, 'count': 0 if df is None else len(df)}
+            return chart_data_response(envelope, df, DATE_FORMAT, tz='UTC')
         except Exception as e:
             error_msg = str(e)
             print(f"[API] 获取日K线失败: {error_msg}")
@@ -275,7 +339,7 @@ def register_routes(app):
             days = int(request.args.get('days', 60))  # 默认60天
             
             print(f"[API] 获取历史资金流向，股票代码: {code_str}, days: {days}")
-            data = get_money_flow_history(code_str, days=days)
+            data = get_money_flow_store().get_history(code_str, days=days)
             
             response = jsonify({
                 'code': code_str,
@@ -290,6 +354,32 @@ def register_routes(app):
             print(f"[API] 获取历史资金流向失败: {error_msg}")
             return jsonify({'error': '获取数据失败', 'message': error_msg}), 500
 
+    @app.route('/api/sina/money_flow/summary/<code>')
+    def get_sina_money_flow_summary(code):
+        """获取资金流向趋势摘要"""
+        try:
+            code_str = str(code).strip()
+            if not code_str.isdigit() or len(code_str) != 6:
+                return jsonify({'error': '股票代码格式错误', 'message': '股票代码应为6位数字，如 000001'}), 400
+            
+            windows_param = request.args.get('windows')
+            windows = SUMMARY_WINDOWS
+            if windows_param:
+                windows = tuple(sorted({int(w) for w in windows_param.split(',') if w.strip()}))
+                if not windows or min(windows) <= 0:
+                    return jsonify({'error': '参数错误', 'message': 'windows应为正整数列表，如 3,5,10'}), 400
+            
+            print(f"[API] 获取资金流向趋势摘要，股票代码: {code_str}, windows: {windows}")
+            data = get_money_flow_store().get_summary(code_str, windows=windows)
+            
+            response = jsonify(data)
+            response.headers['Content-Type'] = 'application/json; charset=utf-8'
+            return response
+        except Exception as e:
+            error_msg = str(e)
+            print(f"[API] 获取资金流向趋势摘要失败: {error_msg}")
+            return jsonify({'error': '获取数据失败', 'message': error_msg}), 500
+
     @app.route('/api/sina/money_flow/realtime/<code>')
     def get_sina_money_flow_realtime(code):
         """获取实时资金流向分钟线数据"""
@@ -302,13 +392,16 @@ def register_routes(app):
             lmt = int(request.args.get('lmt', 0))  # 0=获取所有数据
             
             print(f"[API] 获取实时资金流向分钟线，股票代码: {code_str}, klt: {klt}, lmt: {lmt}")
-            data = get_money_flow_realtime_kline(code_str, klt=klt, lmt=lmt)
+            store = get_intraday_flow_store()
+            data = store.get_kline(code_str, klt=klt, lmt=lmt)
             
             response = jsonify({
                 'code': code_str,
                 'klt': klt,
                 'count': len(data),
-                'data': data
+                'data': data,
+                # 最新累计及5/15/30分钟滚动净流入
+                'summary': store.get_summary(code_str) if klt in INTRADAY_FLOW_KLT else None
             })
             response.headers['Content-Type'] = 'application/json; charset=utf-8'
             return response
@@ -365,20 +458,10 @@ def register_routes(app):
             
             print(f"[API] 获取AI分析数据，股票代码: {code_str}")
             data = get_comprehensive_data(code_str)
-            formatted = format_for_ai(data)
-            
-            raw_data = {
-                'realtime': data['realtime'],
-                'timeline_count': len(data['timeline']) if data['timeline'] is not None else 0,
-                'minute_5_count': len(data['minute_5']) if data['minute_5'] is not None else 0,
-                'minute_15_count': len(data['minute_15']) if data['minute_15'] is not None else 0,
-                'minute_30_count': len(data['minute_30']) if data['minute_30'] is not None else 0,
-                'daily_count': len(data['daily']) if data['daily'] is not None else 0,
-                'sector_info': data.get('sector_info', []),
-                'money_flow': data.get('money_flow', {}),
-                'fundamental': data.get('fundamental', {}),
-                'industry_comparison': data.get('industry_comparison', {}),
-            }
+            summary = get_data_summary(data)  # 文本和raw_data共用一次统计
+            formatted = format_for_ai(data, summary=summary)
+            
+            raw_data = build_raw_data(data, summary)
             
             response = jsonify({'code': code_str, 'formatted_text': formatted, 'raw_data': raw_data})
             response.headers['Content-Type'] = 'application/json; charset=utf-8'
@@ -398,55 +481,14 @@ def register_routes(app):
             
             print(f"[API] 获取AI分析数据（含技术指标），股票代码: {code_str}")
             data = get_comprehensive_data_with_indicators(code_str)
-            formatted = format_for_ai(data)
-            
-            raw_data = {
-                'realtime': data['realtime'],
-                'timeline_count': len(data['timeline']) if data['timeline'] is not None else 0,
-                'minute_5_count': len(data['minute_5']) if data['minute_5'] is not None else 0,
-                'minute_15_count': len(data['minute_15']) if data['minute_15'] is not None else 0,
-                'minute_30_count': len(data['minute_30']) if data['minute_30'] is not None else 0,
-                'daily_count': len(data['daily']) if data['daily'] is not None else 0,
-                'sector_info': data.get('sector_info', []),
-                'money_flow': data.get('money_flow', {}),
-                'fundamental': data.get('fundamental', {}),
-                'industry_comparison': data.get('industry_comparison', {}),
-            }
+            summary = get_data_summary(data)  # 文本和raw_data共用一次统计
+            formatted = format_for_ai(data, summary=summary)
+            
+            raw_data = build_raw_data(data, summary)
             
             # 添加技术指标摘要
             if data['daily'] is not None and len(data['daily']) > 0:
-                latest = data['daily'].iloc[-1]
-                indicators_summary = {}
-                
-                ma_cols = [col for col in data['daily'].columns if col.startswith('MA') and not col.startswith('MACD')]
-                if ma_cols:
-                    indicators_summary['MA'] = {col: float(latest[col]) for col in ma_cols if pd.notna(latest[col])}
-                
-                if 'MACD_DIF' in data['daily'].columns and pd.notna(latest['MACD_DIF']):
-                    indicators_summary['MACD'] = {
-                        'DIF': float(latest['MACD_DIF']),
-                        'DEA': float(latest.get('MACD_DEA', 0)) if pd.notna(latest.get('MACD_DEA')) else 0,
-                        'MACD': float(latest.get('MACD', 0)) if pd.notna(latest.get('MACD')) else 0
-                    }
-                
-                if 'RSI14' in data['daily'].columns and pd.notna(latest['RSI14']):
-                    indicators_summary['RSI'] = float(latest['RSI14'])
-                
-                if 'KDJ_K' in data['daily'].columns and pd.notna(latest['KDJ_K']):
-                    indicators_summary['KDJ'] = {
-                        'K': float(latest['KDJ_K']),
-                        'D': float(latest.get('KDJ_D', 0)) if pd.notna(latest.get('KDJ_D')) else 0,
-                        'J': float(latest.get('KDJ_J', 0)) if pd.notna(latest.get('KDJ_J')) else 0
-                    }
-                
-                if 'BOLL_UPPER' in data['daily'].columns and pd.notna(latest['BOLL_UPPER']):
-                    indicators_summary['BOLL'] = {
-                        'upper': float(latest['BOLL_UPPER']),
-                        'mid': float(latest.get('BOLL_MID', 0)) if pd.notna(latest.get('BOLL_MID')) else 0,
-                        'lower': float(latest.get('BOLL_LOWER', 0)) if pd.notna(latest.get('BOLL_LOWER')) else 0
-                    }
-                
-                raw_data['indicators'] = indicators_summary
+                raw_data['indicators'] = get_indicator_snapshot(code_str, data['daily']).to_dict()
             
             response = jsonify({'code': code_str, 'formatted_text': formatted, 'raw_data': raw_data})
             response.headers['Content-Type'] = 'application/json; charset=utf-8'
@@ -519,11 +561,9 @@ def register_routes(app):
             latest_count = int(request.args.get('latest', 10))
             hot_count = int(request.args.get('hot', 10))
             
-            # 获取新闻
-            news_list = get_news_from_stock(code_str, days=days)
-            
-            # 获取帖子
-            posts_list = get_guba_posts(code_str, latest_count=latest_count, hot_count=hot_count)
+            # 并发获取新闻、最新帖子、热门帖子（帖子按post_id去重）
+            news_list, posts_list = get_sentiment_data(code_str, days=days, latest_count=latest_count, hot_count=hot_count)
+            index_sentiment(code_str, news_list, posts_list)
             
             # 按类型分组
             latest_posts = [p for p in posts_list if p.get('sort_type') == 'latest']
@@ -552,6 +592,51 @@ def register_routes(app):
             print(f"[API] 获取舆情数据失败: {error_msg}")
             return jsonify({'error': '获取舆情数据失败', 'message': error_msg}), 500
     
+    @app.route('/api/sentiment/search')
+    def search_sentiment_api():
+        """检索本地舆情索引（后台爬取 + 实时接口顺带入库的新闻/帖子）"""
+        try:
+            query = request.args.get('q', '').strip()
+            code_str = request.args.get('code', '').strip() or None
+            kind = request.args.get('kind') or None
+            days = int(request.args.get('days', 0)) or None
+            sort = request.args.get('sort') or None
+            limit = min(max(int(request.args.get('limit', 20)), 1), 200)
+            if code_str and (not code_str.isdigit() or len(code_str) != 6):
+                return jsonify({'error': '股票代码格式错误', 'message': '股票代码应为6位数字，如 000001'}), 400
+            if kind not in (None, 'news', 'post'):
+                return jsonify({'error': '参数错误', 'message': 'kind 只能是 news 或 post'}), 400
+            
+            items = query_sentiment(query=query, code=code_str, kind=kind, days=days, sort=sort, limit=limit)
+            
+            response = jsonify({
+                'query': query,
+                'code': code_str,
+                'count': len(items),
+                'items': items
+            })
+            response.headers['Content-Type'] = 'application/json; charset=utf-8'
+            return response
+        except Exception as e:
+            error_msg = str(e)
+            print(f"[API] 检索舆情失败: {error_msg}")
+            return jsonify({'error': '检索舆情失败', 'message': error_msg}), 500
+    
+    @app.route('/api/sentiment/crawler', methods=['GET', 'POST'])
+    def sentiment_crawler_api():
+        """舆情后台爬取状态 / 立即爬取"""
+        crawler = get_sentiment_crawler()
+        if request.method == 'POST':
+            codes = (request.json or {}).get('codes') if request.is_json else None
+            if codes:
+                codes = [str(c).strip() for c in codes if str(c).strip()]
+                if not all(c.isdigit() and len(c) == 6 for c in codes):
+                    return jsonify({'success': False, 'error': '股票代码格式错误'}), 400
+                threading.Thread(target=crawler.crawl, args=(codes,), daemon=True).start()
+            else:
+                crawler.trigger()
+        return jsonify({'success': True, 'data': crawler.status()})
+    
     # ==================== 自选股API ====================
     
     @app.route('/api/watchlist', methods=['GET'])
@@ -658,6 +743,11 @@ def register_routes(app):
     
     # ==================== Agent API ====================
     
+    def _sections_config(value):
+        """请求中的数据区块（列表或逗号分隔）-> 数据库存储的逗号分隔字符串，未配置为None"""
+        sections = parse_sections(value)
+        return ','.join(sections) if sections else None
+
     @app.route('/api/agents', methods=['GET'])
     def get_agents_api():
         """获取所有Agent"""
@@ -675,7 +765,8 @@ def register_routes(app):
                     'enabled': a.enabled,
                     'ai_provider': a.ai_provider,
                     'model': a.model,
-                    'sort_order': a.sort_order
+                    'sort_order': a.sort_order,
+                    'data_sections': list(parse_sections(a.data_sections) or []) or None
                 } for a in agents]
             })
         except Exception as e:
@@ -697,7 +788,8 @@ def register_routes(app):
                 ai_provider=data.get('ai_provider'),
                 model=data.get('model'),
                 enabled=data.get('enabled', True),
-                sort_order=data.get('sort_order', 0)
+                sort_order=data.get('sort_order', 0),
+                data_sections=_sections_config(data.get('data_sections'))
             )
             return jsonify({'success': True, 'data': {'id': agent.id}})
         except Exception as e:
@@ -711,6 +803,8 @@ def register_routes(app):
         db = next(get_db())
         try:
             data = request.json
+            if 'data_sections' in data:
+                data['data_sections'] = _sections_config(data['data_sections'])
             agent = update_agent(db, agent_id, **data)
             return jsonify({'success': agent is not None, 'data': {'id': agent.id} if agent else None})
         except Exception as e:
@@ -783,6 +877,15 @@ def register_routes(app):
             print(f"[API] 测试连接失败: {error_msg}")
             return jsonify({'success': False, 'error': error_msg}), 500
 
+    @app.route('/api/ai/key-pool', methods=['GET'])
+    def get_key_pool_api():
+        """API Key池状态（Key已脱敏），参数: ?provider=deepseek"""
+        status = get_key_pool().status()
+        provider = request.args.get('provider')
+        if provider:
+            status = {provider: status.get(provider, {'strategy': None, 'rpm_limit': None, 'tpm_limit': None, 'keys': []})}
+        return jsonify({'success': True, 'data': status})
+
     def _serialize_job(job):
         agent_info = {}
         try:
@@ -814,16 +917,94 @@ def register_routes(app):
     def _update_debate_job(db: SessionLocal, job_id, **kwargs):
         if 'steps' in kwargs and isinstance(kwargs['steps'], list):
             kwargs['steps'] = json.dumps(kwargs['steps'], ensure_ascii=False)
+        if 'checkpoint' in kwargs and isinstance(kwargs['checkpoint'], dict):
+            kwargs['checkpoint'] = json.dumps(kwargs['checkpoint'], ensure_ascii=False)
         update_debate_job(db, job_id, **kwargs)
 
+    def _start_job(db, job_id):
+        """
+        任务开始运行：读取已完成的步骤和检查点（进程重启后恢复的任务），新任务两者都为空
+
+        Returns:
+            tuple: (steps列表, checkpoint字典)
+        """
+        _ensure_job_heartbeat()
+        job = get_debate_job(db, job_id)
+        steps = json.loads(job.steps) if job and job.steps else []
+        checkpoint = json.loads(job.checkpoint) if job and job.checkpoint else {}
+        if steps or checkpoint:
+            print(f"[API] 从检查点恢复任务 {job_id}：已完成 {len(steps)} 步")
+            _update_debate_job(db, job_id, status='running')
+        else:
+            _update_debate_job(db, job_id, status='running', progress=5)
+        return steps, checkpoint
+
     def _is_job_canceled(db, job_id):
+        token = get_cancel_registry().get(job_id)
+        if token is not None and token.canceled:
+            return True
         job = get_debate_job(db, job_id)
         return True if (job and job.canceled) else False
 
+    def _run_analysis_phase(db, job_id, agents, resolve_agent_config, analysis_rounds, build_prompt, steps):
+        """
+        运行分析阶段（各Agent独立成链，见 debate_runner），结果写入steps并更新进度
+
+        Returns:
+            bool: 完成返回True；任务被取消时返回False（已标记为canceled）
+        """
+        if _is_job_canceled(db, job_id):
+            _update_debate_job(db, job_id, status='canceled')
+            return False
+        # API Key等配置在当前线程解析，工作线程不使用数据库会话；恢复的任务从已完成的轮次之后继续
+        chains = []
+        for agent in agents:
+            config = resolve_agent_config(agent)
+            memory = [step['content'] for step in sorted(steps, key=lambda step: step['round'])
+                      if step['phase'] == 'analysis' and step['agent_id'] == agent.id]
+            chains.append(AgentChain(agent, config, prompt_budget(db, config[0], config[2]), memory))
+        completed = [sum(len(chain.memory) for chain in chains)]
+
+        def on_result(chain, round_idx, content, telemetry):
+            steps.append({
+                'phase': 'analysis',
+                'round': round_idx,
+                'agent_id': chain.id,
+                'agent_name': chain.name,
+                'content': content,
+                'timestamp': datetime.now().isoformat(),
+                'telemetry': telemetry
+            })
+            completed[0] += 1
+            progress = 20 + completed[0] * 10 // len(chains)
+            _update_debate_job(db, job_id, steps=steps, progress=progress)
+
+        finished = run_analysis_chains(chains, analysis_rounds, build_prompt, on_result,
+                                       should_stop=lambda: _is_job_canceled(db, job_id), job_id=job_id)
+        if not finished:
+            _update_debate_job(db, job_id, status='canceled')
+        return finished
+
+    def _transcript_header(step):
+        return f"[{step['phase']} R{step['round']}] {step['agent_name']}:"
+
+    def _debate_context_items(steps, agents, debate_history):
+        """辩论提示词中的两块历史记录：各Agent最新一轮分析、最近的辩论发言"""
+        latest = {}
+        for step in steps:
+            if step['phase'] == 'analysis':
+                latest[step['agent_id']] = step
+        latest_items = step_items([latest[a.id] for a in agents if a.id in latest],
+                                  lambda step: f"{step['agent_name']}:")
+        debate_items = step_items(debate_history[-len(agents) * 2:],
+                                  lambda step: f"Round {step['round']} - {step['agent_name']}:")
+        return latest_items, debate_items
+
     def _run_debate_job(job_id, code_str, agent_ids, analysis_rounds, debate_rounds):
         db = SessionLocal()
+        get_cancel_registry().register(job_id)
         try:
-            _update_debate_job(db, job_id, status='running', progress=5)
+            steps, checkpoint = _start_job(db, job_id)
 
             agents = []
             for agent_id in agent_ids:
@@ -832,18 +1013,30 @@ def register_routes(app):
                     raise ValueError(f'Agent不存在或未启用: {agent_id}')
                 agents.append(agent)
 
-            # 获取股票数据
-            print(f"[API] 获取股票数据（辩论）: {code_str}")
-            stock_data = get_comprehensive_data_with_indicators(code_str)
-            formatted_data = format_for_ai(stock_data)
+            if 'rendered_data' in checkpoint:
+                # 恢复的任务沿用中断前获取的数据，保证前后轮次看到的是同一份数据
+                rendered_data = checkpoint['rendered_data']
+                sentiment_text = checkpoint['sentiment_text']
+            else:
+                # 获取股票数据
+                print(f"[API] 获取股票数据（辩论）: {code_str}")
+                stock_data = get_comprehensive_data_with_indicators(code_str)
+                # 数据区块只渲染一次，各Agent按自己配置的区块组合
+                rendered_data = render_sections(stock_data)
 
-            # 获取舆情数据（新闻+帖子）
-            try:
-                news_list = get_news_from_stock(code_str, days=7)[:5]
-                posts_list = get_guba_posts(code_str, latest_count=5, hot_count=5)
-                sentiment_text = "News:\n" + "\n".join([f"- {n.get('title','')}" for n in news_list]) + "\n\nPosts:\n" + "\n".join([f"- {p.get('title','')}" for p in posts_list[:10]])
-            except Exception as e:
-                sentiment_text = f"Sentiment data unavailable: {str(e)}"
+                # 获取舆情数据（新闻+帖子）
+                try:
+                    news_list, posts_list = get_sentiment_data(code_str, days=7, latest_count=5, hot_count=5)
+                    index_sentiment(code_str, news_list, posts_list)
+                    # 优先使用本地索引（含后台爬取的更多历史帖子），没有时退回实时抓取的标题
+                    sentiment_text = build_sentiment_context(code_str, days=7)
+                    if sentiment_text is None:
+                        news_list = news_list[:5]
+                        sentiment_text = "News:\n" + "\n".join([f"- {n.get('title','')}" for n in news_list]) + "\n\nPosts:\n" + "\n".join([f"- {p.get('title','')}" for p in posts_list[:10]])
+                except Exception as e:
+                    sentiment_text = f"Sentiment data unavailable: {str(e)}"
+                _update_debate_job(db, job_id, checkpoint={'rendered_data': rendered_data, 'sentiment_text': sentiment_text})
+            formatted_data = assemble_sections(rendered_data)
 
             default_model_map = {
                 'openai': 'gpt-3.5-turbo',
@@ -862,85 +1055,59 @@ def register_routes(app):
                 model = agent.model or get_config(db, f'{provider}_model', default_model_map.get(provider, 'gpt-3.5-turbo'))
                 return provider, api_key, model
 
-            steps = []
-            analysis_memory = {agent.id: [] for agent in agents}
+            summaries = StepSummaries()
 
-            # 多轮分析（同一轮并行）
-            for round_idx in range(1, analysis_rounds + 1):
-                if _is_job_canceled(db, job_id):
-                    _update_debate_job(db, job_id, status='canceled')
-                    return
+            # 多轮分析：每个Agent一条独立的链，只在进入辩论前等待全部完成
+            def build_analysis_prompt(chain, round_idx):
                 # 获取当前时间（每轮分析都更新）
                 current_time = datetime.now()
                 current_time_str = current_time.strftime('%Y-%m-%d %H:%M:%S')
                 current_time_info = f"Current Time: {current_time_str} (Weekday: {current_time.strftime('%A')})"
-                
-                prompts = []
-                for agent in agents:
-                    prev_analysis = "\n\n".join(analysis_memory[agent.id][-2:]) if analysis_memory[agent.id] else "None"
-                    prompts.append((
-                        agent,
-                        f"{agent.prompt}\n\n"
+                agent_data = assemble_sections(rendered_data, parse_sections(chain.data_sections))
+
+                def render(prev_analysis):
+                    return (
+                        f"{chain.prompt}\n\n"
                         f"{current_time_info}\n\n"
-                        f"Stock Data:\n{formatted_data}\n\n"
+                        f"Stock Data:\n{agent_data}\n\n"
                         f"Sentiment Data:\n{sentiment_text}\n\n"
                         f"Round {round_idx} Analysis:\n"
                         f"Build on your previous analysis and provide new insights without repetition.\n\n"
                         f"Previous Analysis (if any):\n{prev_analysis}\n\n"
                         f"Please provide your analysis in Chinese."
-                    ))
+                    )
 
-                with ThreadPoolExecutor(max_workers=min(6, len(prompts))) as executor:
-                    futures = {
-                        executor.submit(
-                            AIService.call_agent,
-                            *resolve_agent_config(agent),
-                            prompt
-                        ): agent
-                        for agent, prompt in prompts
-                    }
-                    for future in as_completed(futures):
-                        agent = futures[future]
-                        try:
-                            result = future.result()
-                        except Exception as e:
-                            result = f"[ERROR] {agent.name} analysis failed: {str(e)}"
-                        analysis_memory[agent.id].append(result)
-                        steps.append({
-                            'phase': 'analysis',
-                            'round': round_idx,
-                            'agent_id': agent.id,
-                            'agent_name': agent.name,
-                            'content': result,
-                            'timestamp': datetime.now().isoformat()
-                        })
-                        progress = 20 + round_idx * 10
-                        _update_debate_job(db, job_id, steps=steps, progress=progress)
+                recent = chain.memory[-2:]
+                first_round = len(chain.memory) - len(recent) + 1
+                previous = [
+                    HistoryItem(('analysis', first_round + i, chain.id), first_round + i, '', content)
+                    for i, content in enumerate(recent)
+                ]
+                prev_analysis, = fit_sections(chain.budget, [render('')], [previous], summaries)
+                return render(prev_analysis)
+
+            if not _run_analysis_phase(db, job_id, agents, resolve_agent_config, analysis_rounds,
+                                       build_analysis_prompt, steps):
+                return
 
             # 多轮辩论（同一轮并行）
-            debate_history = []
+            debate_history = [step for step in steps if step['phase'] == 'debate' and step['round'] <= debate_rounds]
             for round_idx in range(1, debate_rounds + 1):
                 if _is_job_canceled(db, job_id):
                     _update_debate_job(db, job_id, status='canceled')
                     return
+                # 恢复的任务跳过已完成的发言，本轮只剩部分Agent时只补齐这些Agent
+                answered = {step['agent_id'] for step in debate_history if step['round'] == round_idx}
+                round_agents = [agent for agent in agents if agent.id not in answered]
+                if not round_agents:
+                    continue
                 # 获取当前时间（每轮辩论都更新）
                 current_time = datetime.now()
                 current_time_str = current_time.strftime('%Y-%m-%d %H:%M:%S')
                 current_time_info = f"Current Time: {current_time_str} (Weekday: {current_time.strftime('%A')})"
                 
-                prompts = []
-                other_latest = "\n\n".join([
-                    f"{a.name}:\n{analysis_memory[a.id][-1]}"
-                    for a in agents if analysis_memory[a.id]
-                ])
-                recent_debate = "\n\n".join([
-                    f"Round {item['round']} - {item['agent_name']}:\n{item['content']}"
-                    for item in debate_history[-min(len(debate_history), len(agents) * 2):]
-                ]) if debate_history else "None"
-
-                for agent in agents:
-                    prompts.append((
-                        agent,
+                def render(agent, other_latest, recent_debate):
+                    return (
                         f"{agent.prompt}\n\n"
                         f"{current_time_info}\n\n"
                         "You are participating in a multi-agent debate.\n\n"
@@ -950,30 +1117,49 @@ def register_routes(app):
                         f"Other agents' latest analyses:\n{other_latest}\n\n"
                         f"Recent Debate History:\n{recent_debate}\n\n"
                         "Please provide your debate response in Chinese."
-                    ))
+                    )
+
+                latest_items, debate_items = _debate_context_items(
+                    steps, agents, [step for step in debate_history if step['round'] < round_idx])
+                prompts = []
+                for agent in round_agents:
+                    # 历史记录按该Agent所用模型的预算压缩
+                    provider, _, model = resolve_agent_config(agent)
+                    other_latest, recent_debate = fit_sections(
+                        prompt_budget(db, provider, model), [render(agent, '', '')],
+                        [latest_items, debate_items], summaries)
+                    prompts.append((agent, render(agent, other_latest, recent_debate)))
 
                 with ThreadPoolExecutor(max_workers=min(6, len(prompts))) as executor:
                     futures = {
                         executor.submit(
-                            AIService.call_agent,
+                            AIService.call_agent_detailed,
                             *resolve_agent_config(agent),
-                            prompt
+                            prompt,
+                            queued_at=time.monotonic(),
+                            job_id=job_id,
+                            agent=agent.name
                         ): agent
                         for agent, prompt in prompts
                     }
                     for future in as_completed(futures):
                         agent = futures[future]
                         try:
-                            result = future.result()
+                            call = future.result()
+                            result, telemetry = call.text, call.to_dict()
+                        except CallCanceled:
+                            raise
                         except Exception as e:
                             result = f"[ERROR] {agent.name} debate failed: {str(e)}"
+                            telemetry = failure_telemetry(e)
                         item = {
                             'phase': 'debate',
                             'round': round_idx,
                             'agent_id': agent.id,
                             'agent_name': agent.name,
                             'content': result,
-                            'timestamp': datetime.now().isoformat()
+                            'timestamp': datetime.now().isoformat(),
+                            'telemetry': telemetry
                         }
                         debate_history.append(item)
                         steps.append(item)
@@ -992,21 +1178,30 @@ def register_routes(app):
                 for item in steps
             ])
 
-            operator_prompt = (
-                "You are a senior trading operator and debate recorder.\n"
-                "Based on the multi-agent analysis and debate transcript, produce a final research report in Markdown.\n"
-                "The report must include sections: Basic Info, Overview, Key Points by Agent, Debate Summary, Risks, Final Recommendation.\n"
-                "Use tables and bullet points where appropriate for readability.\n"
-                "Provide a clear trading operation suggestion in the Final Recommendation section.\n\n"
-                f"Stock Data (key fields):\n{formatted_data}\n\n"
-                f"Sentiment Summary:\n{sentiment_text}\n\n"
-                f"Transcript:\n{transcript}\n\n"
-                "Please output the report in Chinese."
-            )
+            def render_operator_prompt(transcript):
+                return (
+                    "You are a senior trading operator and debate recorder.\n"
+                    "Based on the multi-agent analysis and debate transcript, produce a final research report in Markdown.\n"
+                    "The report must include sections: Basic Info, Overview, Key Points by Agent, Debate Summary, Risks, Final Recommendation.\n"
+                    "Use tables and bullet points where appropriate for readability.\n"
+                    "Provide a clear trading operation suggestion in the Final Recommendation section.\n\n"
+                    f"Stock Data (key fields):\n{formatted_data}\n\n"
+                    f"Sentiment Summary:\n{sentiment_text}\n\n"
+                    f"Transcript:\n{transcript}\n\n"
+                    "Please output the report in Chinese."
+                )
+
+            prompt_transcript, = fit_sections(
+                prompt_budget(db, operator_provider, operator_model), [render_operator_prompt('')],
+                [step_items(steps, _transcript_header)], summaries)
+            operator_prompt = render_operator_prompt(prompt_transcript)
 
             try:
-                report_md = AIService.call_agent(operator_provider, operator_api_key, operator_model, operator_prompt)
+                report_md = AIService.call_agent_detailed(operator_provider, operator_api_key, operator_model, operator_prompt,
+                                                          job_id=job_id, agent="资深操作员（报告）").text
                 _update_debate_job(db, job_id, status='completed', progress=100, report_md=report_md, steps=steps, error=None)
+            except CallCanceled:
+                raise
             except Exception as e:
                 fallback_report = (
                     "## 报告生成失败（已提供原始记录）\n\n"
@@ -1016,17 +1211,21 @@ def register_routes(app):
                     "请稍后重试生成报告。"
                 )
                 _update_debate_job(db, job_id, status='completed', progress=100, report_md=fallback_report, steps=steps, error=None)
+        except CallCanceled:
+            _update_debate_job(db, job_id, status='canceled')
         except Exception as e:
             error_msg = str(e)
             print(f"[API] 辩论分析失败: {error_msg}")
             _update_debate_job(db, job_id, status='failed', error=error_msg)
         finally:
+            get_cancel_registry().discard(job_id)
             db.close()
 
     def _run_multi_select_job(job_id, codes, agent_ids, analysis_rounds, debate_rounds):
         db = SessionLocal()
+        get_cancel_registry().register(job_id)
         try:
-            _update_debate_job(db, job_id, status='running', progress=5)
+            steps, checkpoint = _start_job(db, job_id)
 
             agents = []
             for agent_id in agent_ids:
@@ -1051,22 +1250,30 @@ def register_routes(app):
                 raise ValueError(f'未配置{operator_provider} API Key')
             operator_model = get_config(db, f'{operator_provider}_model', default_model_map.get(operator_provider, 'gpt-3.5-turbo'))
 
-            # 获取多股票数据
-            stock_blocks = []
-            for code_str in codes:
-                try:
-                    stock_data = get_comprehensive_data_with_indicators(code_str)
-                    formatted = format_for_ai(stock_data)
-                    stock_name = ''
+            # 获取多股票数据（恢复的任务沿用检查点中的数据）
+            stock_blocks = checkpoint.get('stock_blocks')  # (标题, 已渲染的数据区块或错误信息)
+            if stock_blocks is None:
+                stock_blocks = []
+                for code_str in codes:
                     try:
-                        stock_name = stock_data.get('realtime', {}).get('name', '')
-                    except Exception:
+                        stock_data = get_comprehensive_data_with_indicators(code_str)
                         stock_name = ''
-                    stock_blocks.append(f"Stock {code_str} {stock_name}:\n{formatted}")
-                except Exception as e:
-                    stock_blocks.append(f"Stock {code_str}:\nData unavailable: {str(e)}")
+                        try:
+                            stock_name = stock_data.get('realtime', {}).get('name', '')
+                        except Exception:
+                            stock_name = ''
+                        stock_blocks.append((f"Stock {code_str} {stock_name}:", render_sections(stock_data)))
+                    except Exception as e:
+                        stock_blocks.append((f"Stock {code_str}:", f"Data unavailable: {str(e)}"))
+                _update_debate_job(db, job_id, checkpoint={'stock_blocks': stock_blocks})
+
+            def combine_stock_data(sections=None):
+                return "\n\n".join(
+                    f"{title}\n{assemble_sections(block, sections) if isinstance(block, dict) else block}"
+                    for title, block in stock_blocks
+                )
 
-            combined_data = "\n\n".join(stock_blocks)
+            combined_data = combine_stock_data()
             multi_instruction = (
                 "You must choose exactly ONE stock to invest in from the list below. "
                 "A capital MUST be allocated to one of these stocks. "
@@ -1081,86 +1288,60 @@ def register_routes(app):
                 model = agent.model or get_config(db, f'{provider}_model', default_model_map.get(provider, 'gpt-3.5-turbo'))
                 return provider, api_key, model
 
-            steps = []
-            analysis_memory = {agent.id: [] for agent in agents}
+            summaries = StepSummaries()
 
-            # 多轮分析
-            for round_idx in range(1, analysis_rounds + 1):
-                if _is_job_canceled(db, job_id):
-                    _update_debate_job(db, job_id, status='canceled')
-                    return
+            # 多轮分析：每个Agent一条独立的链，只在进入辩论前等待全部完成
+            def build_analysis_prompt(chain, round_idx):
                 # 获取当前时间（每轮分析都更新）
                 current_time = datetime.now()
                 current_time_str = current_time.strftime('%Y-%m-%d %H:%M:%S')
                 current_time_info = f"Current Time: {current_time_str} (Weekday: {current_time.strftime('%A')})"
-                
-                prompts = []
-                for agent in agents:
-                    prev_analysis = "\n\n".join(analysis_memory[agent.id][-2:]) if analysis_memory[agent.id] else "None"
-                    prompts.append((
-                        agent,
-                        f"{agent.prompt}\n\n"
+                agent_data = combine_stock_data(parse_sections(chain.data_sections))
+
+                def render(prev_analysis):
+                    return (
+                        f"{chain.prompt}\n\n"
                         f"{current_time_info}\n\n"
                         "Multi-Stock Selection Task:\n"
-                        f"{combined_data}\n\n"
+                        f"{agent_data}\n\n"
                         f"{multi_instruction}\n\n"
                         f"Round {round_idx} Analysis:\n"
                         "Provide new insights and clearly state your preferred stock.\n\n"
                         f"Previous Analysis (if any):\n{prev_analysis}\n\n"
                         "Please provide your analysis in Chinese."
-                    ))
+                    )
 
-                with ThreadPoolExecutor(max_workers=min(6, len(prompts))) as executor:
-                    futures = {
-                        executor.submit(
-                            AIService.call_agent,
-                            *resolve_agent_config(agent),
-                            prompt
-                        ): agent
-                        for agent, prompt in prompts
-                    }
-                    for future in as_completed(futures):
-                        agent = futures[future]
-                        try:
-                            result = future.result()
-                        except Exception as e:
-                            result = f"[ERROR] {agent.name} analysis failed: {str(e)}"
-                        analysis_memory[agent.id].append(result)
-                        steps.append({
-                            'phase': 'analysis',
-                            'round': round_idx,
-                            'agent_id': agent.id,
-                            'agent_name': agent.name,
-                            'content': result,
-                            'timestamp': datetime.now().isoformat()
-                        })
-                        progress = 20 + round_idx * 10
-                        _update_debate_job(db, job_id, steps=steps, progress=progress)
+                recent = chain.memory[-2:]
+                first_round = len(chain.memory) - len(recent) + 1
+                previous = [
+                    HistoryItem(('analysis', first_round + i, chain.id), first_round + i, '', content)
+                    for i, content in enumerate(recent)
+                ]
+                prev_analysis, = fit_sections(chain.budget, [render('')], [previous], summaries)
+                return render(prev_analysis)
+
+            if not _run_analysis_phase(db, job_id, agents, resolve_agent_config, analysis_rounds,
+                                       build_analysis_prompt, steps):
+                return
 
             # 多轮辩论
-            debate_history = []
+            debate_history = [step for step in steps if step['phase'] == 'debate' and step['round'] <= debate_rounds]
             for round_idx in range(1, debate_rounds + 1):
                 if _is_job_canceled(db, job_id):
                     _update_debate_job(db, job_id, status='canceled')
                     return
+                # 恢复的任务跳过已完成的发言，本轮只剩部分Agent时只补齐这些Agent
+                answered = {step['agent_id'] for step in debate_history if step['round'] == round_idx}
+                round_agents = [agent for agent in agents if agent.id not in answered]
+                if not round_agents:
+                    continue
                 # 获取当前时间（每轮辩论都更新）
                 current_time = datetime.now()
                 current_time_str = current_time.strftime('%Y-%m-%d %H:%M:%S')
                 current_time_info = f"Current Time: {current_time_str} (Weekday: {current_time.strftime('%A')})"
                 
-                prompts = []
-                other_latest = "\n\n".join([
-                    f"{a.name}:\n{analysis_memory[a.id][-1]}"
-                    for a in agents if analysis_memory[a.id]
-                ])
-                recent_debate = "\n\n".join([
-                    f"Round {item['round']} - {item['agent_name']}:\n{item['content']}"
-                    for item in debate_history[-min(len(debate_history), len(agents) * 2):]
-                ]) if debate_history else "None"
-
-                for agent in agents:
-                    prompts.append((
-                        agent,
+                def render(agent, other_latest, recent_debate):
+                    return (
                         f"{agent.prompt}\n\n"
                         f"{current_time_info}\n\n"
                         "You are participating in a multi-agent debate for a multi-stock selection task.\n"
@@ -1170,30 +1351,49 @@ def register_routes(app):
                         f"Other agents' latest analyses:\n{other_latest}\n\n"
                         f"Recent Debate History:\n{recent_debate}\n\n"
                         "Please provide your debate response in Chinese."
-                    ))
+                    )
+
+                latest_items, debate_items = _debate_context_items(
+                    steps, agents, [step for step in debate_history if step['round'] < round_idx])
+                prompts = []
+                for agent in round_agents:
+                    # 历史记录按该Agent所用模型的预算压缩
+                    provider, _, model = resolve_agent_config(agent)
+                    other_latest, recent_debate = fit_sections(
+                        prompt_budget(db, provider, model), [render(agent, '', '')],
+                        [latest_items, debate_items], summaries)
+                    prompts.append((agent, render(agent, other_latest, recent_debate)))
 
                 with ThreadPoolExecutor(max_workers=min(6, len(prompts))) as executor:
                     futures = {
                         executor.submit(
-                            AIService.call_agent,
+                            AIService.call_agent_detailed,
                             *resolve_agent_config(agent),
-                            prompt
+                            prompt,
+                            queued_at=time.monotonic(),
+                            job_id=job_id,
+                            agent=agent.name
                         ): agent
                         for agent, prompt in prompts
                     }
                     for future in as_completed(futures):
                         agent = futures[future]
                         try:
-                            result = future.result()
+                            call = future.result()
+                            result, telemetry = call.text, call.to_dict()
+                        except CallCanceled:
+                            raise
                         except Exception as e:
                             result = f"[ERROR] {agent.name} debate failed: {str(e)}"
+                            telemetry = failure_telemetry(e)
                         item = {
                             'phase': 'debate',
                             'round': round_idx,
                             'agent_id': agent.id,
                             'agent_name': agent.name,
                             'content': result,
-                            'timestamp': datetime.now().isoformat()
+                            'timestamp': datetime.now().isoformat(),
+                            'telemetry': telemetry
                         }
                         debate_history.append(item)
                         steps.append(item)
@@ -1206,27 +1406,38 @@ def register_routes(app):
                 for item in steps
             ])
 
-            decision_prompt = (
-                "You are a decisive, ruthless senior trader and final decision maker.\n"
-                "You must choose exactly ONE stock to buy from the candidates.\n"
-                "Be bold, concise, and action-oriented. No hedging.\n\n"
-                f"Candidates:\n{combined_data}\n\n"
-                f"Debate Transcript:\n{transcript}\n\n"
-                "Output a Markdown report with sections: Final Choice, Rationale, Entry Plan, Risk Control.\n"
-                "Please output in Chinese."
-            )
+            def render_decision_prompt(transcript):
+                return (
+                    "You are a decisive, ruthless senior trader and final decision maker.\n"
+                    "You must choose exactly ONE stock to buy from the candidates.\n"
+                    "Be bold, concise, and action-oriented. No hedging.\n\n"
+                    f"Candidates:\n{combined_data}\n\n"
+                    f"Debate Transcript:\n{transcript}\n\n"
+                    "Output a Markdown report with sections: Final Choice, Rationale, Entry Plan, Risk Control.\n"
+                    "Please output in Chinese."
+                )
+
+            prompt_transcript, = fit_sections(
+                prompt_budget(db, operator_provider, operator_model), [render_decision_prompt('')],
+                [step_items(steps, _transcript_header)], summaries)
+            decision_prompt = render_decision_prompt(prompt_transcript)
 
             try:
-                report_md = AIService.call_agent(operator_provider, operator_api_key, operator_model, decision_prompt)
+                decision = AIService.call_agent_detailed(operator_provider, operator_api_key, operator_model,
+                                                         decision_prompt, job_id=job_id, agent="裁判（决策）")
+                report_md = decision.text
                 steps.append({
                     'phase': 'debate',
                     'round': debate_rounds + 1,
                     'agent_id': 0,
                     'agent_name': "裁判（决策）",
                     'content': report_md,
-                    'timestamp': datetime.now().isoformat()
+                    'timestamp': datetime.now().isoformat(),
+                    'telemetry': decision.to_dict()
                 })
                 _update_debate_job(db, job_id, status='completed', progress=100, report_md=report_md, steps=steps, error=None)
+            except CallCanceled:
+                raise
             except Exception as e:
                 fallback_report = (
                     "## 决策生成失败（已提供原始记录）\n\n"
@@ -1237,12 +1448,75 @@ def register_routes(app):
                 )
                 _update_debate_job(db, job_id, status='completed', progress=100, report_md=fallback_report, steps=steps, error=None)
 
+        except CallCanceled:
+            _update_debate_job(db, job_id, status='canceled')
         except Exception as e:
             error_msg = str(e)
             print(f"[API] 多选一辩论失败: {error_msg}")
             _update_debate_job(db, job_id, status='failed', error=error_msg)
+        finally:
+            get_cancel_registry().discard(job_id)
+            db.close()
+
+    def _resume_interrupted_jobs():
+        """
+        恢复中断的任务：queued/running 状态且超过 JOB_STALE_SECONDS 没有心跳的任务从检查点
+        （已完成的步骤和已获取的数据）继续运行
+
+        多进程部署时每个进程启动都会执行：其他进程仍在运行的任务在持续刷新心跳，不会被认领；
+        还没超时的任务在到期后再检查一次（原进程刚退出时重启也能恢复，原进程中途退出时由其他进程接手）。
+
+        Returns:
+            int: 恢复的任务数
+        """
+        db = SessionLocal()
+        resumed = 0
+        recheck = None  # 最早一个未超时任务的到期秒数
+        try:
+            now = datetime.now()
+            stale_before = now - timedelta(seconds=JOB_STALE_SECONDS)
+            for job in list_debate_jobs(db, 'active', limit=100):
+                if get_cancel_registry().get(job.job_id) is not None:
+                    continue  # 本进程正在运行
+                if job.updated_at is not None and job.updated_at >= stale_before:
+                    remaining = (job.updated_at - stale_before).total_seconds()
+                    recheck = remaining if recheck is None else min(recheck, remaining)
+                    continue  # 可能仍在其他进程运行
+                if not claim_debate_job(db, job.job_id, job.updated_at, stale_before):
+                    continue  # 已被其他进程恢复
+                if job.canceled:
+                    _update_debate_job(db, job.job_id, status='canceled')
+                    continue
+                try:
+                    payload = json.loads(job.agent_ids) if job.agent_ids else {}
+                    agent_ids = payload['agent_ids']
+                    analysis_rounds = payload['analysis_rounds']
+                    debate_rounds = payload['debate_rounds']
+                    meta = payload.get('meta') or {}
+                except (ValueError, KeyError, TypeError) as e:
+                    _update_debate_job(db, job.job_id, status='failed', error=f'任务参数无法恢复: {e}')
+                    continue
+                if meta.get('mode') == 'multi_select':
+                    target, args = _run_multi_select_job, (job.job_id, meta.get('codes') or job.code.split(','),
+                                                           agent_ids, analysis_rounds, debate_rounds)
+                else:
+                    target, args = _run_debate_job, (job.job_id, job.code, agent_ids, analysis_rounds, debate_rounds)
+                threading.Thread(target=target, args=args, daemon=True).start()
+                resumed += 1
+        except Exception as e:
+            print(f"[API] 恢复中断的辩论任务失败: {e}")
         finally:
             db.close()
+        if resumed:
+            print(f"[API] 已恢复 {resumed} 个中断的辩论任务")
+        if recheck is not None:
+            timer = threading.Timer(recheck + 1, _resume_interrupted_jobs)
+            timer.daemon = True
+            timer.start()
+        return resumed
+
+    # 由 api_server 在启动后台任务时调用
+    app.extensions['resume_debate_jobs'] = _resume_interrupted_jobs
 
     @app.route('/api/ai/debate/start/<code>', methods=['POST'])
     def start_debate_job_api(code):
@@ -1344,6 +1618,27 @@ def register_routes(app):
             return jsonify({'success': False, 'error': '任务不存在'}), 404
         return jsonify({'success': True, 'data': _serialize_job(job)})
 
+    @app.route('/api/ai/debate/telemetry/<job_id>', methods=['GET'])
+    def get_debate_job_telemetry(job_id):
+        """辩论任务的大模型调用统计（总计、按提供商、按Agent汇总，以及每次调用明细）"""
+        calls = get_llm_telemetry().job_calls(job_id)
+        if calls is None:
+            # 服务重启后内存中没有明细，退回任务步骤里保存的统计（不含未写入步骤的报告调用）
+            db = next(get_db())
+            try:
+                job = get_debate_job(db, job_id)
+            finally:
+                db.close()
+            if not job:
+                return jsonify({'success': False, 'error': '任务不存在'}), 404
+            try:
+                steps = json.loads(job.steps) if job.steps else []
+            except Exception:
+                steps = []
+            calls = [dict(step['telemetry'], agent=step.get('agent_name'))
+                     for step in steps if step.get('telemetry')]
+        return jsonify({'success': True, 'data': dict(summarize_calls(calls), calls=calls)})
+
     @app.route('/api/ai/debate/jobs', methods=['GET'])
     def list_debate_jobs_api():
         """获取辩论任务列表"""
@@ -1373,6 +1668,8 @@ def register_routes(app):
             if job.status in ['completed', 'failed', 'canceled']:
                 return jsonify({'success': False, 'error': '任务已结束，无法终止'}), 400
             cancel_debate_job(db, job_id)
+            # 立即中断该任务进行中的大模型请求
+            get_cancel_registry().cancel(job_id)
             return jsonify({'success': True})
         except Exception as e:
             error_msg = str(e)
@@ -1428,7 +1725,7 @@ def register_routes(app):
             # 获取股票数据
             print(f"[API] 获取股票数据（辩论）: {code_str}")
             stock_data = get_comprehensive_data_with_indicators(code_str)
-            formatted_data = format_for_ai(stock_data)
+            rendered_data = render_sections(stock_data)
 
             default_model_map = {
                 'openai': 'gpt-3.5-turbo',
@@ -1460,10 +1757,11 @@ def register_routes(app):
                 for agent in agents:
                     provider, api_key, model = resolve_agent_config(agent)
                     prev_analysis = "\n\n".join(analysis_memory[agent.id][-2:]) if analysis_memory[agent.id] else "None"
+                    agent_data = assemble_sections(rendered_data, parse_sections(agent.data_sections))
                     prompt = (
                         f"{agent.prompt}\n\n"
                         f"{current_time_info}\n\n"
-                        f"Stock Data:\n{formatted_data}\n\n"
+                        f"Stock Data:\n{agent_data}\n\n"
                         f"Round {round_idx} Analysis:\n"
                         f"Build on your previous analysis and provide new insights without repetition.\n\n"
                         f"Previous Analysis (if any):\n{prev_analysis}\n\n"
@@ -1603,7 +1901,7 @@ def register_routes(app):
             # 获取股票数据
             print(f"[API] 获取股票数据: {code_str}")
             stock_data = get_comprehensive_data_with_indicators(code_str)
-            formatted_data = format_for_ai(stock_data)
+            formatted_data = format_for_ai(stock_data, agent.data_sections)
             
             # 获取当前时间
             current_time = datetime.now()
@@ -1681,251 +1979,24 @@ def register_routes(app):
             
             print(f"[API] 开始筛选强势股... 截止时间={limit_time}")
             
-            # 获取最近的交易日
-            def get_recent_trade_dates():
-                """获取最近的交易日（使用akshare）"""
-                try:
-                    import akshare as ak
-                    # 使用akshare获取交易日历
-                    trade_cal = ak.tool_trade_date_hist_sina()
-                    today = datetime.now().date()
-                    
-                    # 找到最近的交易日
-                    trade_dates = pd.to_datetime(trade_cal['trade_date']).dt.date.tolist()
-                    trade_dates = [d for d in trade_dates if d <= today]
-                    trade_dates.sort(reverse=True)
-                    
-                    if len(trade_dates) >= 3:
-                        return [trade_dates[0], trade_dates[1], trade_dates[2]]
-                    else:
-                        print(f"[API] 交易日数据不足，只有 {len(trade_dates)} 个")
-                        # 返回简单估计的日期
-                        today = date.today()
-                        return [today, today - timedelta(days=1), today - timedelta(days=2)]
-                except Exception as e:
-                    print(f"[API] 获取交易日失败: {e}")
-                    import traceback
-                    print(f"[API] 错误堆栈: {traceback.format_exc()}")
-                    # 返回简单估计的日期
-                    today = date.today()
-                    return [today, today - timedelta(days=1), today - timedelta(days=2)]
-            
-            trade_dates = get_recent_trade_dates()
+            # T-1、T-2 两日都在截止时间前封板，且T日未涨停、未跌停
+            params = parse_screen_params({'lookback': 2, 'min_hits': 2, 'limit_time': limit_time})
+            screen = screen_limit_up(params)
+            trade_dates = screen['trade_dates']
             if len(trade_dates) < 3:
                 return jsonify({'error': '无法获取足够的交易日数据'}), 500
             
-            t_date = trade_dates[0]
-            t1_date = trade_dates[1]
-            t2_date = trade_dates[2]
-            
+            t_date, t1_date, t2_date = trade_dates[0], trade_dates[1], trade_dates[2]
             print(f"[API] 交易日: T={t_date}, T-1={t1_date}, T-2={t2_date}")
             
-            # 获取T-1和T-2的涨停数据
-            def get_limit_up_stocks(date_obj):
-                """获取指定日期的涨停股票（使用akshare）"""
-                try:
-                    import akshare as ak
-                    date_str = date_obj.strftime('%Y%m%d')
-                    
-                    print(f"[API] 调用akshare获取涨停数据，日期: {date_str}")
-                    limit_up_df = ak.stock_zt_pool_em(date=date_str)
-                    
-                    if limit_up_df is None or len(limit_up_df) == 0:
-                        print(f"[API] 日期 {date_str} 无涨停数据")
-                        return []
-                    
-                    print(f"[API] 日期 {date_str} 获取到 {len(limit_up_df)} 条涨停数据")
-                    
-                    stocks = []
-                    for idx, row in limit_up_df.iterrows():
-                        # 提取股票代码
-                        code = None
-                        for code_field in ['代码', '股票代码', 'code']:
-                            if code_field in row and pd.notna(row[code_field]):
-                                code_str = str(row[code_field]).strip()
-                                if code_str.isdigit() and len(code_str) == 6:
-                                    code = code_str
-                                    break
-                                elif code_str.isdigit():
-                                    code = code_str.zfill(6)
-                                    break
-                        
-                        if not code:
-                            continue
-                        
-                        # 提取股票名称
-                        name = None
-                        for name_field in ['名称', '股票名称', 'name']:
-                            if name_field in row and pd.notna(row[name_field]):
-                                name = str(row[name_field]).strip()
-                                break
-                        
-                        # 提取涨停时间
-                        first_limit_time = None
-                        for field in ['首次封板时间', '最后封板时间', '封板时间', '涨停时间', '首次涨停时间']:
-                            if field in row and pd.notna(row[field]) and str(row[field]).strip():
-                                first_limit_time = str(row[field]).strip()
-                                if ' ' in first_limit_time:
-                                    first_limit_time = first_limit_time.split(' ')[1]
-                                break
-                        
-                        # 提取连板数和炸板次数
-                        consecutive_days = 0
-                        for field in ['连板数', '连板']:
-                            if field in row and pd.notna(row[field]):
-                                try:
-                                    consecutive_days = int(row[field])
-                                except:
-                                    pass
-                                break
-                        
-                        break_count = 0
-                        for field in ['炸板次数', '炸板']:
-                            if field in row and pd.notna(row[field]):
-                                try:
-                                    break_count = int(row[field])
-                                except:
-                                    pass
-                                break
-                        
-                        # 提取行业
-                        industry = ''
-                        for field in ['所属行业', '行业']:
-                            if field in row and pd.notna(row[field]):
-                                industry = str(row[field]).strip()
-                                break
-                        
-                        stocks.append({
-                            'code': code,
-                            'name': name or '未知',
-                            'first_limit_time': first_limit_time,
-                            'consecutive_days': consecutive_days,
-                            'break_count': break_count,
-                            'industry': industry,
-                            'date': date_str
-                        })
-                    
-                    return stocks
-                except Exception as e:
-                    print(f"[API] 获取 {date_obj} 涨停数据失败: {e}")
-                    import traceback
-                    print(f"[API] 错误堆栈: {traceback.format_exc()}")
-                    return []
-            
-            print("[API] 获取T-1和T-2涨停数据...")
-            t1_stocks = get_limit_up_stocks(t1_date)
-            t2_stocks = get_limit_up_stocks(t2_date)
-            
-            print(f"[API] T-1涨停股票数: {len(t1_stocks)}, T-2涨停股票数: {len(t2_stocks)}")
-            
-            # 筛选指定时间之前涨停的股票
-            def filter_early_limit(stocks, cutoff_time):
-                """筛选指定时间之前涨停的股票"""
-                result = []
-                try:
-                    # 将截止时间转换为数字格式（如11:30 -> 113000）
-                    if ':' in cutoff_time:
-                        parts = cutoff_time.split(':')
-                        cutoff_value = int(parts[0]) * 10000 + int(parts[1]) * 100
-                    else:
-                        cutoff_value = int(cutoff_time)
-                except:
-                    cutoff_value = 113000  # 默认11:30
-                
-                print(f"[API] 筛选截止时间值: {cutoff_value}")
-                
-                for stock in stocks:
-                    time_str = stock.get('first_limit_time', '')
-                    try:
-                        # 处理不同格式的时间
-                        if ':' in str(time_str):
-                            # 格式如 "09:25:00" 或 "09:25"
-                            parts = str(time_str).split(':')
-                            time_value = int(parts[0]) * 10000 + int(parts[1]) * 100
-                            if len(parts) > 2:
-                                time_value += int(parts[2])
-                        else:
-                            # 格式如 "092500" 或 92500
-                            time_value = int(time_str)
-                        
-                        # 在截止时间之前或等于截止时间涨停
-                        if time_value <= cutoff_value:
-                            result.append(stock)
-                    except Exception as e:
-                        print(f"[API] 解析时间失败: {time_str}, 错误: {e}")
-                        continue
-                
-                print(f"[API] 筛选前{len(stocks)}只，筛选后{len(result)}只")
-                return result
-            
-            t1_early = filter_early_limit(t1_stocks, limit_time)
-            t2_early = filter_early_limit(t2_stocks, limit_time)
-            
-            print(f"[API] T-1早盘涨停: {len(t1_early)}, T-2早盘涨停: {len(t2_early)}")
-            
-            # 找出同时在T-1和T-2都早盘涨停的股票
-            t1_codes = {s['code'] for s in t1_early}
-            t2_codes = {s['code'] for s in t2_early}
-            common_codes = t1_codes & t2_codes
-            
-            print(f"[API] 同时在T-1和T-2早盘涨停的股票数: {len(common_codes)}")
-            
-            # 获取T日（今天）的涨停股票
-            t_limit_stocks = get_limit_up_stocks(t_date)
-            t_limit_codes = {s['code'] for s in t_limit_stocks}
-            
-            print(f"[API] T日涨停股票数: {len(t_limit_codes)}")
-
-            # 获取T日（今天）的跌停股票
-            t_down_codes = set()
-            try:
-                import akshare as ak
-                t_down_df = ak.stock_dt_pool_em(date=t_date.strftime('%Y%m%d'))
-                if t_down_df is not None and len(t_down_df) > 0 and '代码' in t_down_df.columns:
-                    t_down_codes = set(t_down_df['代码'].astype(str).str.zfill(6).tolist())
-                print(f"[API] T日跌停股票数: {len(t_down_codes)}")
-            except Exception as e:
-                print(f"[API] 获取T日跌停数据失败: {e}")
-            
-            # 筛选出今天还没有涨停且未跌停的股票
-            result_codes = common_codes - t_limit_codes - t_down_codes
-            
-            print(f"[API] 符合条件的强势股数量: {len(result_codes)}")
-            
-            # 组装结果
             result_stocks = []
-            for code in result_codes:
-                # 从T-1数据中获取股票信息
-                t1_info = next((s for s in t1_early if s['code'] == code), None)
-                t2_info = next((s for s in t2_early if s['code'] == code), None)
-                
-                if t1_info:
-                    stock_data = {
-                        'code': code,
-                        'name': t1_info['name'],
-                        't1_limit_time': t1_info['first_limit_time'],
-                        't2_limit_time': t2_info['first_limit_time'] if t2_info else None,
-                        'consecutive_days': t1_info.get('consecutive_days', 0),
-                        'break_count': t1_info.get('break_count', 0),
-                        'industry': t1_info.get('industry', ''),
-                        'current_price': None,
-                        'change_percent': None,
-                        'volume': None,
-                        'amount': None,
-                    }
-                    
-                    # 获取当前实时行情
-                    try:
-                        realtime = get_realtime_data(code)
-                        if realtime:
-                            stock_data['current_price'] = realtime.get('current_price')
-                            stock_data['change_percent'] = realtime.get('change_percent')
-                            stock_data['volume'] = realtime.get('volume')
-                            stock_data['amount'] = realtime.get('amount')
-                    except Exception as e:
-                        print(f"[API] 获取 {code} 实时行情失败: {e}")
-                    
-                    result_stocks.append(stock_data)
+            for stock in screen['stocks']:
+                limit_times = stock.pop('limit_times')
+                stock.pop('hits', None)
+                stock.pop('latest_hit_date', None)
+                stock['t1_limit_time'] = limit_times.get(t1_date.strftime('%Y-%m-%d'))
+                stock['t2_limit_time'] = limit_times.get(t2_date.strftime('%Y-%m-%d'))
+                result_stocks.append(stock)
             
             print(f"[API] 返回强势股数据，共 {len(result_stocks)} 只")
             
@@ -1950,3 +2021,29 @@ def register_routes(app):
             import traceback
             print(f"[API] 错误堆栈: {traceback.format_exc()}")
             return jsonify({'error': '筛选强势股失败', 'message': error_msg}), 500
+
+    @app.route('/api/strategy/limit_up_screen')
+    def get_limit_up_screen():
+        """涨停池多日筛选（参数化，历史池子走本地库）"""
+        try:
+            params = parse_screen_params(request.args)
+            print(f"[API] 涨停池筛选: {params}")
+            screen = screen_limit_up(params)
+            trade_dates = screen['trade_dates']
+            
+            return jsonify({
+                'strategy': 'limit_up_screen',
+                'params': params,
+                'trade_dates': {
+                    'T': trade_dates[0].strftime('%Y-%m-%d'),
+                    'history': [d.strftime('%Y-%m-%d') for d in trade_dates[1:]],
+                },
+                'count': len(screen['stocks']),
+                'stocks': screen['stocks']
+            })
+        except Exception as e:
+            error_msg = str(e)
+            print(f"[API] 涨停池筛选失败: {error_msg}")
+            import traceback
+            print(f"[API] 错误堆栈: {traceback.format_exc()}")
+            return jsonify({'error': '涨停池筛选失败', 'message': error_msg}), 500
@@ -7,17 +7,23 @@ Flask API服务 - 股票数据查询接口
 
 from flask import Flask, jsonify
 from flask_cors import CORS
+import os
 import warnings
 
+from response_compression import init_compression
+
 warnings.filterwarnings('ignore')
 
 # 创建Flask应用
 app = Flask(__name__)
-CORS(app)  # 允许跨域请求
+CORS(app, expose_headers=['X-Chart-Meta'])  # 允许跨域请求，暴露图表二进制格式的元信息头
 
 # 确保JSON响应使用UTF-8编码
 app.config['JSON_AS_ASCII'] = False
 
+# 响应压缩（gzip/brotli）
+init_compression(app)
+
 # 导入并注册路由（延迟导入避免循环依赖）
 def register_routes():
     from api_routes import register_routes as register
@@ -31,8 +37,26 @@ def init_database():
     except Exception as e:
         print(f"[初始化] 数据库初始化失败: {e}")
 
+def start_background_tasks():
+    """
+    启动后台任务（恢复中断的辩论任务、舆情爬取）；debug模式下只在重载后的子进程中启动
+    设置 DEBATE_RESUME=0 / SENTIMENT_CRAWLER=0 可分别关闭
+
+    被WSGI服务器导入时（如 gunicorn 多worker）每个worker都会执行一次恢复：只认领超过
+    JOB_STALE_SECONDS 没有心跳的任务，其他worker正在运行的任务不会被重复执行
+    """
+    if __name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        return
+    if os.environ.get('DEBATE_RESUME', '1') != '0':
+        app.extensions['resume_debate_jobs']()
+    if os.environ.get('SENTIMENT_CRAWLER', '1') == '0':
+        return
+    from sentiment_crawler import get_sentiment_crawler
+    get_sentiment_crawler().start()
+
 register_routes()
 init_database()
+start_background_tasks()
 
 if __name__ == '__main__':
     print("=" * 60)
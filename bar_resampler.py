@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""分钟K线重采样模块
+
+由5分钟K线聚合出15/30/60分钟K线，与新浪接口的K线对齐：
+- K线以结束时间标记（09:35、...、11:30、13:05、...、15:00）
+- 按“交易时段内分钟数”切桶（上午 09:30~11:30 为 0~120，下午 13:00~15:00 为 120~240），
+  11:30~13:00 午休不占分钟，因此 60 分钟线为 10:30、11:30、14:00、15:00
+- 开=桶内首根开盘，高/低=最大/最小，收=末根收盘，量/额=求和；
+  最早一个桶如果因截断而不完整则丢弃，最后一个（盘中进行中的）桶保留
+"""
+
+import numpy as np
+import pandas as pd
+
+BASE_SCALE = 5
+DERIVED_SCALES = (15, 30, 60)
+SESSION_MINUTES = 240
+MORNING_MINUTES = 120
+SINA_MAX_DATALEN = 1023
+DAY_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def session_minutes(datetimes):
+    """K线结束时间 -> 当日交易时段内的分钟数（上午 1~120，下午 121~240）"""
+    dt = pd.DatetimeIndex(datetimes)
+    clock = dt.hour.to_numpy() * 60 + dt.minute.to_numpy()
+    morning = clock - (9 * 60 + 30)
+    afternoon = MORNING_MINUTES + clock - 13 * 60
+    minutes = np.where(clock <= 11 * 60 + 30, morning, np.maximum(afternoon, MORNING_MINUTES))
+    return np.clip(minutes, 1, SESSION_MINUTES)
+
+
+def bucket_end_clock(end_minutes):
+    """交易时段内分钟数 -> 时钟分钟数（120 对应 11:30）"""
+    return np.where(end_minutes <= MORNING_MINUTES,
+                    9 * 60 + 30 + end_minutes,
+                    13 * 60 + end_minutes - MORNING_MINUTES)
+
+
+def base_datalen(scale, datalen, base_scale=BASE_SCALE):
+    """得到datalen根scale分钟K线所需的基础K线条数（多取一天，用于补足被截断的首日）"""
+    return datalen * scale // base_scale + SESSION_MINUTES // base_scale
+
+
+def resample_bars(df, scale, base_scale=BASE_SCALE):
+    """
+    将按时间升序的分钟K线（含 datetime/open/high/low/close/volume 列）聚合为scale分钟K线
+
+    Returns:
+        DataFrame: 列与新浪接口一致（day、OHLCV、可选amount）以及解析后的datetime
+    """
+    if df is None or len(df) == 0:
+        return df
+    if scale % base_scale or MORNING_MINUTES % scale:
+        raise ValueError(f"无法由{base_scale}分钟K线聚合出{scale}分钟K线")
+
+    datetimes = pd.DatetimeIndex(df['datetime'])
+    minutes = session_minutes(datetimes)
+    buckets = (minutes - 1) // scale
+    days = datetimes.normalize().to_numpy()
+
+    # 数据按时间有序，同一(日期, 桶)必然连续，直接找分组边界后用 reduceat 聚合
+    change = np.r_[True, (days[1:] != days[:-1]) | (buckets[1:] != buckets[:-1])]
+    starts = np.flatnonzero(change)
+    ends = np.r_[starts[1:], len(df)] - 1
+
+    result = {
+        'open': df['open'].to_numpy(dtype='float64')[starts],
+        'high': np.maximum.reduceat(df['high'].to_numpy(dtype='float64'), starts),
+        'low': np.minimum.reduceat(df['low'].to_numpy(dtype='float64'), starts),
+        'close': df['close'].to_numpy(dtype='float64')[ends],
+        'volume': np.add.reduceat(df['volume'].to_numpy(dtype='float64'), starts),
+    }
+    if 'amount' in df.columns:
+        result['amount'] = np.add.reduceat(pd.to_numeric(df['amount'], errors='coerce').to_numpy(dtype='float64'), starts)
+
+    end_minutes = (buckets[starts] + 1) * scale
+    label_times = days[starts] + bucket_end_clock(end_minutes).astype('int64') * np.timedelta64(1, 'm')
+    out = pd.DataFrame({'day': pd.DatetimeIndex(label_times).strftime(DAY_FORMAT), **result, 'datetime': label_times})
+
+    # 首个桶被截断（第一根K线不是桶内第一根）时丢弃
+    if minutes[0] > buckets[0] * scale + base_scale:
+        out = out.iloc[1:]
+    return out.reset_index(drop=True)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""辩论任务端到端基准测试
+
+在临时数据库上启动本地模拟大模型服务（mock_llm_server），通过 /api/ai/debate/start* 接口
+提交 N 个辩论任务（同时运行 concurrency 个），统计吞吐、任务耗时分位数、大模型调用数和数据库写入量。
+默认使用合成行情数据，不访问行情/舆情接口；--live-data 使用真实数据。
+用法: python bench_debate.py [--jobs 20] [--concurrency 5] [--mode single|multi] [--latency lognormal:1.0,0.5]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='辩论任务端到端基准测试')
+    parser.add_argument('--jobs', type=int, default=20, help='任务总数')
+    parser.add_argument('--concurrency', type=int, default=5, help='同时运行的任务数')
+    parser.add_argument('--mode', choices=('single', 'multi'), default='single', help='single=单股辩论, multi=多选一')
+    parser.add_argument('--agents', type=int, default=3, help='参与辩论的Agent数')
+    parser.add_argument('--analysis-rounds', type=int, default=2)
+    parser.add_argument('--debate-rounds', type=int, default=2)
+    parser.add_argument('--latency', default='lognormal:0.5,0.4', help='模拟服务延迟分布（见 mock_llm_server）')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--tps', type=float, default=200, help='模拟输出速度（token/秒），0为不限')
+    parser.add_argument('--completion-tokens', type=int, default=300)
+    parser.add_argument('--keys', type=int, default=1, help='模拟API Key数（测试Key池）')
+    parser.add_argument('--live-data', action='store_true', help='使用真实行情和舆情数据（需要网络）')
+    parser.add_argument('--db', help='数据库文件（默认临时文件，结束后删除）')
+    return parser.parse_args(argv)
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else float('nan')
+
+
+def synthetic_stock_data(code):
+    """合成行情数据（只含实时行情区块）"""
+    return {
+        'code': code,
+        'realtime': {
+            'name': f'基准{code}', 'current_price': 10.5, 'open': 10.2, 'yesterday_close': 10.1,
+            'high': 10.8, 'low': 10.0, 'change_percent': 3.96, 'volume': 125000, 'amount': 131250000,
+            'turnover_rate': 2.35,
+        },
+    }
+
+
+class WriteCounter:
+    """通过 SQLAlchemy 事件统计写语句数和参数字节数"""
+
+    def __init__(self, engine):
+        self._lock = threading.Lock()
+        self.statements = {'INSERT': 0, 'UPDATE': 0, 'DELETE': 0}
+        self.bytes = 0
+        self.commits = 0
+        from sqlalchemy import event
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+        event.listen(engine, 'commit', self._on_commit)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip()[:6].upper()
+        if verb not in self.statements:
+            return
+        rows = parameters if executemany else [parameters]
+        size = 0
+        for row in rows:
+            values = row.values() if isinstance(row, dict) else (row or ())
+            size += sum(len(v) if isinstance(v, (str, bytes)) else 8 for v in values if v is not None)
+        with self._lock:
+            self.statements[verb] += 1
+            self.bytes += size
+
+    def _on_commit(self, conn):
+        with self._lock:
+            self.commits += 1
+
+
+def run(args):
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='bench_debate_'), 'bench.db')
+    os.environ['STOCK_DB_PATH'] = db_path
+
+    from mock_llm_server import MockLLMConfig, start_in_thread
+    mock_config = MockLLMConfig(args.latency, args.error_rate, args.rate_limit_rate, args.tps, args.completion_tokens)
+    server, base_url = start_in_thread(mock_config)
+    os.environ['SILICONFLOW_API_BASE'] = base_url
+
+    # 环境变量设置后再导入，使数据库和接口地址指向临时库和模拟服务
+    from flask import Flask
+    import api_routes
+    from models import SessionLocal, engine
+    from db import set_config, create_agent, get_debate_job
+
+    if not args.live_data:
+        api_routes.get_comprehensive_data_with_indicators = synthetic_stock_data
+        api_routes.get_realtime_data = lambda code: synthetic_stock_data(code)['realtime']
+        api_routes.get_sentiment_data = lambda code, **kwargs: ([], [])
+        api_routes.index_sentiment = lambda code, news, posts: None
+        api_routes.build_sentiment_context = lambda code, **kwargs: "News:\n- 无\n\nPosts:\n- 无"
+
+    db = SessionLocal()
+    try:
+        set_config(db, 'default_ai_provider', 'siliconflow')
+        set_config(db, 'siliconflow_model', 'mock-model')
+        set_config(db, 'siliconflow_api_key', ",".join(f"mock-key-{i:04d}" for i in range(max(args.keys, 1))))
+        agent_ids = [
+            create_agent(db, f'基准Agent{i + 1}', 'default', '你是一名A股分析师，请给出观点。',
+                         ai_provider='siliconflow').id
+            for i in range(args.agents)
+        ]
+    finally:
+        db.close()
+
+    app = Flask(__name__)
+    api_routes.register_routes(app)
+    client = app.test_client()
+    counter = WriteCounter(engine)
+
+    payload = {'agent_ids': agent_ids, 'analysis_rounds': args.analysis_rounds, 'debate_rounds': args.debate_rounds}
+    codes = ['600000', '000001', '300750']
+
+    def submit(i):
+        if args.mode == 'multi':
+            response = client.post('/api/ai/debate/start_multi', json=dict(payload, codes=codes))
+        else:
+            response = client.post(f'/api/ai/debate/start/{codes[i % len(codes)]}', json=payload)
+        body = response.get_json()
+        if not body.get('success'):
+            raise RuntimeError(f"启动任务失败: {body.get('error')}")
+        return body['data']['job_id']
+
+    print(f"模拟服务 {base_url}，数据库 {db_path}")
+    print(f"{args.jobs} 个{'多选一' if args.mode == 'multi' else '单股'}任务，并发 {args.concurrency}，"
+          f"{args.agents} 个Agent，分析 {args.analysis_rounds} 轮，辩论 {args.debate_rounds} 轮，延迟 {args.latency}")
+
+    running = {}  # job_id -> 提交时间
+    latencies = []
+    statuses = {}
+    submitted = 0
+    started = time.monotonic()
+    while submitted < args.jobs or running:
+        while submitted < args.jobs and len(running) < args.concurrency:
+            running[submit(submitted)] = time.monotonic()
+            submitted += 1
+        time.sleep(0.05)
+        db = SessionLocal()
+        try:
+            for job_id in list(running):
+                job = get_debate_job(db, job_id)
+                if job is not None and job.status in ('completed', 'failed', 'canceled'):
+                    latencies.append(time.monotonic() - running.pop(job_id))
+                    statuses[job.status] = statuses.get(job.status, 0) + 1
+                    if job.status == 'failed':
+                        print(f"  任务失败 {job_id}: {job.error}")
+        finally:
+            db.close()
+    elapsed = time.monotonic() - started
+    server.shutdown()
+
+    stats = mock_config.stats
+    db_size = os.path.getsize(db_path) if os.path.exists(db_path) else 0
+    writes = sum(counter.statements.values())
+    print()
+    print(f"{'总耗时':<16}{elapsed:>12.2f} s")
+    print(f"{'任务吞吐':<16}{len(latencies) / elapsed * 60:>12.1f} 个/分钟")
+    print(f"{'任务结果':<16}{'  '.join(f'{k}={v}' for k, v in sorted(statuses.items())):>12}")
+    print(f"{'任务耗时 p50':<16}{percentile(latencies, 50):>12.2f} s")
+    print(f"{'任务耗时 p95':<16}{percentile(latencies, 95):>12.2f} s")
+    print(f"{'任务耗时 p99':<16}{percentile(latencies, 99):>12.2f} s")
+    print(f"{'大模型请求':<16}{stats['requests']:>12}   ({stats['requests'] / elapsed:.1f} 次/秒，"
+          f"500={stats['errors']}，429={stats['rate_limited']})")
+    print(f"{'token(入/出)':<16}{stats['prompt_tokens']:>12} / {stats['completion_tokens']}")
+    print(f"{'数据库写语句':<16}{writes:>12}   ({'，'.join(f'{k}={v}' for k, v in counter.statements.items())}，"
+          f"提交 {counter.commits} 次)")
+    print(f"{'写入参数量':<16}{counter.bytes / 1024:>12.1f} KB   (每任务 {counter.bytes / 1024 / max(len(latencies), 1):.1f} KB)")
+    print(f"{'数据库文件':<16}{db_size / 1024:>12.1f} KB")
+
+    if not args.db:
+        try:
+            os.remove(db_path)
+            os.rmdir(os.path.dirname(db_path))
+        except OSError:
+            pass
+
+
+if __name__ == '__main__':
+    run(parse_args(sys.argv[1:]))
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""东方财富响应解析基准测试
+
+对比旧实现（正则提取JSONP + json.loads + 逐行split）与 response_decoder。
+用法:
+    python bench_decoder.py                # 使用按真实格式构造的资金流向payload
+    python bench_decoder.py payloads/      # 使用目录下录制的原始响应（*.txt / *.json，含klines）
+"""
+
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from data_fetchers import _money_flow_records, parse_money_flow_klines, MONEY_FLOW_HISTORY_EXTRA_FIELDS
+from response_decoder import decode_json
+
+
+def build_payload(rows, minute=False, jsonp=True):
+    """构造与 fflow/daykline、fflow/kline 接口一致的响应"""
+    rng = np.random.default_rng(7)
+    klines = []
+    for i in range(rows):
+        nets = rng.normal(0, 5e7, 5)
+        if minute:
+            stamp = f"2024-01-02 {9 + (30 + i) // 60:02d}:{(30 + i) % 60:02d}"
+            klines.append(','.join([stamp] + [f"{v:.1f}" for v in nets]))
+        else:
+            ratios = rng.normal(0, 5, 5)
+            stamp = f"2023-{1 + i // 28 % 12:02d}-{1 + i % 28:02d}"
+            klines.append(','.join([stamp] + [f"{v:.1f}" for v in nets] + [f"{v:.2f}" for v in ratios]
+                                   + [f"{10 + rng.normal():.2f}", f"{rng.normal():.2f}", '0.00', '0.00']))
+    body = json.dumps({'rc': 0, 'rt': 21, 'svr': 1, 'lt': 1, 'full': 0,
+                       'data': {'code': '000001', 'market': 0, 'name': '平安银行', 'klines': klines}},
+                      ensure_ascii=False)
+    text = f"jQuery112309876543210_1700000000000({body});" if jsonp else body
+    return text.encode('utf-8')
+
+
+def legacy_parse(content, minute=False):
+    """旧实现"""
+    text = content.decode('utf-8')
+    if '(' in text and '{' in text:
+        match = re.search(r'\{.*\}', text, re.DOTALL)
+        data = json.loads(match.group(0)) if match else json.loads(text)
+    else:
+        data = json.loads(text)
+    result = []
+    for kline in data['data'].get('klines', []):
+        fields = kline.split(',')
+        if minute:
+            if len(fields) >= 6:
+                result.append({
+                    'time': fields[0],
+                    'main_net_inflow': float(fields[1]) / 10000 if fields[1] else None,
+                    'super_large_net_inflow': float(fields[2]) / 10000 if fields[2] else None,
+                    'large_net_inflow': float(fields[3]) / 10000 if fields[3] else None,
+                    'medium_net_inflow': float(fields[4]) / 10000 if fields[4] else None,
+                    'small_net_inflow': float(fields[5]) / 10000 if fields[5] else None,
+                })
+        elif len(fields) >= 12:
+            result.append({
+                'date': fields[0],
+                'main_net_inflow': float(fields[1]) / 10000 if fields[1] else None,
+                'super_large_net_inflow': float(fields[2]) / 10000 if fields[2] else None,
+                'large_net_inflow': float(fields[3]) / 10000 if fields[3] else None,
+                'medium_net_inflow': float(fields[4]) / 10000 if fields[4] else None,
+                'small_net_inflow': float(fields[5]) / 10000 if fields[5] else None,
+                'main_net_ratio': float(fields[6]) if fields[6] else None,
+                'super_large_net_ratio': float(fields[7]) if fields[7] else None,
+                'large_net_ratio': float(fields[8]) if fields[8] else None,
+                'medium_net_ratio': float(fields[9]) if fields[9] else None,
+                'small_net_ratio': float(fields[10]) if fields[10] else None,
+                'close': float(fields[11]) if fields[11] else None,
+                'change_percent': float(fields[12]) if len(fields) > 12 and fields[12] else None,
+            })
+    return result
+
+
+def new_parse(content, minute=False):
+    """新实现"""
+    data = decode_json(content)
+    klines = data['data'].get('klines', [])
+    if minute:
+        return _money_flow_records(klines, 'time', 6)
+    return _money_flow_records(klines, 'date', 12, MONEY_FLOW_HISTORY_EXTRA_FIELDS)
+
+
+def new_columns(content, minute=False):
+    """新实现，只解析到NumPy矩阵（列式消费方不需要构造记录dict）"""
+    klines = decode_json(content)['data'].get('klines', [])
+    if minute:
+        return parse_money_flow_klines(klines, 6)
+    return parse_money_flow_klines(klines, 12, MONEY_FLOW_HISTORY_EXTRA_FIELDS)
+
+
+def load_payloads(directory):
+    """读取录制的响应文件，按首行字段数判断是分钟线还是日线"""
+    payloads = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(('.txt', '.json')):
+            with open(os.path.join(directory, name), 'rb') as f:
+                content = f.read()
+            klines = decode_json(content)['data']['klines']
+            minute = bool(klines) and klines[0].count(',') < 11
+            payloads.append((name, content, minute))
+    return payloads
+
+
+def bench(func, content, minute, repeat, rounds=5):
+    """取多轮中最快一轮的平均耗时（毫秒），减少抖动"""
+    func(content, minute)
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func(content, minute)
+        best = min(best, (time.perf_counter() - start) / repeat * 1000)
+    return best
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        payloads = load_payloads(sys.argv[1])
+    else:
+        payloads = [
+            ('history_60d', build_payload(60), False),
+            ('history_1000d', build_payload(1000), False),
+            ('minute_241', build_payload(241, minute=True), True),
+            ('minute_1200', build_payload(1200, minute=True), True),
+        ]
+
+    print(f"{'payload':<16}{'bytes':>10}{'legacy ms':>12}{'records ms':>12}{'columns ms':>12}")
+    for name, content, minute in payloads:
+        assert legacy_parse(content, minute) == new_parse(content, minute), name
+        legacy = bench(legacy_parse, content, minute, 50)
+        records = bench(new_parse, content, minute, 50)
+        columns = bench(new_columns, content, minute, 50)
+        print(f"{name:<16}{len(content):>10}{legacy:>12.3f}{records:>12.3f}{columns:>12.3f}")
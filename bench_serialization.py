@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""K线/分时响应序列化基准测试
+
+构造带指标列的1000根K线，对比：
+旧版 to_dict('records') + 逐值修正、向量化记录列表、列式布局、分块流式输出。
+用法: python bench_serialization.py [行数]
+"""
+
+import json
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from json_serializer import (frame_to_records, frame_to_columns, iter_records_json,
+                             dumps, DATETIME_FORMAT)
+
+
+def build_frame(rows=1000):
+    """构造模拟K线数据（含NaN的指标列）"""
+    rng = np.random.default_rng(42)
+    close = 10 + np.cumsum(rng.normal(0, 0.1, rows))
+    df = pd.DataFrame({
+        'day': pd.date_range('2024-01-02 09:35', periods=rows, freq='5min'),
+        'open': close + rng.normal(0, 0.05, rows),
+        'high': close + 0.1,
+        'low': close - 0.1,
+        'close': close,
+        'volume': rng.integers(1000, 100000, rows),
+    })
+    for window in (5, 10, 20, 60):
+        df[f'ma{window}'] = df['close'].rolling(window).mean()
+    ema12 = df['close'].ewm(span=12, adjust=False).mean()
+    ema26 = df['close'].ewm(span=26, adjust=False).mean()
+    df['dif'] = ema12 - ema26
+    df['dea'] = df['dif'].ewm(span=9, adjust=False).mean()
+    df.loc[df.index[:30], ['dif', 'dea']] = np.nan
+    return df
+
+
+def legacy_records(df):
+    """旧实现：逐单元格判断"""
+    records = df.to_dict('records')
+    for record in records:
+        for key, value in record.items():
+            if pd.isna(value):
+                record[key] = None
+            elif isinstance(value, pd.Timestamp):
+                record[key] = value.strftime(DATETIME_FORMAT)
+    return records
+
+
+def bench(name, func, repeat=20):
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    cost = (time.perf_counter() - start) / repeat * 1000
+    print(f"{name:<28} {cost:8.2f} ms")
+    return cost
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    df = build_frame(rows)
+
+    legacy = legacy_records(df)
+    assert json.loads(dumps(frame_to_records(df))) == json.loads(json.dumps(legacy))
+    assert json.loads(b''.join(iter_records_json(df))) == json.loads(json.dumps(legacy))
+
+    print(f"行数: {rows}, 列数: {len(df.columns)}")
+    bench('legacy to_dict + json', lambda: json.dumps(legacy_records(df), ensure_ascii=False))
+    bench('frame_to_records + dumps', lambda: dumps(frame_to_records(df)))
+    bench('frame_to_columns + dumps', lambda: dumps(frame_to_columns(df)))
+    bench('iter_records_json', lambda: b''.join(iter_records_json(df)))
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""辩论任务的取消令牌
+
+每个运行中的任务在内存里登记一个 CancelToken。终止任务时除了写数据库的 canceled 标记，
+还会取消令牌：该任务所有进行中的大模型HTTP请求的socket被立即 shutdown，阻塞在读响应的线程马上返回，
+调用以 CallCanceled 结束（不再重试或故障转移），工作线程随即释放。
+
+HTTP请求通过 cancellable_session() 发出：它创建的连接在建立后登记到当前线程绑定的令牌（bind_token）。
+令牌可以派生子令牌（对冲请求各用一个，取消落后的请求时不影响任务本身），取消父令牌时子令牌一并取消。
+"""
+
+import socket
+import threading
+import weakref
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+_local = threading.local()
+
+
+class CallCanceled(Exception):
+    """调用因任务取消而中止"""
+
+
+def _shutdown(sock):
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass  # 已关闭
+
+
+class CancelToken:
+    """取消令牌：cancel() 后 canceled 为True，并中断登记在该令牌上的连接"""
+
+    def __init__(self, job_id=None, parent=None):
+        if job_id is None and parent is not None:
+            job_id = parent.job_id
+        self.job_id = job_id
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._sockets = weakref.WeakSet()
+        self._children = weakref.WeakSet()
+        if parent is not None:
+            parent._add_child(self)
+
+    @property
+    def canceled(self):
+        return self._event.is_set()
+
+    def wait(self, seconds):
+        """等待 seconds 秒，期间被取消则提前返回True"""
+        return self._event.wait(seconds)
+
+    def child(self):
+        return CancelToken(parent=self)
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            sockets = list(self._sockets)
+            children = list(self._children)
+        for sock in sockets:
+            _shutdown(sock)
+        for child in children:
+            child.cancel()
+
+    def attach(self, sock):
+        """登记连接的socket；已取消时立即中断"""
+        with self._lock:
+            if not self._event.is_set():
+                self._sockets.add(sock)
+                return
+        _shutdown(sock)
+
+    def _add_child(self, child):
+        with self._lock:
+            canceled = self._event.is_set()
+            if not canceled:
+                self._children.add(child)
+        if canceled:
+            child.cancel()
+
+
+@contextmanager
+def bind_token(token):
+    """在当前线程绑定令牌，期间通过 cancellable_session 建立的连接都登记到该令牌"""
+    previous = getattr(_local, 'token', None)
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+
+def current_token():
+    return getattr(_local, 'token', None)
+
+
+class _TrackedHTTPConnection(HTTPConnection):
+    def connect(self):
+        super().connect()
+        token = current_token()
+        if token is not None:
+            token.attach(self.sock)
+
+
+class _TrackedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        super().connect()
+        token = current_token()
+        if token is not None:
+            token.attach(self.sock)
+
+
+class _TrackedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TrackedHTTPConnection
+
+
+class _TrackedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TrackedHTTPSConnection
+
+
+_TRACKED_POOLS = {'http': _TrackedHTTPConnectionPool, 'https': _TrackedHTTPSConnectionPool}
+
+
+class _CancellableAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _TRACKED_POOLS
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        manager.pool_classes_by_scheme = _TRACKED_POOLS
+        return manager
+
+
+def cancellable_session():
+    """创建连接可被当前线程令牌中断的 requests.Session（用完需要 close）"""
+    session = requests.Session()
+    adapter = _CancellableAdapter()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class CancelRegistry:
+    """运行中任务的取消令牌（按 job_id）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = {}
+
+    def register(self, job_id):
+        with self._lock:
+            token = self._tokens.get(job_id)
+            if token is None:
+                token = self._tokens[job_id] = CancelToken(job_id)
+            return token
+
+    def get(self, job_id):
+        with self._lock:
+            return self._tokens.get(job_id)
+
+    def cancel(self, job_id):
+        """取消任务的令牌，任务不在本进程运行时返回False"""
+        token = self.get(job_id)
+        if token is None:
+            return False
+        token.cancel()
+        return True
+
+    def discard(self, job_id):
+        with self._lock:
+            self._tokens.pop(job_id, None)
+
+    def job_ids(self):
+        """本进程运行中的任务"""
+        with self._lock:
+            return list(self._tokens)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_cancel_registry():
+    """获取全局取消令牌登记表"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = CancelRegistry()
+    return _registry
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""提示词上下文预算
+
+辩论提示词里要嵌入其他Agent的最新分析、最近的辩论记录，决策/报告提示词要嵌入整份记录，
+Agent和轮数一多提示词就会超出模型上下文，调用也明显变慢。这里按模型给出提示词的token预算，
+估算各部分的token数，超出预算时从最早的记录开始换成摘要，仍然超出再省略最早的记录。
+每条记录的摘要只生成一次（按 阶段/轮次/Agent 缓存），之后所有提示词复用。
+"""
+
+import re
+import threading
+from collections import namedtuple
+
+from db import get_config
+
+# 各模型的上下文长度（按模型名前缀匹配，越具体的前缀越靠前）
+MODEL_CONTEXT_TOKENS = (
+    ('gpt-3.5-turbo', 16385),
+    ('gpt-4o', 128000),
+    ('gpt-4-turbo', 128000),
+    ('gpt-4', 8192),
+    ('deepseek', 65536),
+    ('qwen-turbo', 131072),
+    ('qwen-plus', 131072),
+    ('qwen-max', 32768),
+    ('gemini-pro', 32768),
+    ('gemini-1.5', 1048576),
+    ('gemini-2', 1048576),
+    ('Qwen/Qwen2.5', 32768),
+    ('grok', 131072),
+)
+PROVIDER_CONTEXT_TOKENS = {
+    'openai': 16385,
+    'deepseek': 65536,
+    'qwen': 131072,
+    'gemini': 32768,
+    'siliconflow': 32768,
+    'grok': 131072,
+}
+DEFAULT_CONTEXT_TOKENS = 16385
+OUTPUT_RESERVE_TOKENS = 4096  # 留给模型输出
+MAX_PROMPT_TOKENS = 24000  # 即使上下文更长也不超过该值，提示词越长调用越慢
+MIN_PROMPT_TOKENS = 2048
+SUMMARY_TOKENS = 300  # 单条记录摘要的长度
+SUMMARY_KEYWORDS = ('结论', '建议', '综上', '总结', '评级', '目标价', '止损', '仓位', '风险', '买入', '卖出', '持有',
+                    'Conclusion', 'Recommendation', 'Summary')
+
+_CJK_RE = re.compile(r'[　-〿㐀-䶿一-鿿＀-￯]')
+_SENTENCE_RE = re.compile(r'[^。！？!?\n]*[。！？!?]?')
+
+HistoryItem = namedtuple('HistoryItem', ['key', 'seq', 'header', 'content'])
+HistoryItem.__doc__ = """一条可压缩的历史记录：key 用于缓存摘要，seq 越小越早（越先被压缩）"""
+
+
+def estimate_tokens(text):
+    """粗略估算token数：中文约1字1个token，其余约4个字符1个token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def context_tokens(provider, model):
+    """模型的上下文长度"""
+    model = model or ''
+    for prefix, tokens in MODEL_CONTEXT_TOKENS:
+        if model.startswith(prefix):
+            return tokens
+    return PROVIDER_CONTEXT_TOKENS.get(provider, DEFAULT_CONTEXT_TOKENS)
+
+
+def prompt_budget(db, provider, model):
+    """
+    提示词的token预算
+
+    优先使用配置 {provider}_{model}_prompt_tokens、{provider}_prompt_tokens、prompt_tokens，
+    否则按模型上下文长度扣除输出预留，并不超过 MAX_PROMPT_TOKENS。
+    """
+    for key in (f'{provider}_{model}_prompt_tokens', f'{provider}_prompt_tokens', 'prompt_tokens'):
+        value = get_config(db, key)
+        if value:
+            try:
+                return max(int(value), MIN_PROMPT_TOKENS)
+            except (TypeError, ValueError):
+                print(f"[上下文预算] 配置 {key}={value} 不是整数，已忽略")
+    budget = min(context_tokens(provider, model) - OUTPUT_RESERVE_TOKENS, MAX_PROMPT_TOKENS)
+    return max(budget, MIN_PROMPT_TOKENS)
+
+
+def summarize_text(text, max_tokens=SUMMARY_TOKENS):
+    """
+    抽取式摘要：保留标题、各段首句和含结论性关键词的句子（按原文顺序），直到达到max_tokens
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    picked = []  # (优先级, 行号, 句号, 文本)
+    for line_no, line in enumerate(text.splitlines()):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#') or line.startswith('|'):
+            if line.startswith('#'):
+                picked.append((0, line_no, 0, line))
+            continue
+        sentences = [s.strip() for s in _SENTENCE_RE.findall(line) if s.strip()]
+        for sent_no, sentence in enumerate(sentences):
+            if any(keyword in sentence for keyword in SUMMARY_KEYWORDS):
+                picked.append((0, line_no, sent_no, sentence))
+            elif sent_no == 0:
+                picked.append((1, line_no, sent_no, sentence))
+
+    # 先放标题和结论句，再放段落首句，最后按原文顺序输出
+    chosen = []
+    seen = set()
+    used = 0
+    for rank, line_no, sent_no, sentence in sorted(picked):
+        cost = estimate_tokens(sentence) + 1
+        if sentence in seen or used + cost > max_tokens:
+            continue
+        seen.add(sentence)
+        chosen.append((line_no, sent_no, sentence))
+        used += cost
+    if not chosen:
+        return text[:max_tokens] + '…'
+    chosen.sort()
+    return '\n'.join(sentence for _, _, sentence in chosen) + '\n…'
+
+
+class StepSummaries:
+    """单个辩论任务内的记录摘要缓存（线程安全，分析链在工作线程里也会用）"""
+
+    def __init__(self, max_tokens=SUMMARY_TOKENS):
+        self.max_tokens = max_tokens
+        self._summaries = {}
+        self._lock = threading.Lock()
+        self.generated = 0
+        self.reused = 0
+
+    def get(self, key, text):
+        with self._lock:
+            entry = self._summaries.get(key)
+            if entry is not None and entry[0] == len(text):
+                self.reused += 1
+                return entry[1]
+        summary = summarize_text(text, self.max_tokens)
+        with self._lock:
+            self._summaries[key] = (len(text), summary, estimate_tokens(summary))
+            self.generated += 1
+        return summary
+
+    def tokens(self, key, text):
+        """摘要的token数"""
+        self.get(key, text)
+        with self._lock:
+            return self._summaries[key][2]
+
+
+def fit_sections(budget, fixed, sections, summaries, empty='None'):
+    """
+    在预算内组装若干历史记录区块
+
+    Args:
+        budget: 提示词总token预算
+        fixed: 提示词中固定部分的文本列表（始终完整保留）
+        sections: 每个区块的 HistoryItem 列表（区块内按原顺序输出）
+        summaries: StepSummaries
+        empty: 区块为空时的文本
+
+    Returns:
+        list: 每个区块拼好的文本
+    """
+    available = budget - sum(estimate_tokens(text) for text in fixed)
+    # 每条记录的状态：full / summary / None(省略)
+    entries = []
+    for section_idx, items in enumerate(sections):
+        for item in items:
+            header_tokens = estimate_tokens(item.header) + 1
+            entries.append({
+                'section': section_idx,
+                'item': item,
+                'mode': 'full',
+                'cost': header_tokens + estimate_tokens(item.content),
+                'header_tokens': header_tokens,
+            })
+    total = sum(entry['cost'] for entry in entries)
+    oldest_first = sorted(entries, key=lambda entry: entry['item'].seq)
+
+    # 从最早的记录开始换成摘要
+    for entry in oldest_first:
+        if total <= available:
+            break
+        item = entry['item']
+        summary_cost = entry['header_tokens'] + summaries.tokens(item.key, item.content)
+        if summary_cost < entry['cost']:
+            total -= entry['cost'] - summary_cost
+            entry['mode'], entry['cost'] = 'summary', summary_cost
+    # 仍然超出则省略最早的记录（至少保留最新的一条）
+    for entry in oldest_first[:-1]:
+        if total <= available:
+            break
+        total -= entry['cost']
+        entry['mode'] = None
+
+    rendered = []
+    for section_idx in range(len(sections)):
+        parts = []
+        omitted = 0
+        for entry in entries:
+            if entry['section'] != section_idx:
+                continue
+            item = entry['item']
+            if entry['mode'] is None:
+                omitted += 1
+                continue
+            if entry['mode'] == 'summary':
+                body = f"(summary) {summaries.get(item.key, item.content)}"
+            else:
+                body = item.content
+            parts.append(f"{item.header}\n{body}" if item.header else body)
+        if omitted:
+            parts.insert(0, f"({omitted} earlier entries omitted)")
+        rendered.append("\n\n".join(parts) if parts else empty)
+    return rendered
+
+
+def step_items(steps, header):
+    """辩论步骤（dict）-> HistoryItem 列表；header(step) 给出每条记录的标题"""
+    return [
+        HistoryItem((step['phase'], step['round'], step['agent_id']), step['timestamp'], header(step), step['content'])
+        for step in steps
+    ]
@@ -2,23 +2,88 @@
 # -*- coding: utf-8 -*-
 """数据获取模块 - 从新浪和东方财富API获取股票数据"""
 
-import requests
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 import traceback
 import re
-import json
-from utils import get_stock_code_format, get_secid
+from concurrent.futures import ThreadPoolExecutor
+from utils import get_stock_code_format, get_secid, TTLCache
+from singleflight import coalesce
+from rate_limiter import http_get
+from response_decoder import decode_response, parse_klines, matrix_to_records
+from intraday_bars import get_intraday_buffer
+from bar_resampler import resample_bars, base_datalen, BASE_SCALE, DERIVED_SCALES, SINA_MAX_DATALEN
 
 # ==================== 数据获取函数 ====================
 
+# 5分钟K线最少抓取条数：覆盖综合数据中160根15分钟、80根30分钟K线的重采样需求
+MIN_BASE_DATALEN = base_datalen(15, 160)
+
+def _parse_realtime_fields(code, fields):
+    """解析新浪实时行情字段列表，字段不足时返回None"""
+    if len(fields) < 32:
+        return None
+
+    change_percent = None
+    if fields[2] and fields[3]:
+        try:
+            yesterday_close = float(fields[2])
+            current_price = float(fields[3])
+            change_percent = ((current_price - yesterday_close) / yesterday_close) * 100
+        except:
+            pass
+    
+    # 换手率计算：换手率 = (成交量 / 流通股本) * 100%
+    # 由于新浪API不直接提供换手率，我们需要通过基本面数据计算
+    # 这里先返回None，在comprehensive数据中会计算
+    turnover_rate = None
+    
+    return {
+        'code': code,
+        'name': fields[0],
+        'open': float(fields[1]) if fields[1] else None,
+        'yesterday_close': float(fields[2]) if fields[2] else None,
+        'current_price': float(fields[3]) if fields[3] else None,
+        'high': float(fields[4]) if fields[4] else None,
+        'low': float(fields[5]) if fields[5] else None,
+        'volume': float(fields[8]) if fields[8] else None,
+        'amount': float(fields[9]) if fields[9] else None,
+        'date': fields[30] if len(fields) > 30 else None,
+        'time': fields[31] if len(fields) > 31 else None,
+        'change_percent': change_percent,
+        'turnover_rate': turnover_rate,  # 将在comprehensive数据中计算
+        'bid1_volume': float(fields[10]) if len(fields) > 10 and fields[10] else None,
+        'bid1_price': float(fields[11]) if len(fields) > 11 and fields[11] else None,
+        'bid2_volume': float(fields[12]) if len(fields) > 12 and fields[12] else None,
+        'bid2_price': float(fields[13]) if len(fields) > 13 and fields[13] else None,
+        'bid3_volume': float(fields[14]) if len(fields) > 14 and fields[14] else None,
+        'bid3_price': float(fields[15]) if len(fields) > 15 and fields[15] else None,
+        'bid4_volume': float(fields[16]) if len(fields) > 16 and fields[16] else None,
+        'bid4_price': float(fields[17]) if len(fields) > 17 and fields[17] else None,
+        'bid5_volume': float(fields[18]) if len(fields) > 18 and fields[18] else None,
+        'bid5_price': float(fields[19]) if len(fields) > 19 and fields[19] else None,
+        'ask1_volume': float(fields[20]) if len(fields) > 20 and fields[20] else None,
+        'ask1_price': float(fields[21]) if len(fields) > 21 and fields[21] else None,
+        'ask2_volume': float(fields[22]) if len(fields) > 22 and fields[22] else None,
+        'ask2_price': float(fields[23]) if len(fields) > 23 and fields[23] else None,
+        'ask3_volume': float(fields[24]) if len(fields) > 24 and fields[24] else None,
+        'ask3_price': float(fields[25]) if len(fields) > 25 and fields[25] else None,
+        'ask4_volume': float(fields[26]) if len(fields) > 26 and fields[26] else None,
+        'ask4_price': float(fields[27]) if len(fields) > 27 and fields[27] else None,
+        'ask5_volume': float(fields[28]) if len(fields) > 28 and fields[28] else None,
+        'ask5_price': float(fields[29]) if len(fields) > 29 and fields[29] else None,
+    }
+
+
+@coalesce()
 def get_realtime_data(code):
     """获取实时行情数据"""
     try:
         sina_code = get_stock_code_format(code)
         url = f"http://hq.sinajs.cn/list={sina_code}"
         
-        response = requests.get(url, timeout=5, headers={
+        response = http_get(url, timeout=5, headers={
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Referer': 'http://finance.sina.com.cn'
         })
@@ -28,58 +93,7 @@ def get_realtime_data(code):
             data_str = response.text
             if '=' in data_str:
                 data_part = data_str.split('=')[1].strip().strip('"').strip(';')
-                fields = data_part.split(',')
-                
-                if len(fields) >= 32:
-                    change_percent = None
-                    if fields[2] and fields[3]:
-                        try:
-                            yesterday_close = float(fields[2])
-                            current_price = float(fields[3])
-                            change_percent = ((current_price - yesterday_close) / yesterday_close) * 100
-                        except:
-                            pass
-                    
-                    # 换手率计算：换手率 = (成交量 / 流通股本) * 100%
-                    # 由于新浪API不直接提供换手率，我们需要通过基本面数据计算
-                    # 这里先返回None，在comprehensive数据中会计算
-                    turnover_rate = None
-                    
-                    return {
-                        'code': code,
-                        'name': fields[0],
-                        'open': float(fields[1]) if fields[1] else None,
-                        'yesterday_close': float(fields[2]) if fields[2] else None,
-                        'current_price': float(fields[3]) if fields[3] else None,
-                        'high': float(fields[4]) if fields[4] else None,
-                        'low': float(fields[5]) if fields[5] else None,
-                        'volume': float(fields[8]) if fields[8] else None,
-                        'amount': float(fields[9]) if fields[9] else None,
-                        'date': fields[30] if len(fields) > 30 else None,
-                        'time': fields[31] if len(fields) > 31 else None,
-                        'change_percent': change_percent,
-                        'turnover_rate': turnover_rate,  # 将在comprehensive数据中计算
-                        'bid1_volume': float(fields[10]) if len(fields) > 10 and fields[10] else None,
-                        'bid1_price': float(fields[11]) if len(fields) > 11 and fields[11] else None,
-                        'bid2_volume': float(fields[12]) if len(fields) > 12 and fields[12] else None,
-                        'bid2_price': float(fields[13]) if len(fields) > 13 and fields[13] else None,
-                        'bid3_volume': float(fields[14]) if len(fields) > 14 and fields[14] else None,
-                        'bid3_price': float(fields[15]) if len(fields) > 15 and fields[15] else None,
-                        'bid4_volume': float(fields[16]) if len(fields) > 16 and fields[16] else None,
-                        'bid4_price': float(fields[17]) if len(fields) > 17 and fields[17] else None,
-                        'bid5_volume': float(fields[18]) if len(fields) > 18 and fields[18] else None,
-                        'bid5_price': float(fields[19]) if len(fields) > 19 and fields[19] else None,
-                        'ask1_volume': float(fields[20]) if len(fields) > 20 and fields[20] else None,
-                        'ask1_price': float(fields[21]) if len(fields) > 21 and fields[21] else None,
-                        'ask2_volume': float(fields[22]) if len(fields) > 22 and fields[22] else None,
-                        'ask2_price': float(fields[23]) if len(fields) > 23 and fields[23] else None,
-                        'ask3_volume': float(fields[24]) if len(fields) > 24 and fields[24] else None,
-                        'ask3_price': float(fields[25]) if len(fields) > 25 and fields[25] else None,
-                        'ask4_volume': float(fields[26]) if len(fields) > 26 and fields[26] else None,
-                        'ask4_price': float(fields[27]) if len(fields) > 27 and fields[27] else None,
-                        'ask5_volume': float(fields[28]) if len(fields) > 28 and fields[28] else None,
-                        'ask5_price': float(fields[29]) if len(fields) > 29 and fields[29] else None,
-                    }
+                return _parse_realtime_fields(code, data_part.split(','))
         return None
     except Exception as e:
         print(f"[API] 获取实时数据失败 {code}: {e}")
@@ -87,8 +101,92 @@ def get_realtime_data(code):
         return None
 
 
+def get_realtime_data_batch(codes, chunk_size=200):
+    """
+    批量获取实时行情（新浪接口单次请求支持多个代码）
+    
+    Args:
+        codes: 股票代码列表
+        chunk_size: 每次请求的代码数量
+    
+    Returns:
+        dict: {code: 实时行情dict}，获取失败的代码不在结果中
+    """
+    result = {}
+    sina_to_code = {}
+    for code in codes:
+        sina_to_code[get_stock_code_format(code)] = code
+    sina_codes = list(sina_to_code.keys())
+    
+    for i in range(0, len(sina_codes), chunk_size):
+        chunk = sina_codes[i:i + chunk_size]
+        try:
+            url = f"http://hq.sinajs.cn/list={','.join(chunk)}"
+            response = http_get(url, timeout=5, headers={
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+                'Referer': 'http://finance.sina.com.cn'
+            })
+            response.encoding = 'gbk'
+            if response.status_code != 200:
+                continue
+            
+            # 每行格式：var hq_str_sh600000="字段1,字段2,...";
+            for line in response.text.split('\n'):
+                if 'hq_str_' not in line or '=' not in line:
+                    continue
+                key, data_part = line.split('=', 1)
+                sina_code = key.rsplit('hq_str_', 1)[-1].strip()
+                code = sina_to_code.get(sina_code)
+                if code is None:
+                    continue
+                data_part = data_part.strip().strip(';').strip('"')
+                parsed = _parse_realtime_fields(code, data_part.split(','))
+                if parsed:
+                    result[code] = parsed
+        except Exception as e:
+            print(f"[API] 批量获取实时数据失败 {chunk[:3]}...: {e}")
+            traceback.print_exc()
+    
+    return result
+
+
+@coalesce()
 def get_minute_kline(code, scale=5, datalen=240):
-    """获取分钟K线数据"""
+    """
+    获取分钟K线数据
+    
+    短时内优先复用该股票日内缓冲区中已抓取的K线；15/30/60分钟K线由同一份5分钟K线重采样得到，
+    5分钟K线每次至少抓取 MIN_BASE_DATALEN 条，足够覆盖综合数据所需的15/30分钟K线。
+    """
+    try:
+        buffer = get_intraday_buffer(code)
+        cached = buffer.get_bars(scale, datalen)
+        if cached is not None:
+            return cached
+        
+        if scale in DERIVED_SCALES:
+            need = base_datalen(scale, datalen)
+            if need <= SINA_MAX_DATALEN:
+                base_df = get_minute_kline(code, scale=BASE_SCALE, datalen=need)
+                if base_df is not None and len(base_df) > 0 and 'datetime' in base_df.columns:
+                    df = resample_bars(base_df, scale)
+                    buffer.put_bars(scale, datalen, df)
+                    return df.iloc[-datalen:].reset_index(drop=True)
+        
+        fetch_len = max(datalen, MIN_BASE_DATALEN) if scale == BASE_SCALE else datalen
+        df = fetch_minute_kline(code, scale=scale, datalen=fetch_len)
+        if df is None:
+            return None
+        buffer.put_bars(scale, fetch_len, df)
+        return df.iloc[-datalen:].reset_index(drop=True)
+    except Exception as e:
+        print(f"[API] 获取分钟K线失败 {code} scale={scale}: {e}")
+        traceback.print_exc()
+        return None
+
+
+def fetch_minute_kline(code, scale=5, datalen=240):
+    """直接从新浪获取分钟K线数据（不经过缓冲区和重采样）"""
     try:
         sina_code = get_stock_code_format(code)
         url = f"http://money.finance.sina.com.cn/quotes_service/api/json_v2.php/CN_MarketData.getKLineData"
@@ -96,10 +194,10 @@ def get_minute_kline(code, scale=5, datalen=240):
             'symbol': sina_code,
             'scale': scale,
             'ma': 'no',
-            'datalen': min(datalen, 1023)
+            'datalen': min(datalen, SINA_MAX_DATALEN)
         }
         
-        response = requests.get(url, params=params, timeout=10, headers={
+        response = http_get(url, params=params, timeout=10, headers={
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Referer': 'http://finance.sina.com.cn'
         })
@@ -123,9 +221,35 @@ def get_minute_kline(code, scale=5, datalen=240):
         return None
 
 
+def expand_bars_to_timeline(bars_df, minutes=5):
+    """
+    将分钟K线展开为伪分时数据：每根K线复制为minutes个点，时间依次加1分钟，
+    价格取收盘价，成交量均分，成交额 = 价格 × 成交量（成交量非正时为0）
+    """
+    if bars_df is None or len(bars_df) == 0 or 'datetime' not in bars_df.columns or 'close' not in bars_df.columns:
+        return None
+    count = len(bars_df)
+    offsets = np.tile(np.arange(minutes, dtype='int64'), count) * np.timedelta64(1, 'm')
+    datetimes = np.repeat(bars_df['datetime'].to_numpy(), minutes) + offsets
+    price = np.repeat(bars_df['close'].to_numpy(dtype='float64'), minutes)
+    if 'volume' in bars_df.columns:
+        volume = np.repeat(bars_df['volume'].to_numpy(dtype='float64') / minutes, minutes)
+    else:
+        volume = np.zeros(count * minutes)
+    with np.errstate(invalid='ignore'):
+        amount = np.where(volume > 0, price * volume, 0.0)
+    return pd.DataFrame({'datetime': datetimes, 'price': price, 'volume': volume, 'amount': amount})
+
+
+@coalesce()
 def get_timeline_data(code):
     """获取分时数据（每分钟的数据点）"""
     try:
+        buffer = get_intraday_buffer(code)
+        cached = buffer.get_timeline()
+        if cached is not None:
+            return cached
+        
         sina_code = get_stock_code_format(code)
         
         # 方法1：尝试使用新浪分时数据接口
@@ -133,7 +257,7 @@ def get_timeline_data(code):
         params1 = {'symbol': sina_code, 'scale': 1}
         
         try:
-            response = requests.get(url1, params=params1, timeout=10, headers={
+            response = http_get(url1, params=params1, timeout=10, headers={
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
                 'Referer': 'http://finance.sina.com.cn'
             })
@@ -159,31 +283,18 @@ def get_timeline_data(code):
                         df = df.sort_values('datetime').reset_index(drop=True)
                     
                     if len(df) > 0:
-                        return df
+                        buffer.put_timeline(df)
+                        return df.copy()
         except Exception as e:
             print(f"[API] 方法1获取分时数据失败: {e}")
         
-        # 方法2：从5分钟K线数据中提取（作为备选）
+        # 方法2：从5分钟K线数据中提取（作为备选；5分钟K线优先取自日内缓冲区）
         print(f"[API] 尝试从5分钟K线提取分时数据...")
         minute_5_df = get_minute_kline(code, scale=5, datalen=48)
-        if minute_5_df is not None and len(minute_5_df) > 0:
-            timeline_list = []
-            for idx, row in minute_5_df.iterrows():
-                if 'datetime' in row and 'close' in row:
-                    base_time = row['datetime']
-                    price = row['close']
-                    volume = row.get('volume', 0) / 5 if 'volume' in row else 0
-                    
-                    for i in range(5):
-                        timeline_list.append({
-                            'datetime': base_time + pd.Timedelta(minutes=i),
-                            'price': price,
-                            'volume': volume,
-                            'amount': price * volume if volume > 0 else 0
-                        })
-            
-            if timeline_list:
-                return pd.DataFrame(timeline_list)
+        df = expand_bars_to_timeline(minute_5_df, 5)
+        if df is not None:
+            buffer.put_timeline(df)
+            return df.copy()
         
         return None
     except Exception as e:
@@ -192,6 +303,7 @@ def get_timeline_data(code):
         return None
 
 
+@coalesce()
 def get_daily_kline(code, count=240):
     """获取日K线数据"""
     try:
@@ -204,7 +316,7 @@ def get_daily_kline(code, count=240):
             'datalen': min(count, 1023)
         }
         
-        response = requests.get(url, params=params, timeout=10, headers={
+        response = http_get(url, params=params, timeout=10, headers={
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Referer': 'http://finance.sina.com.cn'
         })
@@ -228,6 +340,7 @@ def get_daily_kline(code, count=240):
         return None
 
 
+@coalesce()
 def get_sector_info(code):
     """
     获取股票的板块/行业信息
@@ -239,7 +352,7 @@ def get_sector_info(code):
         # 方法1：从新浪股票基本信息页面获取
         try:
             url = f"http://vip.stock.finance.sina.com.cn/corp/go.php/vCI_CorpInfo/stockid/{code}.phtml"
-            response = requests.get(url, timeout=5, headers={
+            response = http_get(url, timeout=5, headers={
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
                 'Referer': 'http://finance.sina.com.cn'
             })
@@ -275,7 +388,7 @@ def get_sector_info(code):
             # 尝试获取概念板块
             url = f"http://vip.stock.finance.sina.com.cn/quotes_service/api/json_v2.php/Market_Center.getStockNode"
             params = {'symbol': sina_code}
-            response = requests.get(url, params=params, timeout=5, headers={
+            response = http_get(url, params=params, timeout=5, headers={
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
                 'Referer': 'http://finance.sina.com.cn'
             })
@@ -304,6 +417,7 @@ def get_sector_info(code):
         return []
 
 
+@coalesce()
 def get_money_flow(code):
     """
     获取股票的资金流向数据（今日数据，使用东方财富ulist.np接口）
@@ -343,24 +457,13 @@ def get_money_flow(code):
         }
         
         try:
-            response = requests.get(url, params=params, timeout=5, headers={
+            response = http_get(url, params=params, timeout=5, headers={
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
                 'Referer': 'http://data.eastmoney.com'
             })
             
             if response.status_code == 200:
-                text = response.text
-                
-                # 提取JSON（可能是JSONP格式）
-                if '(' in text and '{' in text:
-                    match = re.search(r'\{.*\}', text, re.DOTALL)
-                    if match:
-                        json_str = match.group(0)
-                        data = json.loads(json_str)
-                    else:
-                        data = json.loads(text)
-                else:
-                    data = json.loads(text)
+                data = decode_response(response)
                 
                 if isinstance(data, dict) and 'data' in data:
                     stock_data = data['data']
@@ -440,16 +543,49 @@ def get_money_flow(code):
         }
 
 
-def get_money_flow_history(code, days=60):
+MONEY_FLOW_NET_FIELDS = ['main_net_inflow', 'super_large_net_inflow', 'large_net_inflow',
+                         'medium_net_inflow', 'small_net_inflow']
+# 历史资金流向 klines 中净流入之后的字段（依次为第6~12列）
+MONEY_FLOW_HISTORY_EXTRA_FIELDS = [
+    'main_net_ratio', 'super_large_net_ratio', 'large_net_ratio', 'medium_net_ratio', 'small_net_ratio',  # %
+    'close',  # 收盘价
+    'change_percent',  # 涨跌幅
+]
+
+
+def parse_money_flow_klines(klines, min_fields, extra_fields=()):
     """
-    获取股票的历史资金流向数据（日线）
+    资金流向 klines 批量解析为矩阵（净流入换算为万元）
+
+    Returns:
+        tuple: (时间标签数组, 矩阵)，矩阵列依次为 MONEY_FLOW_NET_FIELDS + extra_fields，缺失为NaN
+    """
+    labels, values = parse_klines(klines, min_fields=min_fields)
+    width = len(MONEY_FLOW_NET_FIELDS) + len(extra_fields)
+    if values.shape[1] < width:
+        values = np.hstack([values, np.full((len(values), width - values.shape[1]), np.nan)])
+    values = values[:, :width].copy()
+    values[:, :len(MONEY_FLOW_NET_FIELDS)] /= 10000  # 万元
+    return labels, values
+
+
+def _money_flow_records(klines, time_key, min_fields, extra_fields=()):
+    """资金流向 klines 批量解析为记录列表（缺失值为None）"""
+    labels, values = parse_money_flow_klines(klines, min_fields, extra_fields)
+    return matrix_to_records(labels, time_key, values, MONEY_FLOW_NET_FIELDS + list(extra_fields))
+
+@coalesce()
+def get_money_flow_history_matrix(code, days=60):
+    """
+    获取股票的历史资金流向数据（日线），列式返回
     
     Args:
         code: 股票代码
-        days: 获取天数，0表示获取所有数据
+        days: 获取最近天数，0表示获取所有数据
     
     Returns:
-        list: 历史资金流向数据列表，每个元素包含日期、各类型净流入、净比等
+        tuple: (日期数组, 矩阵)，矩阵列依次为 MONEY_FLOW_NET_FIELDS + MONEY_FLOW_HISTORY_EXTRA_FIELDS；
+               请求失败或数据格式异常返回None
     """
     try:
         secid = get_secid(code)
@@ -464,80 +600,59 @@ def get_money_flow_history(code, days=60):
             'secid': secid,
         }
         
-        try:
-            response = requests.get(url, params=params, timeout=10, headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Referer': 'http://data.eastmoney.com'
-            })
-            
-            if response.status_code == 200:
-                text = response.text
-                
-                # 提取JSON（可能是JSONP格式）
-                if '(' in text and '{' in text:
-                    match = re.search(r'\{.*\}', text, re.DOTALL)
-                    if match:
-                        json_str = match.group(0)
-                        data = json.loads(json_str)
-                    else:
-                        data = json.loads(text)
-                else:
-                    data = json.loads(text)
-                
-                if isinstance(data, dict) and 'data' in data and data['data']:
-                    klines = data['data'].get('klines', [])
-                    
-                    result = []
-                    for kline in klines:
-                        # kline格式：日期,主力净流入,超大单净流入,大单净流入,中单净流入,小单净流入,主力净比,超大单净比,大单净比,中单净比,小单净比,收盘价,涨跌幅,?,?
-                        fields = kline.split(',')
-                        if len(fields) >= 12:
-                            try:
-                                record = {
-                                    'date': fields[0],
-                                    'main_net_inflow': float(fields[1]) / 10000 if fields[1] else None,  # 万元
-                                    'super_large_net_inflow': float(fields[2]) / 10000 if fields[2] else None,
-                                    'large_net_inflow': float(fields[3]) / 10000 if fields[3] else None,
-                                    'medium_net_inflow': float(fields[4]) / 10000 if fields[4] else None,
-                                    'small_net_inflow': float(fields[5]) / 10000 if fields[5] else None,
-                                    'main_net_ratio': float(fields[6]) if fields[6] else None,  # %
-                                    'super_large_net_ratio': float(fields[7]) if fields[7] else None,
-                                    'large_net_ratio': float(fields[8]) if fields[8] else None,
-                                    'medium_net_ratio': float(fields[9]) if fields[9] else None,
-                                    'small_net_ratio': float(fields[10]) if fields[10] else None,
-                                    'close': float(fields[11]) if fields[11] else None,  # 收盘价
-                                    'change_percent': float(fields[12]) if len(fields) > 12 and fields[12] else None,  # 涨跌幅
-                                }
-                                result.append(record)
-                            except (ValueError, IndexError) as e:
-                                continue
-                    
-                    print(f"[API] 成功获取历史资金流向数据，共 {len(result)} 条")
-                    return result
-                else:
-                    print(f"[API] 历史资金流向API返回数据格式异常")
-        except Exception as e:
-            print(f"[API] 获取历史资金流向失败: {e}")
-            traceback.print_exc()
+        response = http_get(url, params=params, timeout=10, headers={
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'Referer': 'http://data.eastmoney.com'
+        })
         
-        return []
+        if response.status_code == 200:
+            data = decode_response(response)
+            
+            if isinstance(data, dict) and 'data' in data and data['data']:
+                klines = data['data'].get('klines', [])
+                # kline格式：日期,主力净流入,超大单净流入,大单净流入,中单净流入,小单净流入,主力净比,超大单净比,大单净比,中单净比,小单净比,收盘价,涨跌幅,?,?
+                return parse_money_flow_klines(klines, 12, MONEY_FLOW_HISTORY_EXTRA_FIELDS)
+            print(f"[API] 历史资金流向API返回数据格式异常")
+        return None
     except Exception as e:
         print(f"[API] 获取历史资金流向失败 {code}: {e}")
         traceback.print_exc()
+        return None
+
+
+def get_money_flow_history(code, days=60):
+    """
+    获取股票的历史资金流向数据（日线）
+    
+    Args:
+        code: 股票代码
+        days: 获取天数，0表示获取所有数据
+    
+    Returns:
+        list: 历史资金流向数据列表，每个元素包含日期、各类型净流入、净比等
+    """
+    result = get_money_flow_history_matrix(code, days=days)
+    if result is None:
         return []
+    labels, values = result
+    records = matrix_to_records(labels, 'date', values, MONEY_FLOW_NET_FIELDS + MONEY_FLOW_HISTORY_EXTRA_FIELDS)
+    print(f"[API] 成功获取历史资金流向数据，共 {len(records)} 条")
+    return records
 
 
-def get_money_flow_realtime_kline(code, klt=1, lmt=0):
+@coalesce()
+def get_money_flow_realtime_matrix(code, klt=1, lmt=0):
     """
-    获取股票的实时资金流向分钟线数据
+    获取股票的实时资金流向分钟线数据，列式返回
     
     Args:
         code: 股票代码
         klt: K线类型，1=1分钟，5=5分钟
-        lmt: 限制条数，0表示获取所有数据
+        lmt: 限制条数（取最近lmt条），0表示获取所有数据
     
     Returns:
-        list: 分钟线资金流向数据列表
+        tuple: (时间数组, 矩阵)，矩阵列为 MONEY_FLOW_NET_FIELDS（当日累计净流入，万元）；
+               请求失败或数据格式异常返回None
     """
     try:
         secid = get_secid(code)
@@ -552,64 +667,50 @@ def get_money_flow_realtime_kline(code, klt=1, lmt=0):
             'secid': secid,
         }
         
-        try:
-            response = requests.get(url, params=params, timeout=10, headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Referer': 'http://data.eastmoney.com'
-            })
-            
-            if response.status_code == 200:
-                text = response.text
-                
-                # 提取JSON（可能是JSONP格式）
-                if '(' in text and '{' in text:
-                    match = re.search(r'\{.*\}', text, re.DOTALL)
-                    if match:
-                        json_str = match.group(0)
-                        data = json.loads(json_str)
-                    else:
-                        data = json.loads(text)
-                else:
-                    data = json.loads(text)
-                
-                if isinstance(data, dict) and 'data' in data and data['data']:
-                    klines = data['data'].get('klines', [])
-                    
-                    result = []
-                    for kline in klines:
-                        # kline格式：时间,主力净流入,超大单净流入,大单净流入,中单净流入,小单净流入
-                        fields = kline.split(',')
-                        if len(fields) >= 6:
-                            try:
-                                record = {
-                                    'time': fields[0],
-                                    'main_net_inflow': float(fields[1]) / 10000 if fields[1] else None,  # 万元
-                                    'super_large_net_inflow': float(fields[2]) / 10000 if fields[2] else None,
-                                    'large_net_inflow': float(fields[3]) / 10000 if fields[3] else None,
-                                    'medium_net_inflow': float(fields[4]) / 10000 if fields[4] else None,
-                                    'small_net_inflow': float(fields[5]) / 10000 if fields[5] else None,
-                                }
-                                result.append(record)
-                            except (ValueError, IndexError) as e:
-                                continue
-                    
-                    print(f"[API] 成功获取实时资金流向分钟线数据，共 {len(result)} 条")
-                    return result
-                else:
-                    print(f"[API] 实时资金流向分钟线API返回数据格式异常")
-        except Exception as e:
-            print(f"[API] 获取实时资金流向分钟线失败: {e}")
-            traceback.print_exc()
+        response = http_get(url, params=params, timeout=10, headers={
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'Referer': 'http://data.eastmoney.com'
+        })
         
-        return []
+        if response.status_code == 200:
+            data = decode_response(response)
+            
+            if isinstance(data, dict) and 'data' in data and data['data']:
+                klines = data['data'].get('klines', [])
+                # kline格式：时间,主力净流入,超大单净流入,大单净流入,中单净流入,小单净流入
+                return parse_money_flow_klines(klines, 6)
+            print(f"[API] 实时资金流向分钟线API返回数据格式异常")
+        return None
     except Exception as e:
         print(f"[API] 获取实时资金流向分钟线失败 {code}: {e}")
         traceback.print_exc()
+        return None
+
+
+def get_money_flow_realtime_kline(code, klt=1, lmt=0):
+    """
+    获取股票的实时资金流向分钟线数据
+    
+    Args:
+        code: 股票代码
+        klt: K线类型，1=1分钟，5=5分钟
+        lmt: 限制条数，0表示获取所有数据
+    
+    Returns:
+        list: 分钟线资金流向数据列表
+    """
+    result = get_money_flow_realtime_matrix(code, klt=klt, lmt=lmt)
+    if result is None:
         return []
+    labels, values = result
+    records = matrix_to_records(labels, 'time', values, MONEY_FLOW_NET_FIELDS)
+    print(f"[API] 成功获取实时资金流向分钟线数据，共 {len(records)} 条")
+    return records
 
 
 # ==================== 基本面数据获取函数 ====================
 
+@coalesce()
 def get_fundamental_data(code):
     """
     获取股票的基本面数据（使用东方财富API）
@@ -664,24 +765,13 @@ def get_fundamental_data(code):
         }
         
         try:
-            response = requests.get(url, params=params, timeout=10, headers={
+            response = http_get(url, params=params, timeout=10, headers={
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
                 'Referer': 'http://quote.eastmoney.com'
             })
             
             if response.status_code == 200:
-                text = response.text
-                
-                # 提取JSON（可能是JSONP格式）
-                if '(' in text and '{' in text:
-                    match = re.search(r'\{.*\}', text, re.DOTALL)
-                    if match:
-                        json_str = match.group(0)
-                        data = json.loads(json_str)
-                    else:
-                        data = json.loads(text)
-                else:
-                    data = json.loads(text)
+                data = decode_response(response)
                 
                 if isinstance(data, dict) and 'data' in data:
                     d = data['data']
@@ -847,6 +937,7 @@ def get_fundamental_data(code):
 
 # ==================== 行业对比数据获取函数 ====================
 
+@coalesce()
 def get_industry_comparison(code, sector_info=None):
     """
     获取股票的行业对比数据（使用东方财富API）
@@ -885,21 +976,13 @@ def get_industry_comparison(code, sector_info=None):
                 'spt': '1'
             }
             
-            response1 = requests.get(url1, params=params1, timeout=8, headers={
+            response1 = http_get(url1, params=params1, timeout=8, headers={
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
                 'Referer': 'http://quote.eastmoney.com'
             })
             
             if response1.status_code == 200:
-                text1 = response1.text
-                if '(' in text1 and '{' in text1:
-                    match1 = re.search(r'\{.*\}', text1, re.DOTALL)
-                    if match1:
-                        data1 = json.loads(match1.group(0))
-                    else:
-                        data1 = json.loads(text1)
-                else:
-                    data1 = json.loads(text1)
+                data1 = decode_response(response1)
                 
                 if isinstance(data1, dict) and 'data' in data1 and 'diff' in data1['data']:
                     items = data1['data']['diff']
@@ -930,21 +1013,13 @@ def get_industry_comparison(code, sector_info=None):
                             'dect': '1'
                         }
                         
-                        response2 = requests.get(url2, params=params2, timeout=8, headers={
+                        response2 = http_get(url2, params=params2, timeout=8, headers={
                             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
                             'Referer': 'http://quote.eastmoney.com'
                         })
                         
                         if response2.status_code == 200:
-                            text2 = response2.text
-                            if '(' in text2 and '{' in text2:
-                                match2 = re.search(r'\{.*\}', text2, re.DOTALL)
-                                if match2:
-                                    data2 = json.loads(match2.group(0))
-                                else:
-                                    data2 = json.loads(text2)
-                            else:
-                                data2 = json.loads(text2)
+                            data2 = decode_response(response2)
                             
                             if isinstance(data2, dict) and 'data' in data2 and 'diff' in data2['data']:
                                 stocks = data2['data']['diff']
@@ -1044,21 +1119,13 @@ def get_industry_comparison(code, sector_info=None):
             }
             
             try:
-                response = requests.get(url, params=params, timeout=8, headers={
+                response = http_get(url, params=params, timeout=8, headers={
                     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
                     'Referer': 'http://quote.eastmoney.com'
                 })
                 
                 if response.status_code == 200:
-                    text = response.text
-                    if '(' in text and '{' in text:
-                        match = re.search(r'\{.*\}', text, re.DOTALL)
-                        if match:
-                            data = json.loads(match.group(0))
-                        else:
-                            data = json.loads(text)
-                    else:
-                        data = json.loads(text)
+                    data = decode_response(response)
                     
                     if isinstance(data, dict) and 'data' in data and 'diff' in data['data']:
                         stocks = data['data']['diff']
@@ -1116,20 +1183,40 @@ def get_industry_comparison(code, sector_info=None):
 
 # ==================== 舆情数据获取函数 ====================
 
-def get_news_from_stock(code, days=7):
+NEWS_CACHE_TTL = 120  # 新闻缓存秒数
+LATEST_POSTS_CACHE_TTL = 60  # 最新帖子缓存秒数
+HOT_POSTS_CACHE_TTL = 300  # 热门帖子变化很慢，缓存更久
+SENTIMENT_CACHE_SIZE = 256  # 每类缓存最多保存的条目数（LRU淘汰）
+GUBA_SORT_TYPES = {'latest': '1', 'hot': '2'}
+
+_news_cache = TTLCache(maxsize=SENTIMENT_CACHE_SIZE, ttl=NEWS_CACHE_TTL)
+_posts_cache = TTLCache(maxsize=SENTIMENT_CACHE_SIZE * 2)
+_sentiment_executor = ThreadPoolExecutor(max_workers=6, thread_name_prefix='sentiment')
+
+
+def _copy_items(items):
+    """缓存和合并请求的结果由多个调用方共享，返回给调用方的是各自的副本（条目都是扁平dict）"""
+    return None if items is None else [dict(item) for item in items]
+
+
+def fetch_stock_news(code):
     """
-    获取股票相关新闻
-    
-    Args:
-        code: 股票代码
-        days: 获取最近几天的新闻，默认7天
+    从东方财富获取股票相关新闻（不做日期过滤，结果缓存 NEWS_CACHE_TTL 秒）
     
     Returns:
-        list: 新闻列表
+        list: 新闻列表（调用方可自由修改）；请求失败返回None
     """
+    return _copy_items(_fetch_stock_news(code))
+
+
+@coalesce('fetch_stock_news')
+def _fetch_stock_news(code):
+    code_str = str(code).strip()
+    cached = _news_cache.get(code_str)
+    if cached is not None:
+        return cached
     try:
         # 根据股票代码获取secid格式
-        code_str = str(code).strip()
         if code_str.startswith('6'):
             secid = f"1.{code_str}"  # 上海A股
         elif code_str.startswith(('0', '3')):
@@ -1148,18 +1235,17 @@ def get_news_from_stock(code, days=7):
         
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Referer': f'https://quote.eastmoney.com/sh{code}.html' if code.startswith('6') else f'https://quote.eastmoney.com/sz{code}.html',
+            'Referer': f'https://quote.eastmoney.com/sh{code_str}.html' if code_str.startswith('6') else f'https://quote.eastmoney.com/sz{code_str}.html',
             'Accept': '*/*'
         }
         
-        response = requests.get(url, params=params, headers=headers, timeout=10)
+        response = http_get(url, params=params, headers=headers, timeout=10)
         
         if response.status_code == 200:
-            data = json.loads(response.text)
+            data = decode_response(response)
             if isinstance(data, dict) and 'data' in data and 'list' in data['data']:
-                items = data['data']['list']
                 news_list = []
-                for item in items:
+                for item in data['data']['list']:
                     if isinstance(item, dict):
                         news_item = {
                             'title': item.get('Art_Title', ''),
@@ -1171,96 +1257,84 @@ def get_news_from_stock(code, days=7):
                         }
                         if news_item['title']:
                             news_list.append(news_item)
-                
-                # 过滤指定天数内的新闻
-                if days > 0:
-                    filtered_news = []
-                    today = datetime.now().date()
-                    for news in news_list:
-                        try:
-                            if news.get('time'):
-                                news_time = datetime.strptime(news['time'], '%Y-%m-%d %H:%M:%S')
-                                news_date = news_time.date()
-                                days_ago_date = today - timedelta(days=days)
-                                if news_date >= days_ago_date:
-                                    filtered_news.append(news)
-                            else:
-                                filtered_news.append(news)
-                        except:
-                            filtered_news.append(news)  # 解析失败也保留
-                    news_list = filtered_news
-                
+                _news_cache.set(code_str, news_list)
                 return news_list
         
-        return []
+        return None
     except Exception as e:
-        return []
+        print(f"[API] 获取新闻失败 {code_str}: {e}")
+        return None
 
 
-def get_guba_posts(code, latest_count=10, hot_count=10):
+def _filter_recent_news(news_list, days):
+    """过滤指定天数内的新闻（无时间或时间解析失败的保留）"""
+    if days <= 0:
+        return list(news_list)
+    days_ago_date = datetime.now().date() - timedelta(days=days)
+    filtered_news = []
+    for news in news_list:
+        try:
+            if news.get('time'):
+                news_date = datetime.strptime(news['time'], '%Y-%m-%d %H:%M:%S').date()
+                if news_date >= days_ago_date:
+                    filtered_news.append(news)
+            else:
+                filtered_news.append(news)
+        except:
+            filtered_news.append(news)  # 解析失败也保留
+    return filtered_news
+
+
+def get_news_from_stock(code, days=7):
     """
-    获取股吧帖子（最新+热门）
+    获取股票相关新闻
     
     Args:
         code: 股票代码
-        latest_count: 最新帖子数量
-        hot_count: 热门帖子数量
+        days: 获取最近几天的新闻，默认7天
     
     Returns:
-        list: 帖子列表
+        list: 新闻列表
+    """
+    news_list = fetch_stock_news(code)
+    return _filter_recent_news(news_list, days) if news_list else []
+
+
+def fetch_guba_list(code, sort_type='latest', count=10, page=1):
     """
+    获取股吧帖子列表（单一排序），结果按排序类型缓存
+    
+    Args:
+        code: 股票代码
+        sort_type: 'latest'=最新，'hot'=热门
+        count: 帖子数量（每页）
+        page: 页码，从1开始
+    
+    Returns:
+        list: 帖子列表（调用方可自由修改）；请求失败返回None
+    """
+    return _copy_items(_fetch_guba_list(code, sort_type, count, page))
+
+
+@coalesce('fetch_guba_list')
+def _fetch_guba_list(code, sort_type, count, page):
+    code_str = str(code).strip()
+    cache_key = (code_str, sort_type, count, page)
+    cached = _posts_cache.get(cache_key)
+    if cached is not None:
+        return cached
     try:
         url = "https://gbapi.eastmoney.com/webarticlelist/api/Article/Articlelist"
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Referer': f'https://guba.eastmoney.com/list,{code},99.html',
+            'Referer': f'https://guba.eastmoney.com/list,{code_str},99.html',
             'Accept': 'application/json'
         }
-        
-        all_posts = []
-        post_ids = set()  # 用于去重
-        
-        # 1. 获取最新帖子
-        params_latest = {
-            'code': code,
-            'sorttype': '1',  # 1=最新
-            'ps': str(latest_count),
-            'from': 'CommonBaPost',
-            'deviceid': 'quoteweb',
-            'version': '200',
-            'product': 'Guba',
-            'plat': 'Web',
-            'needzd': 'true'
-        }
-        
-        response_latest = requests.get(url, params=params_latest, headers=headers, timeout=10)
-        if response_latest.status_code == 200:
-            data = json.loads(response_latest.text)
-            if isinstance(data, dict) and 're' in data and isinstance(data['re'], list):
-                for article in data['re']:
-                    if isinstance(article, dict):
-                        post_id = article.get('post_id')
-                        if post_id and post_id not in post_ids:
-                            post_ids.add(post_id)
-                            post_item = {
-                                'post_id': post_id,
-                                'title': article.get('post_title', ''),
-                                'url': article.get('post_url', ''),
-                                'author': article.get('user_nickname', ''),
-                                'read_count': article.get('post_click_count', 0),
-                                'comment_count': article.get('post_comment_count', 0),
-                                'time': article.get('post_publish_time', ''),
-                                'type': 'forum',
-                                'sort_type': 'latest'
-                            }
-                            if post_item['title']:
-                                all_posts.append(post_item)
-        
-        # 2. 获取热门帖子
-        params_hot = {
-            'code': code,
-            'sorttype': '2',  # 2=热门
-            'ps': str(hot_count),
+        params = {
+            'code': code_str,
+            'sorttype': GUBA_SORT_TYPES[sort_type],  # 1=最新，2=热门
+            'ps': str(count),
+            'p': str(page),
             'from': 'CommonBaPost',
             'deviceid': 'quoteweb',
             'version': '200',
@@ -1269,35 +1343,79 @@ def get_guba_posts(code, latest_count=10, hot_count=10):
             'needzd': 'true'
         }
         
-        response_hot = requests.get(url, params=params_hot, headers=headers, timeout=10)
-        if response_hot.status_code == 200:
-            try:
-                data = json.loads(response_hot.text)
-                if isinstance(data, dict) and 're' in data and isinstance(data['re'], list):
-                    for article in data['re']:
-                        if isinstance(article, dict):
-                            post_id = article.get('post_id')
-                            if post_id and post_id not in post_ids:
-                                post_ids.add(post_id)
-                                post_item = {
-                                    'post_id': post_id,
-                                    'title': article.get('post_title', ''),
-                                    'url': article.get('post_url', ''),
-                                    'author': article.get('user_nickname', ''),
-                                    'read_count': article.get('post_click_count', 0),
-                                    'comment_count': article.get('post_comment_count', 0),
-                                    'time': article.get('post_publish_time', ''),
-                                    'type': 'forum',
-                                    'sort_type': 'hot'
-                                }
-                                if post_item['title']:
-                                    all_posts.append(post_item)
-            except json.JSONDecodeError:
-                pass
+        response = http_get(url, params=params, headers=headers, timeout=10)
+        if response.status_code != 200:
+            return None
+        data = decode_response(response)
+        if not (isinstance(data, dict) and 're' in data and isinstance(data['re'], list)):
+            return None
         
-        return all_posts
+        posts = []
+        for article in data['re']:
+            if isinstance(article, dict) and article.get('post_id'):
+                post_item = {
+                    'post_id': article.get('post_id'),
+                    'title': article.get('post_title', ''),
+                    'url': article.get('post_url', ''),
+                    'author': article.get('user_nickname', ''),
+                    'read_count': article.get('post_click_count', 0),
+                    'comment_count': article.get('post_comment_count', 0),
+                    'time': article.get('post_publish_time', ''),
+                    'type': 'forum',
+                    'sort_type': sort_type
+                }
+                if post_item['title']:
+                    posts.append(post_item)
+        ttl = HOT_POSTS_CACHE_TTL if sort_type == 'hot' else LATEST_POSTS_CACHE_TTL
+        _posts_cache.set(cache_key, posts, ttl=ttl)
+        return posts
     except Exception as e:
-        return []
+        print(f"[API] 获取股吧{sort_type}帖子失败 {code_str}: {e}")
+        return None
+
+
+def merge_guba_posts(latest_posts, hot_posts):
+    """合并最新/热门帖子，按post_id去重（同时出现时保留在最新帖子中）"""
+    all_posts = []
+    post_ids = set()
+    for posts in (latest_posts, hot_posts):
+        for post in posts or []:
+            if post['post_id'] not in post_ids:
+                post_ids.add(post['post_id'])
+                all_posts.append(post)
+    return all_posts
+
+
+def get_guba_posts(code, latest_count=10, hot_count=10):
+    """
+    获取股吧帖子（最新+热门，两个列表并发请求）
+    
+    Args:
+        code: 股票代码
+        latest_count: 最新帖子数量
+        hot_count: 热门帖子数量
+    
+    Returns:
+        list: 帖子列表
+    """
+    latest_future = _sentiment_executor.submit(fetch_guba_list, code, 'latest', latest_count)
+    hot_future = _sentiment_executor.submit(fetch_guba_list, code, 'hot', hot_count)
+    return merge_guba_posts(latest_future.result(), hot_future.result())
+
+
+def get_sentiment_data(code, days=7, latest_count=10, hot_count=10):
+    """
+    并发获取新闻、最新帖子、热门帖子
+    
+    Returns:
+        tuple: (新闻列表, 去重后的帖子列表)
+    """
+    news_future = _sentiment_executor.submit(fetch_stock_news, code)
+    latest_future = _sentiment_executor.submit(fetch_guba_list, code, 'latest', latest_count)
+    hot_future = _sentiment_executor.submit(fetch_guba_list, code, 'hot', hot_count)
+    news_list = news_future.result()
+    news_list = _filter_recent_news(news_list, days) if news_list else []
+    return news_list, merge_guba_posts(latest_future.result(), hot_future.result())
 
 
 # ==================== 技术指标计算函数 ====================
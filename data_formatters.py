@@ -2,19 +2,101 @@
 # -*- coding: utf-8 -*-
 """数据格式化模块 - 用于AI分析和JSON序列化"""
 
-import pandas as pd
+import warnings
+
+import numpy as np
 import json
 from datetime import datetime
+from json_serializer import frame_to_records
+from technical_indicators import get_indicator_snapshot
+from money_flow_store import summary_prompt_lines
 
+SUMMARY_FRAMES = ('timeline', 'minute_5', 'minute_15', 'minute_30', 'daily')
 
-def format_for_ai(data_dict):
-    """格式化数据为AI分析友好的格式"""
-    if not data_dict:
-        return "无数据"
-    
+
+def summarize_frame(df):
+    """
+    一次性计算单个DataFrame的统计量（数值列整体转为二维数组后按列聚合）
+
+    Returns:
+        dict: {'count': 行数, 'columns': {列名: {'max','min','mean','sum','last','prev'}}, 'vwap': 成交量加权均价或None}
+        统计值与pandas一致，全为缺失时为NaN
+    """
+    if df is None or len(df) == 0:
+        return {'count': 0, 'columns': {}, 'vwap': None}
+
+    numeric = df.select_dtypes(include='number')
+    names = [str(col) for col in numeric.columns]
+    values = numeric.to_numpy(dtype='float64', na_value=np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # 整列为NaN时nanmax等会告警
+        stats = {
+            'max': np.nanmax(values, axis=0),
+            'min': np.nanmin(values, axis=0),
+            'mean': np.nanmean(values, axis=0),
+            'sum': np.nansum(values, axis=0),
+            'last': values[-1],
+            'prev': values[-2] if len(values) >= 2 else np.full(len(names), np.nan),
+        }
+    columns = {name: {} for name in names}
+    for key, row in stats.items():
+        for name, value in zip(names, row.tolist()):
+            columns[name][key] = value
+
+    # VWAP：优先成交额/成交量，否则价格*成交量
+    vwap = None
+    if 'volume' in columns:
+        total_volume = columns['volume']['sum']
+        if 'amount' in columns:
+            total_amount = columns['amount']['sum']
+        elif 'price' in columns:
+            total_amount = float(np.nansum(numeric['price'].to_numpy(dtype='float64', na_value=np.nan) *
+                                           numeric['volume'].to_numpy(dtype='float64', na_value=np.nan)))
+        else:
+            total_amount = None
+        if total_amount is not None and total_volume > 0:
+            vwap = total_amount / total_volume
+
+    return {'count': len(df), 'columns': columns, 'vwap': vwap}
+
+
+def get_data_summary(data_dict):
+    """
+    计算数据包的统计摘要（不缓存；同一数据包要多次使用时由调用方计算一次后通过 summary 参数传入）
+
+    Returns:
+        dict: {帧名: summarize_frame结果}
+    """
+    return {name: summarize_frame(data_dict.get(name)) for name in SUMMARY_FRAMES}
+
+
+def _stat(frame_summary, column, key):
+    """从帧摘要中取统计值，缺失返回NaN"""
+    return frame_summary['columns'].get(column, {}).get(key, float('nan'))
+
+
+def build_raw_data(data_dict, summary=None):
+    """构建 /api/sina/for_ai* 接口中的 raw_data（计数取自统计摘要）"""
+    if summary is None:
+        summary = get_data_summary(data_dict)
+    return {
+        'realtime': data_dict['realtime'],
+        'timeline_count': summary['timeline']['count'],
+        'minute_5_count': summary['minute_5']['count'],
+        'minute_15_count': summary['minute_15']['count'],
+        'minute_30_count': summary['minute_30']['count'],
+        'daily_count': summary['daily']['count'],
+        'sector_info': data_dict.get('sector_info', []),
+        'money_flow': data_dict.get('money_flow', {}),
+        'money_flow_trend': data_dict.get('money_flow_trend'),
+        'fundamental': data_dict.get('fundamental', {}),
+        'industry_comparison': data_dict.get('industry_comparison', {}),
+    }
+
+
+def _realtime_section(data_dict, summary):
+    """实时行情"""
     info = []
-    info.append(f"=== 股票代码: {data_dict['code']} ===\n")
-    
     if data_dict.get('realtime'):
         rt = data_dict['realtime']
         info.append("【实时行情】")
@@ -35,144 +117,95 @@ def format_for_ai(data_dict):
         if rt.get('ask1_price'):
             info.append(f"卖一: {rt.get('ask1_price')} 元 ({rt.get('ask1_volume')} 手)")
         info.append("")
-    
-    if data_dict.get('timeline') is not None and len(data_dict['timeline']) > 0:
-        timeline_df = data_dict['timeline']
+    return info
+
+
+def _timeline_section(data_dict, summary):
+    """分时数据统计"""
+    info = []
+    tl = summary['timeline']
+    if tl['count'] > 0:
         info.append("【分时数据统计（每分钟）】")
-        info.append(f"数据点数: {len(timeline_df)} 个")
-        if 'price' in timeline_df.columns:
-            info.append(f"最高价: {timeline_df['price'].max():.2f} 元")
-            info.append(f"最低价: {timeline_df['price'].min():.2f} 元")
-            info.append(f"平均价: {timeline_df['price'].mean():.2f} 元")
-            if 'volume' in timeline_df.columns and 'amount' in timeline_df.columns:
-                total_amount = timeline_df['amount'].sum()
-                total_volume = timeline_df['volume'].sum()
-                if total_volume > 0:
-                    vwap = total_amount / total_volume
-                    info.append(f"VWAP(成交量加权均价): {vwap:.2f} 元")
-            elif 'volume' in timeline_df.columns and 'price' in timeline_df.columns:
-                total_amount = (timeline_df['price'] * timeline_df['volume']).sum()
-                total_volume = timeline_df['volume'].sum()
-                if total_volume > 0:
-                    vwap = total_amount / total_volume
-                    info.append(f"VWAP(成交量加权均价): {vwap:.2f} 元")
+        info.append(f"数据点数: {tl['count']} 个")
+        if 'price' in tl['columns']:
+            info.append(f"最高价: {_stat(tl, 'price', 'max'):.2f} 元")
+            info.append(f"最低价: {_stat(tl, 'price', 'min'):.2f} 元")
+            info.append(f"平均价: {_stat(tl, 'price', 'mean'):.2f} 元")
+            if tl['vwap'] is not None:
+                info.append(f"VWAP(成交量加权均价): {tl['vwap']:.2f} 元")
         info.append("")
-    
-    if data_dict.get('minute_5') is not None and len(data_dict['minute_5']) > 0:
-        df_5m = data_dict['minute_5']
+    return info
+
+
+def _minute_bars_section(data_dict, summary):
+    """5/15/30分钟K线统计"""
+    info = []
+    m5 = summary['minute_5']
+    if m5['count'] > 0:
         info.append("【5分钟K线统计】")
-        info.append(f"数据条数: {len(df_5m)} 根")
-        if 'close' in df_5m.columns:
-            info.append(f"最新收盘: {df_5m['close'].iloc[-1]:.2f} 元")
-            info.append(f"最高价: {df_5m['high'].max():.2f} 元")
-            info.append(f"最低价: {df_5m['low'].min():.2f} 元")
-        if 'volume' in df_5m.columns:
-            info.append(f"总成交量: {df_5m['volume'].sum():.0f} 手")
-        info.append("")
-    
-    if data_dict.get('minute_15') is not None and len(data_dict['minute_15']) > 0:
-        df_15m = data_dict['minute_15']
-        info.append("【15分钟K线统计】")
-        info.append(f"数据条数: {len(df_15m)} 根")
-        if 'close' in df_15m.columns:
-            info.append(f"最新收盘: {df_15m['close'].iloc[-1]:.2f} 元")
+        info.append(f"数据条数: {m5['count']} 根")
+        if 'close' in m5['columns']:
+            info.append(f"最新收盘: {_stat(m5, 'close', 'last'):.2f} 元")
+            info.append(f"最高价: {_stat(m5, 'high', 'max'):.2f} 元")
+            info.append(f"最低价: {_stat(m5, 'low', 'min'):.2f} 元")
+        if 'volume' in m5['columns']:
+            info.append(f"总成交量: {_stat(m5, 'volume', 'sum'):.0f} 手")
         info.append("")
     
-    if data_dict.get('minute_30') is not None and len(data_dict['minute_30']) > 0:
-        df_30m = data_dict['minute_30']
-        info.append("【30分钟K线统计】")
-        info.append(f"数据条数: {len(df_30m)} 根")
-        if 'close' in df_30m.columns:
-            info.append(f"最新收盘: {df_30m['close'].iloc[-1]:.2f} 元")
-        info.append("")
-    
-    if data_dict.get('daily') is not None and len(data_dict['daily']) > 0:
-        daily_df = data_dict['daily']
+    for name, title in (('minute_15', '15分钟'), ('minute_30', '30分钟')):
+        frame = summary[name]
+        if frame['count'] > 0:
+            info.append(f"【{title}K线统计】")
+            info.append(f"数据条数: {frame['count']} 根")
+            if 'close' in frame['columns']:
+                info.append(f"最新收盘: {_stat(frame, 'close', 'last'):.2f} 元")
+            info.append("")
+    return info
+
+
+def _daily_section(data_dict, summary):
+    """日K线统计"""
+    info = []
+    dl = summary['daily']
+    if dl['count'] > 0:
         info.append("【日K线统计（最近240个交易日）】")
-        info.append(f"数据条数: {len(daily_df)} 根")
-        if 'close' in daily_df.columns:
-            info.append(f"最新收盘: {daily_df['close'].iloc[-1]:.2f} 元")
-            info.append(f"最高价: {daily_df['high'].max():.2f} 元")
-            info.append(f"最低价: {daily_df['low'].min():.2f} 元")
-            if len(daily_df) >= 2:
-                change = (daily_df['close'].iloc[-1] - daily_df['close'].iloc[-2]) / daily_df['close'].iloc[-2] * 100
+        info.append(f"数据条数: {dl['count']} 根")
+        if 'close' in dl['columns']:
+            info.append(f"最新收盘: {_stat(dl, 'close', 'last'):.2f} 元")
+            info.append(f"最高价: {_stat(dl, 'high', 'max'):.2f} 元")
+            info.append(f"最低价: {_stat(dl, 'low', 'min'):.2f} 元")
+            if dl['count'] >= 2:
+                last_close, prev_close = _stat(dl, 'close', 'last'), _stat(dl, 'close', 'prev')
+                change = (last_close - prev_close) / prev_close * 100
                 info.append(f"今日涨跌: {change:.2f}%")
         info.append("")
-        
-        # 技术指标
-        if len(daily_df) > 0:
-            latest = daily_df.iloc[-1]
-            info.append("【技术指标分析】")
-            
-            ma_cols = [col for col in daily_df.columns if col.startswith('MA') and not col.startswith('MACD')]
-            if ma_cols:
-                ma_info = []
-                for col in sorted(ma_cols):
-                    if pd.notna(latest[col]):
-                        ma_info.append(f"{col}: {latest[col]:.2f}")
-                if ma_info:
-                    info.append("移动平均线(MA): " + ", ".join(ma_info))
-            
-            ema_cols = [col for col in daily_df.columns if col.startswith('EMA')]
-            if ema_cols:
-                ema_info = []
-                for col in sorted(ema_cols):
-                    if pd.notna(latest[col]):
-                        ema_info.append(f"{col}: {latest[col]:.2f}")
-                if ema_info:
-                    info.append("指数移动平均线(EMA): " + ", ".join(ema_info))
-            
-            if 'MACD_DIF' in daily_df.columns and pd.notna(latest['MACD_DIF']):
-                macd_dif = latest['MACD_DIF']
-                macd_dea = latest.get('MACD_DEA', 0) if pd.notna(latest.get('MACD_DEA')) else 0
-                macd_hist = latest.get('MACD', 0) if pd.notna(latest.get('MACD')) else 0
-                macd_signal = "金叉" if macd_dif > macd_dea else "死叉"
-                info.append(f"MACD: DIF={macd_dif:.3f}, DEA={macd_dea:.3f}, MACD柱={macd_hist:.3f} ({macd_signal})")
-            
-            if 'RSI14' in daily_df.columns and pd.notna(latest['RSI14']):
-                rsi = latest['RSI14']
-                rsi_status = "超买" if rsi > 70 else ("超卖" if rsi < 30 else "正常")
-                info.append(f"RSI(14): {rsi:.2f} ({rsi_status})")
-            
-            if 'KDJ_K' in daily_df.columns and pd.notna(latest['KDJ_K']):
-                kdj_k = latest['KDJ_K']
-                kdj_d = latest.get('KDJ_D', 0) if pd.notna(latest.get('KDJ_D')) else 0
-                kdj_j = latest.get('KDJ_J', 0) if pd.notna(latest.get('KDJ_J')) else 0
-                kdj_signal = "金叉" if kdj_k > kdj_d else "死叉"
-                info.append(f"KDJ: K={kdj_k:.2f}, D={kdj_d:.2f}, J={kdj_j:.2f} ({kdj_signal})")
-            
-            if 'BOLL_UPPER' in daily_df.columns and pd.notna(latest['BOLL_UPPER']):
-                current_price = latest.get('close', 0)
-                boll_upper = latest['BOLL_UPPER']
-                boll_mid = latest.get('BOLL_MID', 0) if pd.notna(latest.get('BOLL_MID')) else 0
-                boll_lower = latest.get('BOLL_LOWER', 0) if pd.notna(latest.get('BOLL_LOWER')) else 0
-                boll_position = ""
-                if current_price > 0:
-                    if current_price > boll_upper:
-                        boll_position = "突破上轨"
-                    elif current_price < boll_lower:
-                        boll_position = "跌破下轨"
-                    else:
-                        boll_position = "轨道内"
-                info.append(f"布林带: 上轨={boll_upper:.2f}, 中轨={boll_mid:.2f}, 下轨={boll_lower:.2f} ({boll_position})")
-            
-            if 'OBV' in daily_df.columns and pd.notna(latest['OBV']):
-                obv = latest['OBV']
-                if len(daily_df) >= 2:
-                    obv_change = obv - daily_df.iloc[-2].get('OBV', 0)
-                    obv_trend = "上升" if obv_change > 0 else "下降"
-                    info.append(f"OBV: {obv:.0f} ({obv_trend})")
-            
-            info.append("")
-    
-    # 板块/行业信息
+    return info
+
+
+def _indicators_section(data_dict, summary):
+    """技术指标（基于日K线）"""
+    if summary['daily']['count'] == 0:
+        return []
+    info = ["【技术指标分析】"]
+    info.extend(get_indicator_snapshot(data_dict['code'], data_dict['daily']).to_prompt_lines())
+    info.append("")
+    return info
+
+
+def _sector_section(data_dict, summary):
+    """板块/行业信息"""
+    info = []
     if data_dict.get('sector_info') and len(data_dict['sector_info']) > 0:
         info.append("【板块/行业信息】")
         sectors = data_dict['sector_info']
         info.append(f"所属板块/行业: {', '.join(sectors)}")
         info.append("")
-    
-    # 资金流向
+    return info
+
+
+def _money_flow_section(data_dict, summary):
+    """当日资金流向"""
+    info = []
     if data_dict.get('money_flow'):
         mf = data_dict['money_flow']
         info.append("【资金流向分析】")
@@ -224,8 +257,23 @@ def format_for_ai(data_dict):
         if all(mf.get(k) is None for k in ['main_net_inflow', 'super_large_net_inflow', 'large_net_inflow', 'medium_net_inflow', 'small_net_inflow']):
             info.append("资金流向数据暂不可用")
         info.append("")
-    
-    # 基本面数据
+    return info
+
+
+def _money_flow_trend_section(data_dict, summary):
+    """资金流向趋势（日线）"""
+    info = []
+    trend_lines = summary_prompt_lines(data_dict.get('money_flow_trend'))
+    if trend_lines:
+        info.append("【资金流向趋势】")
+        info.extend(trend_lines)
+        info.append("")
+    return info
+
+
+def _fundamental_section(data_dict, summary):
+    """基本面"""
+    info = []
     if data_dict.get('fundamental'):
         fund = data_dict['fundamental']
         info.append("【基本面分析】")
@@ -289,8 +337,12 @@ def format_for_ai(data_dict):
         if all(fund.get(k) is None for k in ['pe_dynamic', 'pe_ttm', 'pb_ratio', 'ps_ratio', 'total_market_cap', 'roe', 'revenue']):
             info.append("基本面数据暂不可用")
         info.append("")
-    
-    # 行业对比数据
+    return info
+
+
+def _industry_section(data_dict, summary):
+    """行业对比"""
+    info = []
     if data_dict.get('industry_comparison'):
         ic = data_dict['industry_comparison']
         if ic.get('rank') is not None:
@@ -316,25 +368,84 @@ def format_for_ai(data_dict):
                     info.append(f"  {idx}. {stock.get('name', 'N/A')} ({stock.get('code', 'N/A')}) - {change_str}")
             
             info.append("")
-    
-    return "\n".join(info)
+    return info
+
+
+# 提示词数据区块（按输出顺序）：名称 -> 渲染函数
+DATA_SECTIONS = {
+    'realtime': _realtime_section,
+    'timeline': _timeline_section,
+    'minute_bars': _minute_bars_section,
+    'daily': _daily_section,
+    'indicators': _indicators_section,
+    'sector': _sector_section,
+    'money_flow': _money_flow_section,
+    'money_flow_trend': _money_flow_trend_section,
+    'fundamental': _fundamental_section,
+    'industry': _industry_section,
+}
+
+
+def parse_sections(value):
+    """
+    解析Agent配置的数据区块（逗号分隔字符串或列表），忽略未知名称
+
+    Returns:
+        tuple: 区块名称；未配置（None/空）时返回None，表示全部区块
+    """
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    names = tuple(name.strip() for name in value if name and name.strip() in DATA_SECTIONS)
+    return names or None
+
+
+def render_sections(data_dict, summary=None):
+    """
+    渲染全部数据区块（同一任务内渲染一次，各Agent按需组合）
+
+    Args:
+        summary: 已算好的 get_data_summary 结果，None时在这里计算
+
+    Returns:
+        dict: {'code': 股票代码, 区块名: 文本}，没有数据的区块不出现
+    """
+    if summary is None:
+        summary = get_data_summary(data_dict)
+    rendered = {'code': data_dict['code']}
+    for name, render in DATA_SECTIONS.items():
+        lines = render(data_dict, summary)
+        if lines:
+            rendered[name] = "\n".join(lines)
+    return rendered
+
+
+def assemble_sections(rendered, sections=None):
+    """按区块名称组合已渲染的文本（sections为None时使用全部区块）"""
+    parts = [f"=== 股票代码: {rendered['code']} ===\n"]
+    for name in DATA_SECTIONS:
+        if name in rendered and (sections is None or name in sections):
+            parts.append(rendered[name])
+    return "\n".join(parts)
+
+
+def format_for_ai(data_dict, sections=None, summary=None):
+    """
+    格式化数据为AI分析友好的格式
+
+    Args:
+        sections: 只输出这些数据区块（见 DATA_SECTIONS），None为全部
+        summary: 已算好的 get_data_summary 结果，None时在这里计算
+    """
+    if not data_dict:
+        return "无数据"
+    return assemble_sections(render_sections(data_dict, summary), parse_sections(sections))
 
 
 def to_json(data_dict):
     """将数据转换为JSON格式"""
-    def convert_df_to_dict(df):
-        if df is None or len(df) == 0:
-            return None
-        records = df.to_dict('records')
-        for record in records:
-            for key, value in record.items():
-                if pd.isna(value):
-                    record[key] = None
-                elif isinstance(value, pd.Timestamp):
-                    record[key] = value.strftime('%Y-%m-%d %H:%M:%S')
-                elif isinstance(value, (pd.Timedelta, pd.Period)):
-                    record[key] = str(value)
-        return records
+    convert_df_to_dict = frame_to_records
     
     result = {
         'code': data_dict['code'],
@@ -347,6 +458,7 @@ def to_json(data_dict):
         'daily': convert_df_to_dict(data_dict['daily']),
         'sector_info': data_dict.get('sector_info', []),
         'money_flow': data_dict.get('money_flow', {}),
+        'money_flow_trend': data_dict.get('money_flow_trend'),
     }
     
     # 添加技术指标、基本面、行业对比数据
@@ -360,11 +472,9 @@ def to_json(data_dict):
         result['industry_comparison'] = data_dict['industry_comparison']
     
     # 添加计数字段
-    result['daily_count'] = len(data_dict['daily']) if data_dict.get('daily') is not None else 0
-    result['minute_5_count'] = len(data_dict['minute_5']) if data_dict.get('minute_5') is not None else 0
-    result['minute_15_count'] = len(data_dict['minute_15']) if data_dict.get('minute_15') is not None else 0
-    result['minute_30_count'] = len(data_dict['minute_30']) if data_dict.get('minute_30') is not None else 0
-    result['timeline_count'] = len(data_dict['timeline']) if data_dict.get('timeline') is not None else 0
+    for name in ('daily', 'minute_5', 'minute_15', 'minute_30', 'timeline'):
+        frame = data_dict.get(name)
+        result[f'{name}_count'] = 0 if frame is None else len(frame)
     
     return result
 
@@ -2,7 +2,9 @@
 # -*- coding: utf-8 -*-
 """数据库操作函数"""
 
-from models import SessionLocal, Watchlist, Config, Agent, AnalysisCache, DebateJob
+from models import SessionLocal, Watchlist, Config, Agent, AnalysisCache, DebateJob, LimitPoolDay, LimitPoolRecord, MoneyFlowDaily, SentimentItem, SENTIMENT_FTS_AVAILABLE
+from sqlalchemy import func, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 import json
@@ -80,7 +82,8 @@ def get_agent(db: Session, agent_id: int):
     return db.query(Agent).filter(Agent.id == agent_id).first()
 
 def create_agent(db: Session, name: str, type: str, prompt: str, 
-                 ai_provider: str = None, model: str = None, enabled: bool = True, sort_order: int = 0):
+                 ai_provider: str = None, model: str = None, enabled: bool = True, sort_order: int = 0,
+                 data_sections: str = None):
     """创建Agent"""
     agent = Agent(
         name=name,
@@ -89,7 +92,8 @@ def create_agent(db: Session, name: str, type: str, prompt: str,
         ai_provider=ai_provider,
         model=model,
         enabled=enabled,
-        sort_order=sort_order
+        sort_order=sort_order,
+        data_sections=data_sections
     )
     db.add(agent)
     db.commit()
@@ -206,6 +210,36 @@ def list_debate_jobs(db: Session, status: str = None, limit: int = 50):
         query = query.filter(DebateJob.status == status)
     return query.order_by(DebateJob.updated_at.desc()).limit(limit).all()
 
+def claim_debate_job(db: Session, job_id: str, updated_at, stale_before):
+    """
+    认领中断的任务用于恢复
+
+    只认领 updated_at 早于 stale_before 的任务：运行中的任务会定期刷新 updated_at（心跳），
+    超过该时间没有刷新说明原进程已退出。按读取时的 updated_at 条件更新，多个进程同时恢复时只有一个成功。
+
+    Returns:
+        bool: 是否认领成功
+    """
+    if updated_at is None or updated_at >= stale_before:
+        return False
+    count = db.query(DebateJob).filter(
+        DebateJob.job_id == job_id,
+        DebateJob.updated_at == updated_at,
+        DebateJob.status.in_(['queued', 'running'])
+    ).update({'updated_at': datetime.now()}, synchronize_session=False)
+    db.commit()
+    return count == 1
+
+def touch_debate_jobs(db: Session, job_ids: list):
+    """刷新本进程运行中任务的 updated_at（心跳），避免被其他进程当作中断的任务认领"""
+    if not job_ids:
+        return
+    db.query(DebateJob).filter(
+        DebateJob.job_id.in_(list(job_ids)),
+        DebateJob.status.in_(['queued', 'running'])
+    ).update({'updated_at': datetime.now()}, synchronize_session=False)
+    db.commit()
+
 def cancel_debate_job(db: Session, job_id: str):
     """终止辩论任务"""
     job = db.query(DebateJob).filter(DebateJob.job_id == job_id).first()
@@ -228,3 +262,202 @@ def delete_debate_job(db: Session, job_id: str):
     db.commit()
     return True
 
+
+# ==================== 涨跌停池操作 ====================
+
+LIMIT_POOL_FIELDS = ['trade_date', 'code', 'name', 'first_limit_time', 'last_limit_time',
+                     'consecutive_days', 'break_count', 'industry']
+
+def get_limit_pool_dates(db: Session, pool_type: str, trade_dates: list):
+    """返回已落库的交易日集合（YYYYMMDD）"""
+    if not trade_dates:
+        return set()
+    rows = db.query(LimitPoolDay.trade_date).filter(
+        LimitPoolDay.pool_type == pool_type,
+        LimitPoolDay.trade_date.in_(list(trade_dates))
+    ).all()
+    return {row[0] for row in rows}
+
+def save_limit_pool(db: Session, trade_date: str, pool_type: str, records: list):
+    """保存某个交易日的涨跌停池（整日覆盖写入）"""
+    db.query(LimitPoolRecord).filter(
+        LimitPoolRecord.trade_date == trade_date,
+        LimitPoolRecord.pool_type == pool_type
+    ).delete()
+    db.bulk_insert_mappings(LimitPoolRecord, [
+        dict(record, trade_date=trade_date, pool_type=pool_type) for record in records
+    ])
+    day = db.query(LimitPoolDay).filter(
+        LimitPoolDay.trade_date == trade_date,
+        LimitPoolDay.pool_type == pool_type
+    ).first()
+    if day:
+        day.count = len(records)
+        day.fetched_at = datetime.now()
+    else:
+        db.add(LimitPoolDay(trade_date=trade_date, pool_type=pool_type, count=len(records)))
+    db.commit()
+
+def load_limit_pool(db: Session, pool_type: str, trade_dates: list):
+    """读取多个交易日的涨跌停池，返回按 LIMIT_POOL_FIELDS 排列的元组列表"""
+    if not trade_dates:
+        return []
+    columns = [getattr(LimitPoolRecord, field) for field in LIMIT_POOL_FIELDS]
+    return db.query(*columns).filter(
+        LimitPoolRecord.pool_type == pool_type,
+        LimitPoolRecord.trade_date.in_(list(trade_dates))
+    ).all()
+
+# ==================== 资金流向日线操作 ====================
+
+MONEY_FLOW_DAILY_FIELDS = ['main_net_inflow', 'super_large_net_inflow', 'large_net_inflow',
+                           'medium_net_inflow', 'small_net_inflow', 'main_net_ratio',
+                           'super_large_net_ratio', 'large_net_ratio', 'medium_net_ratio',
+                           'small_net_ratio', 'close', 'change_percent']
+
+def load_money_flow_daily(db: Session, code: str):
+    """读取个股全部日线资金流向，按日期升序返回 (trade_date, *MONEY_FLOW_DAILY_FIELDS) 元组列表"""
+    columns = [MoneyFlowDaily.trade_date] + [getattr(MoneyFlowDaily, field) for field in MONEY_FLOW_DAILY_FIELDS]
+    return db.query(*columns).filter(
+        MoneyFlowDaily.code == code
+    ).order_by(MoneyFlowDaily.trade_date).all()
+
+def save_money_flow_daily(db: Session, code: str, records: list):
+    """保存日线资金流向（同日期覆盖写入），records 为含 trade_date 和各字段的dict列表"""
+    if not records:
+        return
+    db.query(MoneyFlowDaily).filter(
+        MoneyFlowDaily.code == code,
+        MoneyFlowDaily.trade_date.in_([record['trade_date'] for record in records])
+    ).delete(synchronize_session=False)
+    db.bulk_insert_mappings(MoneyFlowDaily, [dict(record, code=code) for record in records])
+    db.commit()
+
+# ==================== 舆情索引操作 ====================
+
+def _sentiment_row(code: str, item: dict):
+    """新闻/帖子dict（data_fetchers返回的结构）转为 SentimentItem 行"""
+    if item.get('type') == 'forum':
+        kind, key = 'post', f"post:{item.get('post_id')}"
+    else:
+        # 同一篇新闻可能关联多只股票，键中带上股票代码，每只股票各存一行
+        kind, key = 'news', f"news:{code}:{item.get('url') or item.get('title')}"
+    return {
+        'item_key': key[:300],
+        'code': code,
+        'kind': kind,
+        'title': item.get('title', ''),
+        'url': item.get('url', ''),
+        'author': item.get('author') or None,
+        'source': item.get('source') or None,
+        'published_at': (item.get('time') or '')[:19] or None,
+        'read_count': int(item.get('read_count') or 0),
+        'comment_count': int(item.get('comment_count') or 0),
+        'fetched_at': datetime.now(),
+    }
+
+def save_sentiment_items(db: Session, code: str, items: list):
+    """保存舆情条目（按 item_key 去重，已存在的只更新阅读/评论数），返回新增条数"""
+    rows = {}
+    for item in items:
+        if item.get('title'):
+            row = _sentiment_row(code, item)
+            rows[row['item_key']] = row
+    if not rows:
+        return 0
+    existing = {key for (key,) in db.query(SentimentItem.item_key).filter(SentimentItem.item_key.in_(list(rows)))}
+    stmt = sqlite_insert(SentimentItem).values(list(rows.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['item_key'],
+        set_={'read_count': stmt.excluded.read_count, 'comment_count': stmt.excluded.comment_count,
+              'fetched_at': stmt.excluded.fetched_at}
+    )
+    db.execute(stmt)
+    db.commit()
+    return len(rows) - len(existing)
+
+def get_sentiment_high_water(db: Session, code: str, kind: str):
+    """某只股票某类舆情已入库的最新发布时间（高水位），无数据返回None"""
+    return db.query(func.max(SentimentItem.published_at)).filter(
+        SentimentItem.code == code,
+        SentimentItem.kind == kind
+    ).scalar()
+
+def count_sentiment_items(db: Session, code: str = None):
+    """统计舆情条目数"""
+    query = db.query(func.count(SentimentItem.id))
+    if code:
+        query = query.filter(SentimentItem.code == code)
+    return query.scalar()
+
+def search_sentiment(db: Session, query: str = None, code: str = None, kind: str = None,
+                     days: int = None, sort: str = None, limit: int = 20):
+    """
+    检索本地舆情
+    
+    Args:
+        query: 关键词，空格分隔多个词（同时满足）；3个字及以上的词走FTS5全文索引，更短的词用LIKE匹配
+        code: 股票代码
+        kind: 'news' / 'post'
+        days: 最近几天
+        sort: 'relevance'（有关键词时默认，bm25排序）/ 'time' / 'hot'（阅读+评论）
+        limit: 返回条数
+    
+    Returns:
+        list: dict列表，结构与 get_news_from_stock / get_guba_posts 的条目一致，另含 code、rank
+    """
+    conditions, params = [], {'limit': int(limit)}
+    terms = [term for term in (query or '').split() if term]
+    fts_terms = [term for term in terms if len(term) >= 3] if SENTIMENT_FTS_AVAILABLE else []
+    for i, term in enumerate(t for t in terms if t not in fts_terms):
+        conditions.append(f"s.title LIKE :like{i}")
+        params[f'like{i}'] = f"%{term}%"
+    if code:
+        conditions.append("s.code = :code")
+        params['code'] = code
+    if kind:
+        conditions.append("s.kind = :kind")
+        params['kind'] = kind
+    if days:
+        conditions.append("s.published_at >= :since")
+        params['since'] = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+    if fts_terms:
+        source = "sentiment_fts JOIN sentiment_items s ON s.id = sentiment_fts.rowid"
+        conditions.insert(0, "sentiment_fts MATCH :match")
+        params['match'] = ' '.join('"' + term.replace('"', '""') + '"' for term in fts_terms)
+        rank = "bm25(sentiment_fts)"
+    else:
+        source = "sentiment_items s"
+        rank = "0.0"
+
+    sort = sort or ('relevance' if fts_terms else 'time')
+    order = {
+        'relevance': "rank, s.published_at DESC",
+        'hot': "(s.read_count + s.comment_count * 10) DESC, s.published_at DESC",
+    }.get(sort, "s.published_at DESC")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    sql = (f"SELECT s.item_key, s.code, s.kind, s.title, s.url, s.author, s.source, s.published_at, "
+           f"s.read_count, s.comment_count, {rank} AS rank FROM {source} {where} ORDER BY {order} LIMIT :limit")
+
+    results = []
+    for row in db.execute(text(sql), params).mappings():
+        item = {
+            'code': row['code'],
+            'title': row['title'],
+            'url': row['url'] or '',
+            'time': row['published_at'] or '',
+            'rank': round(row['rank'], 4),
+        }
+        if row['kind'] == 'post':
+            item.update({
+                'post_id': row['item_key'][len('post:'):],
+                'author': row['author'] or '',
+                'read_count': row['read_count'],
+                'comment_count': row['comment_count'],
+                'type': 'forum',
+            })
+        else:
+            item.update({'source': row['source'] or '', 'summary': '', 'type': 'news'})
+        results.append(item)
+    return results
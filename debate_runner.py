@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""多Agent辩论的分析阶段调度
+
+每个Agent第N+1轮分析的提示词只依赖它自己前几轮的分析结果，因此分析阶段按Agent拆成独立的链：
+线程池里的任务是单个（链, 轮次），一轮完成后再提交该链的下一轮，空闲线程总是执行已就绪的链，
+快的模型不用等慢的模型跑完同一轮，Agent数多于线程数时后面的Agent也不用等前面的链跑完全部轮次。
+结果通过队列交回调用线程，数据库写入（步骤、进度）和取消检查都在调用线程里做；
+只有进入辩论阶段前需要等所有链结束。任务被终止时进行中的调用立即中断（CallCanceled），各链直接结束。
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ai_service import AIService, failure_telemetry
+from cancellation import CallCanceled
+
+MAX_CHAIN_WORKERS = 6
+
+
+class AgentChain:
+    """一条分析链所需的Agent信息（在调用线程里从ORM对象复制，工作线程不碰数据库会话）"""
+
+    __slots__ = ('id', 'name', 'prompt', 'data_sections', 'config', 'budget', 'memory')
+
+    def __init__(self, agent, config, budget=None, memory=None):
+        self.id = agent.id
+        self.name = agent.name
+        self.prompt = agent.prompt
+        self.data_sections = agent.data_sections
+        self.config = config  # (provider, api_key, model)
+        self.budget = budget  # 提示词token预算（见 context_budget）
+        self.memory = list(memory or [])  # 各轮分析结果；任务恢复时预先填入已完成的轮次
+
+
+def run_analysis_chains(chains, rounds, build_prompt, on_result, should_stop=None, max_workers=MAX_CHAIN_WORKERS,
+                        job_id=None):
+    """
+    并行运行各Agent的多轮分析链，轮次之间没有全体屏障；每条链从 len(chain.memory)+1 轮开始（任务恢复时跳过已完成的轮次）
+
+    Args:
+        chains: AgentChain 列表
+        rounds: 分析轮数
+        build_prompt: build_prompt(chain, round_idx) -> str，在工作线程里调用，只能读 chain.memory
+        on_result: on_result(chain, round_idx, content, telemetry)，在调用线程里按完成顺序调用；
+            telemetry 为本次调用的统计（LLMCallResult.to_dict()），没有时为None
+        should_stop: 每收到一个结果后在调用线程里调用，返回True时立即返回，各链不再开始新的一轮
+        job_id: 调用统计计入该任务
+
+    Returns:
+        bool: 全部轮次完成返回True，中途停止返回False
+    """
+    results = queue.Queue()
+    stop = threading.Event()
+
+    def run_round(chain, round_idx, queued_at):
+        if stop.is_set():
+            results.put((chain, round_idx, None, None, False))
+            return
+        try:
+            result = AIService.call_agent_detailed(*chain.config, build_prompt(chain, round_idx),
+                                                   queued_at=queued_at, job_id=job_id, agent=chain.name)
+            content, telemetry = result.text, result.to_dict()
+        except CallCanceled:
+            results.put((chain, round_idx, None, None, False))  # 本链结束
+            return
+        except Exception as e:
+            content = f"[ERROR] {chain.name} analysis failed: {str(e)}"
+            telemetry = failure_telemetry(e)
+        chain.memory.append(content)
+        results.put((chain, round_idx, content, telemetry, True))
+
+    chains = [chain for chain in chains if len(chain.memory) < rounds]
+    if not chains or rounds <= 0:
+        return True
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(chains)))
+    try:
+        for chain in chains:
+            executor.submit(run_round, chain, len(chain.memory) + 1, time.monotonic())
+        pending = len(chains)
+        while pending:
+            chain, round_idx, content, telemetry, completed = results.get()
+            pending -= 1
+            if not completed:
+                continue
+            on_result(chain, round_idx, content, telemetry)
+            if should_stop is not None and should_stop():
+                stop.set()
+                break
+            if round_idx < rounds:
+                executor.submit(run_round, chain, round_idx + 1, time.monotonic())
+                pending += 1
+        else:
+            # 各链因调用被取消提前结束时没有结果触发检查
+            if should_stop is not None and should_stop():
+                stop.set()
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        # 停止时不等待进行中的调用，排队中的轮次开始前自行退出
+        executor.shutdown(wait=not stop.is_set())
+    return not stop.is_set()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""大模型请求对冲
+
+一轮辩论的耗时由最慢的调用决定。开启对冲（配置 ai_hedge_enabled=1）后，调用超过该 提供商/模型
+最近耗时的分位数（ai_hedge_percentile，默认0.95）仍未返回时，再发一个相同的请求，取先完成的结果。
+对冲请求发往同一提供商（Key池有多个Key时会选到别的Key），只有一个Key且配置了故障转移链时发往链中下一个提供商。
+
+为控制费用使用全局对冲预算：每次调用积累 ai_hedge_ratio（默认0.1）个额度，每次对冲消耗1个，
+即对冲请求数不超过调用数的10%（额度上限 MAX_CREDITS，允许短时突发）。
+
+原请求在调用方线程上执行，等待时间从请求开始时计时；到期由 DeadlineTimer（单个后台线程）发出对冲请求，
+只有对冲请求占用线程池。
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+from models import SessionLocal
+from db import get_config
+from llm_telemetry import get_llm_telemetry
+
+DEFAULT_PERCENTILE = 0.95
+DEFAULT_RATIO = 0.1
+MIN_SAMPLES = 20  # 耗时样本不足时不对冲
+MIN_DELAY = 3.0  # 对冲等待的最短秒数
+MAX_CREDITS = 5.0
+SETTINGS_TTL = 30
+
+
+class HedgePolicy:
+    """对冲开关、等待时间和全局预算"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._settings = None  # (读取时间, enabled, percentile, ratio)
+        self.credits = 0.0
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+
+    def _load_settings(self):
+        now = time.monotonic()
+        if self._settings is not None and now - self._settings[0] < SETTINGS_TTL:
+            return self._settings[1:]
+        enabled, percentile, ratio = False, DEFAULT_PERCENTILE, DEFAULT_RATIO
+        db = SessionLocal()
+        try:
+            enabled = (get_config(db, 'ai_hedge_enabled') or '').lower() in ('1', 'true', 'yes', 'on')
+            percentile = float(get_config(db, 'ai_hedge_percentile') or DEFAULT_PERCENTILE)
+            ratio = float(get_config(db, 'ai_hedge_ratio') or DEFAULT_RATIO)
+        except (TypeError, ValueError) as e:
+            print(f"[对冲] 配置无效，使用默认值: {e}")
+        except Exception as e:
+            print(f"[对冲] 读取配置失败: {e}")
+        finally:
+            db.close()
+        percentile = min(max(percentile, 0.5), 0.999)
+        ratio = min(max(ratio, 0.0), 1.0)
+        self._settings = (now, enabled, percentile, ratio)
+        return enabled, percentile, ratio
+
+    def deadline(self, provider, model):
+        """
+        本次调用的对冲等待秒数；不对冲时返回None
+
+        每次调用都会积累预算额度，每个调用只应调用一次。
+        """
+        enabled, percentile, ratio = self._load_settings()
+        if not enabled:
+            return None
+        with self._lock:
+            self.calls += 1
+            self.credits = min(self.credits + ratio, MAX_CREDITS)
+        delay = get_llm_telemetry().latency_percentile(provider, model, percentile, MIN_SAMPLES)
+        if delay is None:
+            return None
+        return max(delay, MIN_DELAY)
+
+    def try_spend(self):
+        """到达等待时间后申请对冲额度"""
+        with self._lock:
+            if self.credits >= 1.0:
+                self.credits -= 1.0
+                self.hedged += 1
+                return True
+            self.budget_denied += 1
+            return False
+
+    def record_win(self, hedge_won):
+        if hedge_won:
+            with self._lock:
+                self.hedge_wins += 1
+
+    def stats(self):
+        enabled, percentile, ratio = self._load_settings()
+        with self._lock:
+            return {
+                'enabled': enabled,
+                'percentile': percentile,
+                'ratio': ratio,
+                'credits': round(self.credits, 2),
+                'calls': self.calls,
+                'hedged': self.hedged,
+                'hedge_wins': self.hedge_wins,
+                'budget_denied': self.budget_denied,
+            }
+
+
+class DeadlineTimer:
+    """单线程定时器：到期后在后台线程执行回调（回调应很快返回）"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []  # (到期时间, 序号, 回调)
+        self._canceled = set()
+        self._counter = itertools.count()
+        self._thread = None
+
+    def schedule(self, delay, callback):
+        """delay 秒后执行 callback，返回可用于 cancel 的句柄"""
+        handle = next(self._counter)
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, handle, callback))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='llm-hedge-timer', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return handle
+
+    def cancel(self, handle):
+        with self._cond:
+            if any(entry[1] == handle for entry in self._heap):
+                self._canceled.add(handle)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    due, handle, callback = self._heap[0]
+                    remaining = due - time.monotonic()
+                    if handle in self._canceled:
+                        heapq.heappop(self._heap)
+                        self._canceled.discard(handle)
+                        continue
+                    if remaining > 0:
+                        self._cond.wait(remaining)
+                        continue
+                    heapq.heappop(self._heap)
+                    break
+            try:
+                callback()
+            except Exception as e:
+                print(f"[对冲] 定时回调失败: {e}")
+
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def get_hedge_policy():
+    """获取全局对冲策略实例"""
+    global _policy
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                _policy = HedgePolicy()
+    return _policy
+
+
+_timer = None
+_timer_lock = threading.Lock()
+
+
+def get_deadline_timer():
+    """获取全局对冲定时器"""
+    global _timer
+    if _timer is None:
+        with _timer_lock:
+            if _timer is None:
+                _timer = DeadlineTimer()
+    return _timer
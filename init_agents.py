@@ -6,6 +6,7 @@ from models import SessionLocal, Agent
 from db import get_agents, create_agent
 
 # 默认Agent配置（基于TradingAgents论文，使用英文提示词以提高理解准确性）
+# data_sections: 该Agent使用的数据区块（见 data_formatters.DATA_SECTIONS），None表示全部
 DEFAULT_AGENTS = [
     {
         'name': '技术分析Agent',
@@ -24,6 +25,7 @@ Debate guidance: In debate rounds, stay objective and argue strictly from the te
 Please output your analysis in Chinese. The stock data will be provided below.
 
 Note: All instructions and prompts are in English to ensure better AI understanding, but the final analysis output should be in Chinese.''',
+        'data_sections': 'realtime,timeline,minute_bars,daily,indicators',
         'sort_order': 1
     },
     {
@@ -42,6 +44,7 @@ Debate guidance: In debate rounds, stay objective and argue strictly from the ca
 Please output your analysis in Chinese. The stock data will be provided below.
 
 Note: All instructions and prompts are in English to ensure better AI understanding, but the final analysis output should be in Chinese.''',
+        'data_sections': 'realtime,timeline,money_flow,money_flow_trend',
         'sort_order': 2
     },
     {
@@ -60,6 +63,7 @@ Debate guidance: In debate rounds, stay objective and argue strictly from the fu
 Please output your analysis in Chinese. The stock data will be provided below.
 
 Note: All instructions and prompts are in English to ensure better AI understanding, but the final analysis output should be in Chinese.''',
+        'data_sections': 'realtime,daily,fundamental,industry',
         'sort_order': 3
     },
     {
@@ -78,6 +82,7 @@ Debate guidance: In debate rounds, stay objective and argue strictly from the in
 Please output your analysis in Chinese. The stock data will be provided below.
 
 Note: All instructions and prompts are in English to ensure better AI understanding, but the final analysis output should be in Chinese.''',
+        'data_sections': 'realtime,daily,sector,industry,fundamental',
         'sort_order': 4
     },
     {
@@ -96,6 +101,7 @@ Debate guidance: In debate rounds, stay objective and argue strictly from the se
 Please output your analysis in Chinese. The stock data will be provided below.
 
 Note: All instructions and prompts are in English to ensure better AI understanding, but the final analysis output should be in Chinese.''',
+        'data_sections': 'realtime,daily,sector',
         'sort_order': 5
     },
     {
@@ -138,6 +144,7 @@ Note: All instructions and prompts are in English to ensure better AI understand
 Debate guidance: In debate rounds, stay objective and argue strictly from the intraday trading perspective. Address opposing points with evidence, without simply agreeing.
 
 Please output your analysis in Chinese and clearly specify the buy price and sell price in the format: Buy price: XX.XX yuan, Sell price: XX.XX yuan. The stock data will be provided below.''',
+        'data_sections': 'realtime,timeline,minute_bars,daily,indicators,money_flow',
         'sort_order': 6
     },
     {
@@ -156,6 +163,7 @@ Debate guidance: In debate rounds, stay objective and argue strictly from the re
 Please output your analysis in Chinese. The stock data will be provided below.
 
 Note: All instructions and prompts are in English to ensure better AI understanding, but the final analysis output should be in Chinese.''',
+        'data_sections': None,
         'sort_order': 7
     }
     ,
@@ -175,6 +183,7 @@ Debate guidance: In debate rounds, stay objective but maintain a bullish stance.
 Please output your analysis in Chinese. The stock data will be provided below.
 
 Note: All instructions and prompts are in English to ensure better AI understanding, but the final analysis output should be in Chinese.''',
+        'data_sections': None,
         'sort_order': 8
     },
     {
@@ -193,6 +202,7 @@ Debate guidance: In debate rounds, stay objective but maintain a bearish stance.
 Please output your analysis in Chinese. The stock data will be provided below.
 
 Note: All instructions and prompts are in English to ensure better AI understanding, but the final analysis output should be in Chinese.''',
+        'data_sections': None,
         'sort_order': 9
     },
     {
@@ -211,6 +221,7 @@ Debate guidance: In debate rounds, stay objective and focus on microscopic price
 Please output your analysis in Chinese. The stock data will be provided below.
 
 Note: All instructions and prompts are in English to ensure better AI understanding, but the final analysis output should be in Chinese.''',
+        'data_sections': 'realtime,timeline,minute_bars,money_flow',
         'sort_order': 10
     },
     {
@@ -231,10 +242,26 @@ Debate guidance: In debate rounds, you must be extremely picky. Argue from the p
 Please output your analysis in Chinese. The stock data will be provided below.
 
 Note: All instructions and prompts are in English to ensure better AI understanding, but the final analysis output should be in Chinese.''',
+        'data_sections': 'realtime,timeline,minute_bars,daily,indicators,sector,money_flow,money_flow_trend',
         'sort_order': 11
     }
 ]
 
+def backfill_data_sections(db, existing_agents):
+    """为未改动过提示词、也未配置数据区块的内置Agent补上默认数据区块"""
+    defaults = {config['name']: config for config in DEFAULT_AGENTS}
+    updated = 0
+    for agent in existing_agents:
+        config = defaults.get(agent.name)
+        if config is None or agent.data_sections or not config['data_sections'] or agent.prompt != config['prompt']:
+            continue
+        agent.data_sections = config['data_sections']
+        updated += 1
+    if updated:
+        db.commit()
+        print(f"[初始化] 为 {updated} 个内置Agent设置了默认数据区块")
+
+
 def init_default_agents():
     """初始化默认Agent"""
     db = SessionLocal()
@@ -243,6 +270,7 @@ def init_default_agents():
         existing_names = {agent.name for agent in existing_agents}
 
         print("[初始化] 开始检查并创建默认Agent...")
+        backfill_data_sections(db, existing_agents)
         created_count = 0
         for agent_config in DEFAULT_AGENTS:
             if agent_config['name'] in existing_names:
@@ -256,7 +284,8 @@ def init_default_agents():
                 ai_provider=None,  # 默认不设置，使用全局配置
                 model=None,
                 enabled=True,
-                sort_order=agent_config['sort_order']
+                sort_order=agent_config['sort_order'],
+                data_sections=agent_config['data_sections']
             )
             created_count += 1
             print(f"[初始化] 创建Agent: {agent.name} (ID: {agent.id})")
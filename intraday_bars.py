@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""个股日内行情缓冲区
+
+每只股票一个缓冲区，短时保存分钟K线（按周期）和分时数据：
+同一次综合数据获取中，分时接口失败时的5分钟K线兜底、以及不同条数的分钟K线请求
+都从这里取已抓到的数据，不再重复请求上游。
+"""
+
+import threading
+import time
+
+from utils import TTLCache
+
+INTRADAY_BUFFER_TTL = 30  # 日内数据复用的秒数
+INTRADAY_BUFFER_SIZE = 512  # 最多缓存的股票数
+
+
+class IntradayBuffer:
+    """单只股票的日内数据：{scale: (请求条数, DataFrame, 写入时间)} 和 (分时DataFrame, 写入时间)"""
+
+    __slots__ = ('code', 'bars', 'timeline', 'lock')
+
+    def __init__(self, code):
+        self.code = code
+        self.bars = {}
+        self.timeline = None
+        self.lock = threading.Lock()
+
+    def get_bars(self, scale, datalen, ttl=INTRADAY_BUFFER_TTL):
+        """返回最近datalen根K线；缓存中请求过的条数不少于datalen且未过期才命中"""
+        with self.lock:
+            entry = self.bars.get(scale)
+        if entry is None:
+            return None
+        requested, df, stored_at = entry
+        if requested < datalen or time.monotonic() - stored_at > ttl:
+            return None
+        if len(df) > datalen:
+            df = df.iloc[-datalen:]
+        return df.reset_index(drop=True)
+
+    def put_bars(self, scale, datalen, df):
+        with self.lock:
+            entry = self.bars.get(scale)
+            # 已有更长且未过期的数据时不用更短的结果覆盖
+            if entry is not None and entry[0] > datalen and time.monotonic() - entry[2] <= INTRADAY_BUFFER_TTL:
+                return
+            self.bars[scale] = (datalen, df, time.monotonic())
+
+    def get_timeline(self, ttl=INTRADAY_BUFFER_TTL):
+        with self.lock:
+            entry = self.timeline
+        if entry is None or time.monotonic() - entry[1] > ttl:
+            return None
+        return entry[0].copy()
+
+    def put_timeline(self, df):
+        with self.lock:
+            self.timeline = (df, time.monotonic())
+
+
+_buffers = TTLCache(maxsize=INTRADAY_BUFFER_SIZE)
+_buffers_lock = threading.Lock()
+
+
+def get_intraday_buffer(code):
+    """获取（不存在时创建）股票的日内缓冲区"""
+    code = str(code).strip()
+    buffer = _buffers.get(code)
+    if buffer is None:
+        with _buffers_lock:
+            buffer = _buffers.get(code)
+            if buffer is None:
+                buffer = IntradayBuffer(code)
+                _buffers.set(code, buffer)
+    return buffer
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""当日资金流向分钟线聚合模块
+
+每只股票当日的1分钟资金流向保存在按交易分钟预分配的定长缓冲区里（09:30~11:30、13:01~15:00 共241个槽位），
+之后每次只抓取最后一个已有分钟以来的数据（最后一分钟仍在变化，重新抓取覆盖）。
+东方财富分钟资金流为当日累计值：N分钟滚动净流入为累计值之差；
+5/15/30分钟线取每个时间桶最后一分钟的累计值，由同一份1分钟数据重采样，不再额外请求。
+"""
+
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from data_fetchers import get_money_flow_realtime_matrix, get_money_flow_realtime_kline, MONEY_FLOW_NET_FIELDS
+from response_decoder import matrix_to_records
+from utils import TTLCache
+
+MORNING_SLOTS = 121  # 09:30 ~ 11:30
+AFTERNOON_SLOTS = 120  # 13:01 ~ 15:00
+SESSION_SLOTS = MORNING_SLOTS + AFTERNOON_SLOTS
+SUPPORTED_KLT = (1, 5, 15, 30)
+ROLLING_WINDOWS = (5, 15, 30)
+BUFFER_CACHE_SIZE = 512
+LIVE_REFRESH_TTL = 10  # 交易时段内多久检查一次新分钟（秒）
+CLOSED_REFRESH_TTL = 30 * 60  # 非交易时段
+INCREMENTAL_BUFFER_MINUTES = 2  # 增量抓取时额外多取的分钟数（时钟误差）
+
+
+def slot_of(hhmm):
+    """HHMM整数 -> 槽位序号（盘前为-1，午休归入11:30，收盘后归入15:00）"""
+    minutes = hhmm // 100 * 60 + hhmm % 100
+    if minutes < 9 * 60 + 30:
+        return -1
+    if minutes <= 11 * 60 + 30:
+        return minutes - (9 * 60 + 30)
+    if minutes <= 13 * 60:
+        return MORNING_SLOTS - 1
+    return min(MORNING_SLOTS + minutes - (13 * 60 + 1), SESSION_SLOTS - 1)
+
+
+def _slot_labels():
+    """各槽位的 HH:MM 标签"""
+    labels = []
+    for slot in range(SESSION_SLOTS):
+        minutes = 9 * 60 + 30 + slot if slot < MORNING_SLOTS else 13 * 60 + 1 + slot - MORNING_SLOTS
+        labels.append(f"{minutes // 60:02d}:{minutes % 60:02d}")
+    return np.array(labels, dtype=object)
+
+
+def _bucket_ids(klt):
+    """各槽位所属的klt分钟时间桶（09:30并入第一个桶，桶以结束时间标记）"""
+    slots = np.arange(SESSION_SLOTS)
+    morning = np.maximum(slots - 1, 0) // klt
+    afternoon = (MORNING_SLOTS - 1) // klt + (slots - MORNING_SLOTS) // klt
+    return np.where(slots < MORNING_SLOTS, morning, afternoon)
+
+
+SLOT_LABELS = _slot_labels()
+BUCKETS = {klt: _bucket_ids(klt) for klt in SUPPORTED_KLT}
+# 每个桶的标签取桶内最后一个槽位（即桶结束时间）
+BUCKET_LABELS = {
+    klt: SLOT_LABELS[np.flatnonzero(np.r_[buckets[1:] != buckets[:-1], True])]
+    for klt, buckets in BUCKETS.items()
+}
+
+
+class IntradayFlowBuffer:
+    """单只股票单个交易日的分钟资金流向缓冲区"""
+
+    __slots__ = ('code', 'trade_date', 'cumulative', 'filled', 'last_slot')
+
+    def __init__(self, code, trade_date):
+        width = len(MONEY_FLOW_NET_FIELDS)
+        self.code = code
+        self.trade_date = trade_date
+        self.cumulative = np.full((SESSION_SLOTS, width), np.nan)  # 当日累计净流入（万元）
+        self.filled = np.zeros(SESSION_SLOTS, dtype=bool)
+        self.last_slot = -1
+
+    def __len__(self):
+        return int(np.count_nonzero(self.filled))
+
+    def update(self, slots, values):
+        """写入若干槽位的累计值"""
+        if len(slots) == 0:
+            return
+        self.cumulative[slots] = values
+        self.filled[slots] = True
+        self.last_slot = max(self.last_slot, int(slots.max()))
+
+    def latest(self):
+        return self.cumulative[self.last_slot] if self.last_slot >= 0 else None
+
+    def rolling(self, window):
+        """最近window分钟的净流入（累计值之差；不足window分钟时为当日累计）"""
+        if self.last_slot < 0:
+            return None
+        filled = np.flatnonzero(self.filled)
+        pos = int(np.searchsorted(filled, self.last_slot - window, side='right'))
+        base = self.cumulative[filled[pos - 1]] if pos > 0 else 0.0
+        return self.cumulative[self.last_slot] - base
+
+    def resample(self, klt=1):
+        """
+        重采样为klt分钟线
+
+        Returns:
+            tuple: (时间标签数组 'YYYY-MM-DD HH:MM', 累计值矩阵)
+        """
+        filled = np.flatnonzero(self.filled)
+        if klt == 1:
+            labels = SLOT_LABELS[filled]
+            values = self.cumulative[filled]
+        else:
+            buckets = BUCKETS[klt][filled]
+            last_in_bucket = np.flatnonzero(np.r_[buckets[1:] != buckets[:-1], True]) if len(buckets) else buckets
+            labels = BUCKET_LABELS[klt][buckets[last_in_bucket]]
+            values = self.cumulative[filled[last_in_bucket]]
+        labels = np.array([f"{self.trade_date} {label}" for label in labels], dtype=object)
+        return labels, values
+
+    def summary(self, windows=ROLLING_WINDOWS):
+        """最新累计净流入与N分钟滚动净流入"""
+        if self.last_slot < 0:
+            return {'trade_date': self.trade_date, 'last_time': None, 'minutes': 0}
+        latest = self.latest()
+        result = {
+            'trade_date': self.trade_date,
+            'last_time': f"{self.trade_date} {SLOT_LABELS[self.last_slot]}",
+            'minutes': len(self),
+            'cumulative': {field: round(float(latest[i]), 2) for i, field in enumerate(MONEY_FLOW_NET_FIELDS)},
+            'rolling': {},
+        }
+        for window in windows:
+            values = self.rolling(window)
+            result['rolling'][str(window)] = {
+                field: round(float(values[i]), 2) for i, field in enumerate(MONEY_FLOW_NET_FIELDS)
+            }
+        return result
+
+
+def _is_trading_time(now):
+    if now.weekday() >= 5:
+        return False
+    hhmm = now.hour * 100 + now.minute
+    return 915 <= hhmm <= 1130 or 1300 <= hhmm <= 1500
+
+
+class IntradayFlowStore:
+    """当日分钟资金流向：每只股票一个缓冲区，按需增量抓取"""
+
+    def __init__(self):
+        self._buffers = TTLCache(maxsize=BUFFER_CACHE_SIZE)  # code -> IntradayFlowBuffer
+        self._fresh = TTLCache(maxsize=BUFFER_CACHE_SIZE)  # code -> True，TTL内不再请求网络
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self.metrics = {'fetches': 0, 'full_fetches': 0, 'rows_fetched': 0, 'cache_hits': 0}
+
+    def _lock_for(self, code):
+        with self._locks_guard:
+            lock = self._locks.get(code)
+            if lock is None:
+                lock = self._locks[code] = threading.Lock()
+            return lock
+
+    def get_buffer(self, code):
+        """获取（必要时增量更新）当日缓冲区"""
+        buffer = self._buffers.get(code)
+        if buffer is not None and self._fresh.get(code):
+            self.metrics['cache_hits'] += 1
+            return buffer
+
+        with self._lock_for(code):
+            buffer = self._buffers.get(code)
+            if buffer is not None and self._fresh.get(code):
+                self.metrics['cache_hits'] += 1
+                return buffer
+            buffer = self._update(code, buffer)
+            if buffer is not None:
+                self._buffers.set(code, buffer)
+            return buffer
+
+    def get_kline(self, code, klt=1, lmt=0):
+        """
+        与 get_money_flow_realtime_kline 返回相同结构的记录列表
+
+        klt不在 SUPPORTED_KLT 中时直接请求上游。
+        """
+        if klt not in SUPPORTED_KLT:
+            return get_money_flow_realtime_kline(code, klt=klt, lmt=lmt)
+        buffer = self.get_buffer(code)
+        if buffer is None:
+            return []
+        labels, values = buffer.resample(klt)
+        if lmt > 0:
+            labels, values = labels[-lmt:], values[-lmt:]
+        return matrix_to_records(labels, 'time', values, MONEY_FLOW_NET_FIELDS)
+
+    def get_summary(self, code, windows=ROLLING_WINDOWS):
+        buffer = self.get_buffer(code)
+        return buffer.summary(windows) if buffer is not None else None
+
+    def _update(self, code, buffer):
+        now = datetime.now()
+        today = now.strftime('%Y-%m-%d')
+        if buffer is None or buffer.trade_date != today:
+            lmt = 0
+        else:
+            now_slot = slot_of(now.hour * 100 + now.minute)
+            lmt = max(now_slot - buffer.last_slot, 0) + 1 + INCREMENTAL_BUFFER_MINUTES
+
+        parsed = self._fetch(code, lmt)
+        if parsed is None:
+            return buffer
+        trade_date, slots, values = parsed
+        if lmt != 0 and (buffer.trade_date != trade_date or slots.min() > buffer.last_slot + 1):
+            # 出现新交易日，或增量数据与已有分钟之间有缺口（本地时钟偏差），重新完整抓取
+            parsed = self._fetch(code, 0)
+            if parsed is None:
+                return buffer
+            trade_date, slots, values = parsed
+        if buffer is None or buffer.trade_date != trade_date:
+            buffer = IntradayFlowBuffer(code, trade_date)
+        buffer.update(slots, values)
+
+        complete = buffer.last_slot == SESSION_SLOTS - 1
+        live = _is_trading_time(now) and not (complete and buffer.trade_date == today)
+        self._fresh.set(code, True, ttl=LIVE_REFRESH_TTL if live else CLOSED_REFRESH_TTL)
+        return buffer
+
+    def _fetch(self, code, lmt):
+        """抓取1分钟资金流，返回 (交易日, 槽位数组, 累计值矩阵)，只保留最后一个交易日的交易时段数据；无数据返回None"""
+        result = get_money_flow_realtime_matrix(code, klt=1, lmt=lmt)
+        self.metrics['fetches'] += 1
+        if lmt == 0:
+            self.metrics['full_fetches'] += 1
+        if result is None or len(result[0]) == 0:
+            return None
+        labels, values = result
+        self.metrics['rows_fetched'] += len(labels)
+
+        trade_date = labels[-1][:10]
+        slots = np.array([
+            slot_of(int(label[11:13] + label[14:16])) if label[:10] == trade_date else -1
+            for label in labels
+        ], dtype=np.int64)
+        valid = slots >= 0
+        if not valid.any():
+            return None
+        return trade_date, slots[valid], values[valid]
+
+    def stats(self):
+        return dict(self.metrics)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_intraday_flow_store():
+    """获取全局当日资金流向存储实例"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = IntradayFlowStore()
+    return _store
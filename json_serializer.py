@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""DataFrame 向量化 JSON 序列化模块
+
+NaN -> null、时间列格式化都按列完成（不再逐单元格判断），
+输出支持：记录列表（兼容旧格式）、列式布局（每个字段一个数组）、分块流式输出。
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+DATE_FORMAT = '%Y-%m-%d'
+STREAM_CHUNK_ROWS = 256
+
+
+def dumps(obj):
+    """序列化为UTF-8字节（优先使用orjson）"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _column_values(series, datetime_format):
+    """单列转换为Python列表：缺失值为None，时间列按格式转字符串"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        text = series.dt.strftime(datetime_format)
+        return text.astype(object).where(series.notna(), None).tolist()
+    if pd.api.types.is_timedelta64_dtype(series) or isinstance(series.dtype, pd.PeriodDtype):
+        return series.astype(str).astype(object).where(series.notna(), None).tolist()
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        if series.hasnans:
+            return series.astype(object).where(series.notna(), None).tolist()
+        return series.tolist()
+    if pd.api.types.is_float_dtype(series):
+        values = series.to_numpy(dtype='float64')
+        mask = ~np.isfinite(values)
+        if not mask.any():
+            return values.tolist()
+        out = values.astype(object)
+        out[mask] = None
+        return out.tolist()
+    # object列：可能混有Timestamp/NaN，按列做一次判断
+    values = series.astype(object)
+    values = values.where(series.notna(), None)
+    if values.map(lambda v: isinstance(v, pd.Timestamp)).any():
+        values = values.map(lambda v: v.strftime(datetime_format) if isinstance(v, pd.Timestamp) else v)
+    return values.tolist()
+
+
+def frame_to_columns(df, datetime_format=DATETIME_FORMAT):
+    """DataFrame 转列式dict：{字段: [值, ...]}"""
+    if df is None or len(df) == 0:
+        return {}
+    return {str(col): _column_values(df[col], datetime_format) for col in df.columns}
+
+
+def frame_to_records(df, datetime_format=DATETIME_FORMAT):
+    """DataFrame 转记录列表，结果与旧的 to_dict('records') + 逐值修正 一致"""
+    if df is None or len(df) == 0:
+        return None
+    columns = frame_to_columns(df, datetime_format)
+    keys = list(columns.keys())
+    return [dict(zip(keys, row)) for row in zip(*columns.values())]
+
+
+def iter_records_json(df, datetime_format=DATETIME_FORMAT, chunk_rows=STREAM_CHUNK_ROWS):
+    """按块生成记录数组的JSON字节片段（'[' ... ']'），用于流式响应"""
+    yield b'['
+    if df is not None and len(df) > 0:
+        columns = frame_to_columns(df, datetime_format)
+        keys = list(columns.keys())
+        values = list(columns.values())
+        total = len(df)
+        for start in range(0, total, chunk_rows):
+            rows = zip(*(col[start:start + chunk_rows] for col in values))
+            chunk = dumps([dict(zip(keys, row)) for row in rows])[1:-1]
+            if start > 0:
+                yield b','
+            yield chunk
+    yield b']'
+
+
+def iter_envelope_json(envelope, data_key, df, datetime_format=DATETIME_FORMAT):
+    """生成 {…envelope, data_key: [记录…]} 的JSON字节流，数据部分分块输出"""
+    head = dumps(envelope)
+    if head == b'{}':
+        yield b'{' + dumps(data_key) + b':'
+    else:
+        yield head[:-1] + b',' + dumps(data_key) + b':'
+    yield from iter_records_json(df, datetime_format)
+    yield b'}'
+
+
+
+# ==================== 图表紧凑格式 ====================
+
+CHART_TIMEZONE = 'Asia/Shanghai'
+COLUMNAR_DECIMALS = 3
+
+
+def _epoch_seconds(series, tz):
+    """时间列转为epoch秒（int64），无时区的时间按tz解释；缺失为-1"""
+    values = series
+    if values.dt.tz is None:
+        values = values.dt.tz_localize(tz, ambiguous='NaT', nonexistent='NaT')
+    seconds = values.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy(dtype='datetime64[s]').astype('int64')
+    return np.where(series.notna().to_numpy(), seconds, -1)
+
+
+def _chart_columns(df, drop_raw_time=True):
+    """选出图表需要的列：已解析出datetime/date时去掉原始字符串时间列"""
+    columns = list(df.columns)
+    has_parsed = any(pd.api.types.is_datetime64_any_dtype(df[col]) for col in columns)
+    if drop_raw_time and has_parsed:
+        columns = [col for col in columns if col not in ('day', 'time')
+                   or pd.api.types.is_datetime64_any_dtype(df[col])]
+    return columns
+
+
+def frame_to_columnar(df, decimals=COLUMNAR_DECIMALS, tz=CHART_TIMEZONE):
+    """
+    DataFrame 转列式紧凑格式
+
+    时间列转为epoch秒整数，浮点列按固定小数位取整，NaN为null；
+    原始字符串时间列（day/time）在已有解析后的时间列时省略。
+
+    Returns:
+        dict: {'fields': [...], 'time_fields': [...], 'columns': {字段: [...]}}
+    """
+    fields, time_fields, columns = [], [], {}
+    if df is None or len(df) == 0:
+        return {'fields': fields, 'time_fields': time_fields, 'columns': columns}
+    for col in _chart_columns(df):
+        series = df[col]
+        name = str(col)
+        if pd.api.types.is_datetime64_any_dtype(series):
+            seconds = _epoch_seconds(series, tz)
+            values = seconds.astype(object)
+            values[seconds < 0] = None
+            columns[name] = values.tolist()
+            time_fields.append(name)
+        elif pd.api.types.is_float_dtype(series):
+            values = np.round(series.to_numpy(dtype='float64'), decimals)
+            mask = ~np.isfinite(values)
+            if mask.any():
+                values = values.astype(object)
+                values[mask] = None
+            columns[name] = values.tolist()
+        else:
+            columns[name] = _column_values(series, DATETIME_FORMAT)
+        fields.append(name)
+    return {'fields': fields, 'time_fields': time_fields, 'columns': columns}
+
+
+def frame_to_binary(df, tz=CHART_TIMEZONE):
+    """
+    DataFrame 转二进制列块（小端）：
+
+        uint32 头长度 | JSON头（补齐到4字节） | 各列数据（按头中fields顺序）
+
+    时间列为uint32 epoch秒（缺失为0），数值列为float32（缺失为NaN），非数值列省略。
+    头: {'rows': n, 'fields': [...], 'time_fields': [...], 'dtypes': [...]}
+    """
+    rows = 0 if df is None else len(df)
+    fields, time_fields, dtypes, blocks = [], [], [], []
+    for col in (_chart_columns(df) if rows else []):
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            blocks.append(np.clip(_epoch_seconds(series, tz), 0, None).astype('<u4').tobytes())
+            time_fields.append(str(col))
+            dtypes.append('uint32')
+        elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            blocks.append(series.to_numpy(dtype='float64', na_value=np.nan).astype('<f4').tobytes())
+            dtypes.append('float32')
+        else:
+            continue
+        fields.append(str(col))
+
+    header = dumps({'rows': rows, 'fields': fields, 'time_fields': time_fields, 'dtypes': dtypes})
+    header += b' ' * (-len(header) % 4)
+    return np.uint32(len(header)).astype('<u4').tobytes() + header + b''.join(blocks)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""API Key 池
+
+配置项 {provider}_api_key 可以填多个Key（逗号或换行分隔，`key|权重` 指定权重，默认1），
+每次调用从池中选一个Key：
+- least_loaded（默认）：进行中请求数/权重最小的Key，其次看最近一分钟的请求数
+- round_robin：平滑加权轮询
+每个Key统计最近一分钟的请求数（RPM）和token数（TPM），超过配置的
+{provider}_key_rpm / {provider}_key_tpm 时暂不选用；返回429的Key冷却一段时间（优先按 Retry-After），
+返回401/403的Key停用较长时间。池状态见 /api/ai/key-pool。
+"""
+
+import re
+import threading
+import time
+from collections import deque
+
+from models import SessionLocal
+from db import get_config
+
+WINDOW_SECONDS = 60
+RATE_LIMIT_COOLDOWN = 60  # 429 后的冷却秒数（连续429时翻倍）
+MAX_RATE_LIMIT_COOLDOWN = 600
+AUTH_FAILURE_COOLDOWN = 30 * 60  # 401/403 后停用的秒数
+SETTINGS_TTL = 30  # 策略和限额配置的缓存秒数
+STRATEGIES = ('least_loaded', 'round_robin')
+
+_SPLIT_RE = re.compile(r'[,\n]')
+
+
+def parse_keys(value):
+    """配置值 -> [(key, weight)]，忽略空项，重复的Key只保留第一个"""
+    entries = []
+    seen = set()
+    for part in _SPLIT_RE.split(value or ''):
+        part = part.strip()
+        if not part:
+            continue
+        key, _, weight = part.partition('|')
+        key = key.strip()
+        try:
+            weight = max(int(weight), 1) if weight.strip() else 1
+        except ValueError:
+            weight = 1
+        if key and key not in seen:
+            seen.add(key)
+            entries.append((key, weight))
+    return entries
+
+
+def primary_key(value):
+    """配置值中的第一个Key（用于获取模型列表等一次性请求）"""
+    entries = parse_keys(value)
+    return entries[0][0] if entries else value
+
+
+def mask_key(key):
+    return f"{key[:4]}…{key[-4:]}" if len(key) > 12 else '…' + key[-2:]
+
+
+class KeyState:
+    """单个Key的用量和冷却状态（由 KeyPool 加锁访问）"""
+
+    def __init__(self, key):
+        self.key = key
+        self.weight = 1
+        self.in_flight = 0
+        self.requests = deque()  # 最近一分钟的请求时间
+        self.tokens = deque()  # 最近一分钟的 (时间, token数)
+        self.current_weight = 0  # 平滑加权轮询
+        self.total_requests = 0
+        self.total_tokens = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.auth_failures = 0
+        self.cooldown = 0
+        self.sidelined_until = 0.0
+        self.sideline_reason = None
+
+    def trim(self, now):
+        while self.requests and self.requests[0] <= now - WINDOW_SECONDS:
+            self.requests.popleft()
+        while self.tokens and self.tokens[0][0] <= now - WINDOW_SECONDS:
+            self.tokens.popleft()
+
+    def rpm(self):
+        return len(self.requests)
+
+    def tpm(self):
+        return sum(tokens for _, tokens in self.tokens)
+
+
+class KeyLease:
+    """一次调用占用的Key，调用结束后必须 release"""
+
+    __slots__ = ('pool', 'provider', 'state', 'key', 'released')
+
+    def __init__(self, pool, provider, state):
+        self.pool = pool
+        self.provider = provider
+        self.state = state
+        self.key = state.key
+        self.released = False
+
+    def release(self, tokens=None, status=None, retry_after=None):
+        """
+        Args:
+            tokens: 本次调用消耗的token数（计入TPM）
+            status: 失败时的HTTP状态码（429/401/403 会让该Key暂停使用），成功为None
+            retry_after: 429 响应的 Retry-After 秒数
+        """
+        if not self.released:
+            self.released = True
+            self.pool._release(self, tokens, status, retry_after)
+
+
+class KeyPool:
+    """所有提供商的Key池（按提供商、Key保存状态）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}  # provider -> {key: KeyState}
+        self._settings = {}  # provider -> (读取时间, strategy, rpm, tpm)
+
+    def _load_settings(self, provider):
+        cached = self._settings.get(provider)
+        now = time.monotonic()
+        if cached is not None and now - cached[0] < SETTINGS_TTL:
+            return cached[1:]
+
+        def to_int(value):
+            try:
+                return int(value) if value else None
+            except (TypeError, ValueError):
+                return None
+
+        db = SessionLocal()
+        try:
+            strategy = get_config(db, f'{provider}_key_strategy') or get_config(db, 'api_key_strategy')
+            rpm = to_int(get_config(db, f'{provider}_key_rpm'))
+            tpm = to_int(get_config(db, f'{provider}_key_tpm'))
+        except Exception as e:
+            print(f"[Key池] 读取配置失败: {e}")
+            strategy, rpm, tpm = None, None, None
+        finally:
+            db.close()
+        if strategy not in STRATEGIES:
+            strategy = STRATEGIES[0]
+        self._settings[provider] = (now, strategy, rpm, tpm)
+        return strategy, rpm, tpm
+
+    def acquire(self, provider, value, exclude=()):
+        """
+        为一次调用选择Key
+
+        Args:
+            value: {provider}_api_key 的配置值（一个或多个Key）
+            exclude: 本次调用已失败过的Key，尽量不再选
+
+        Returns:
+            KeyLease；配置中没有Key时返回None
+        """
+        entries = parse_keys(value)
+        if not entries:
+            return None
+        strategy, rpm_limit, tpm_limit = self._load_settings(provider)
+        now = time.monotonic()
+        with self._lock:
+            states = self._states.setdefault(provider, {})
+            candidates = []
+            for key, weight in entries:
+                state = states.get(key)
+                if state is None:
+                    state = states[key] = KeyState(key)
+                state.weight = weight
+                state.trim(now)
+                candidates.append(state)
+
+            def usable(state):
+                return (state.sidelined_until <= now and state.key not in exclude
+                        and (rpm_limit is None or state.rpm() < rpm_limit)
+                        and (tpm_limit is None or state.tpm() < tpm_limit))
+
+            available = [s for s in candidates if usable(s)]
+            if not available:
+                # 都超限或冷却中：选没被暂停的负载最低的Key，都暂停则选最早恢复的
+                active = [s for s in candidates if s.sidelined_until <= now and s.key not in exclude]
+                if active:
+                    available = active
+                else:
+                    available = [min(candidates, key=lambda s: (s.key in exclude, s.sidelined_until))]
+
+            if strategy == 'round_robin':
+                total = sum(s.weight for s in available)
+                for s in available:
+                    s.current_weight += s.weight
+                chosen = max(available, key=lambda s: s.current_weight)
+                chosen.current_weight -= total
+            else:
+                chosen = min(available, key=lambda s: ((s.in_flight + 1) / s.weight, s.rpm() / s.weight))
+
+            chosen.in_flight += 1
+            chosen.total_requests += 1
+            chosen.requests.append(now)
+            return KeyLease(self, provider, chosen)
+
+    def _release(self, lease, tokens, status, retry_after):
+        now = time.monotonic()
+        with self._lock:
+            state = lease.state
+            state.in_flight = max(state.in_flight - 1, 0)
+            if tokens:
+                state.tokens.append((now, tokens))
+                state.total_tokens += tokens
+            if status is None:
+                state.cooldown = 0
+                return
+            state.errors += 1
+            if status == 429:
+                state.rate_limited += 1
+                state.cooldown = min(max(state.cooldown * 2, RATE_LIMIT_COOLDOWN), MAX_RATE_LIMIT_COOLDOWN)
+                seconds = retry_after if retry_after else state.cooldown
+                state.sidelined_until = now + seconds
+                state.sideline_reason = 'rate_limited'
+                print(f"[Key池] {lease.provider} {mask_key(state.key)} 被限流，暂停 {seconds:.0f}s")
+            elif status in (401, 403):
+                state.auth_failures += 1
+                state.sidelined_until = now + AUTH_FAILURE_COOLDOWN
+                state.sideline_reason = 'unauthorized'
+                print(f"[Key池] {lease.provider} {mask_key(state.key)} 鉴权失败({status})，暂停 {AUTH_FAILURE_COOLDOWN}s")
+
+    def has_alternative(self, provider, value, exclude):
+        """除 exclude 外是否还有未暂停的Key"""
+        now = time.monotonic()
+        with self._lock:
+            states = self._states.get(provider, {})
+            for key, _ in parse_keys(value):
+                state = states.get(key)
+                if key not in exclude and (state is None or state.sidelined_until <= now):
+                    return True
+        return False
+
+    def status(self):
+        """各提供商Key池状态（Key脱敏）"""
+        now = time.monotonic()
+        result = {}
+        with self._lock:
+            for provider, states in self._states.items():
+                cached = self._settings.get(provider)
+                keys = []
+                for state in states.values():
+                    state.trim(now)
+                    sidelined = max(state.sidelined_until - now, 0)
+                    keys.append({
+                        'key': mask_key(state.key),
+                        'weight': state.weight,
+                        'in_flight': state.in_flight,
+                        'rpm': state.rpm(),
+                        'tpm': state.tpm(),
+                        'requests': state.total_requests,
+                        'tokens': state.total_tokens,
+                        'errors': state.errors,
+                        'rate_limited': state.rate_limited,
+                        'auth_failures': state.auth_failures,
+                        'sidelined_seconds': round(sidelined, 1) if sidelined else None,
+                        'sideline_reason': state.sideline_reason if sidelined else None,
+                    })
+                result[provider] = {
+                    'strategy': cached[1] if cached else None,
+                    'rpm_limit': cached[2] if cached else None,
+                    'tpm_limit': cached[3] if cached else None,
+                    'keys': keys,
+                }
+        return result
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_key_pool():
+    """获取全局Key池实例"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = KeyPool()
+    return _pool
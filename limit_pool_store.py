@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""涨跌停池本地存储模块
+
+历史交易日的涨跌停池不会再变化，按交易日落库（SQLite），之后只抓取本地缺失的日期；
+当日池子盘中仍在变化，只做短时内存缓存。所有池子都规整为固定类型的列，筛选逻辑可直接做向量化运算。
+"""
+
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from models import SessionLocal
+from db import LIMIT_POOL_FIELDS, get_limit_pool_dates, save_limit_pool, load_limit_pool
+from utils import TTLCache
+
+# akshare原始列名候选（按优先级，取每行第一个非空值）
+CODE_FIELDS = ['代码', '股票代码', 'code']
+NAME_FIELDS = ['名称', '股票名称', 'name']
+FIRST_TIME_FIELDS = ['首次封板时间', '最后封板时间', '封板时间', '涨停时间', '首次涨停时间']
+LAST_TIME_FIELDS = ['最后封板时间', '封板时间']
+CONSECUTIVE_FIELDS = ['连板数', '连板', '连续跌停']
+BREAK_FIELDS = ['炸板次数', '炸板', '开板次数']
+INDUSTRY_FIELDS = ['所属行业', '行业']
+
+TODAY_POOL_TTL = 60  # 当日池子缓存秒数
+TRADE_CALENDAR_TTL = 6 * 3600  # 交易日历缓存秒数
+
+
+def _empty_pool():
+    """返回空的规整池子"""
+    return _coerce_types(pd.DataFrame(columns=LIMIT_POOL_FIELDS))
+
+
+def _coerce_types(df):
+    """统一列类型：时间为HHMMSS浮点（缺失为NaN），连板/炸板为整数"""
+    df['trade_date'] = df['trade_date'].astype(str)
+    df['code'] = df['code'].astype(str)
+    df['name'] = df['name'].fillna('未知').astype(str)
+    df['industry'] = df['industry'].fillna('').astype(str)
+    for col in ['first_limit_time', 'last_limit_time']:
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    for col in ['consecutive_days', 'break_count']:
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype('int64')
+    return df.reset_index(drop=True)
+
+
+def _pick_column(raw_df, candidates):
+    """按候选列名合并出一列：每行取第一个非空（去空白后非空字符串）的值"""
+    result = pd.Series(np.nan, index=raw_df.index, dtype=object)
+    for field in candidates:
+        if field not in raw_df.columns:
+            continue
+        col = raw_df[field].astype(object)
+        text = col.astype(str).str.strip()
+        col = col.where(col.notna() & (text != ''))
+        result = result.where(result.notna(), col)
+    return result
+
+
+def parse_time_value(series):
+    """将封板时间列解析为HHMMSS整数值（'09:25:00'/'09:25'/'092500'/92500/'2024-01-01 09:25:00'）"""
+    text = series.astype(object).where(series.notna(), '').astype(str).str.strip()
+    text = text.str.split(' ').str[-1]
+    has_colon = text.str.contains(':', regex=False)
+    parts = text.str.split(':', expand=True).reindex(columns=[0, 1, 2])
+    hh = pd.to_numeric(parts[0], errors='coerce')
+    mm = pd.to_numeric(parts[1], errors='coerce')
+    ss = pd.to_numeric(parts[2], errors='coerce').fillna(0)
+    colon_value = hh * 10000 + mm * 100 + ss
+    plain_value = pd.to_numeric(text, errors='coerce')
+    return colon_value.where(has_colon, plain_value).astype('float64')
+
+
+def parse_cutoff_time(cutoff_time, default=113000):
+    """将截止时间（如'11:30'或'113000'）转换为HHMMSS整数"""
+    try:
+        cutoff_time = str(cutoff_time).strip()
+        if ':' in cutoff_time:
+            parts = cutoff_time.split(':')
+            value = int(parts[0]) * 10000 + int(parts[1]) * 100
+            if len(parts) > 2:
+                value += int(parts[2])
+            return value
+        return int(cutoff_time)
+    except Exception:
+        return default
+
+
+def format_time_value(value):
+    """HHMMSS数值转为'HH:MM:SS'字符串，缺失返回None"""
+    if value is None or pd.isna(value):
+        return None
+    text = str(int(value)).zfill(6)
+    return f"{text[0:2]}:{text[2:4]}:{text[4:6]}"
+
+
+def normalize_pool(raw_df, trade_date):
+    """将akshare返回的涨跌停池规整为 LIMIT_POOL_FIELDS 固定列"""
+    if raw_df is None or len(raw_df) == 0:
+        return _empty_pool()
+
+    code = _pick_column(raw_df, CODE_FIELDS)
+    code = code.where(code.notna(), '').astype(str).str.strip()
+    # 纯数字代码补齐到6位，非数字代码丢弃
+    valid = code.str.fullmatch(r'\d{1,6}')
+    df = pd.DataFrame({
+        'trade_date': trade_date,
+        'code': code.str.zfill(6),
+        'name': _pick_column(raw_df, NAME_FIELDS),
+        'first_limit_time': parse_time_value(_pick_column(raw_df, FIRST_TIME_FIELDS)),
+        'last_limit_time': parse_time_value(_pick_column(raw_df, LAST_TIME_FIELDS)),
+        'consecutive_days': _pick_column(raw_df, CONSECUTIVE_FIELDS),
+        'break_count': _pick_column(raw_df, BREAK_FIELDS),
+        'industry': _pick_column(raw_df, INDUSTRY_FIELDS),
+    })[valid.fillna(False).values]
+    for col in ['name', 'industry']:
+        df[col] = df[col].astype(str).str.strip().where(df[col].notna())
+    df = _coerce_types(df)
+    return df.drop_duplicates(subset='code', keep='first').reset_index(drop=True)
+
+
+def fetch_limit_pool(trade_date, pool_type='up'):
+    """从akshare抓取某日的涨停池/跌停池，返回规整后的DataFrame；失败返回None"""
+    try:
+        import akshare as ak
+        print(f"[API] 调用akshare获取{'涨停' if pool_type == 'up' else '跌停'}数据，日期: {trade_date}")
+        if pool_type == 'up':
+            raw_df = ak.stock_zt_pool_em(date=trade_date)
+        else:
+            raw_df = ak.stock_dt_pool_em(date=trade_date)
+        df = normalize_pool(raw_df, trade_date)
+        print(f"[API] 日期 {trade_date} 获取到 {len(df)} 条{'涨停' if pool_type == 'up' else '跌停'}数据")
+        return df
+    except Exception as e:
+        print(f"[API] 获取 {trade_date} {pool_type} 池数据失败: {e}")
+        traceback.print_exc()
+        return None
+
+
+class LimitPoolStore:
+    """涨跌停池存储：内存 -> SQLite -> akshare 三级读取"""
+
+    def __init__(self):
+        self._history = TTLCache(maxsize=1024)  # 历史交易日池子，不过期
+        self._today = TTLCache(maxsize=8, ttl=TODAY_POOL_TTL)
+        self._calendar = TTLCache(maxsize=4, ttl=TRADE_CALENDAR_TTL)
+        self._fetch_lock = threading.Lock()
+
+    @staticmethod
+    def _date_str(trade_date):
+        if isinstance(trade_date, str):
+            return trade_date.replace('-', '')
+        return trade_date.strftime('%Y%m%d')
+
+    def get_pool(self, trade_date, pool_type='up'):
+        """获取单日池子"""
+        return self.get_pools([trade_date], pool_type)[self._date_str(trade_date)]
+
+    def get_pools(self, trade_dates, pool_type='up'):
+        """批量获取多日池子，返回 {YYYYMMDD: DataFrame}"""
+        today_str = datetime.now().strftime('%Y%m%d')
+        date_strs = [self._date_str(d) for d in trade_dates]
+        pools = {}
+        missing = []
+
+        for date_str in date_strs:
+            if date_str >= today_str:
+                pools[date_str] = self._get_live_pool(date_str, pool_type)
+                continue
+            cached = self._history.get((pool_type, date_str))
+            if cached is not None:
+                pools[date_str] = cached
+            else:
+                missing.append(date_str)
+
+        if missing:
+            with self._fetch_lock:
+                pools.update(self._load_or_fetch(missing, pool_type))
+        return pools
+
+    def get_panel(self, trade_dates, pool_type='up'):
+        """多日池子拼接为一张长表（按 trade_date 区分）"""
+        pools = self.get_pools(trade_dates, pool_type)
+        frames = [df for df in pools.values() if len(df) > 0]
+        if not frames:
+            return _empty_pool()
+        return pd.concat(frames, ignore_index=True)
+
+    def _get_live_pool(self, date_str, pool_type):
+        cached = self._today.get((pool_type, date_str))
+        if cached is not None:
+            return cached
+        df = fetch_limit_pool(date_str, pool_type)
+        if df is None:
+            return _empty_pool()
+        self._today.set((pool_type, date_str), df)
+        return df
+
+    def _load_or_fetch(self, date_strs, pool_type):
+        pools = {}
+        # 加锁后再查一次内存，避免并发请求重复抓取
+        pending = []
+        for date_str in date_strs:
+            cached = self._history.get((pool_type, date_str))
+            if cached is not None:
+                pools[date_str] = cached
+            else:
+                pending.append(date_str)
+        if not pending:
+            return pools
+        date_strs = pending
+
+        db = SessionLocal()
+        try:
+            stored = get_limit_pool_dates(db, pool_type, date_strs)
+            if stored:
+                rows = load_limit_pool(db, pool_type, sorted(stored))
+                stored_df = _coerce_types(pd.DataFrame.from_records(rows, columns=LIMIT_POOL_FIELDS))
+                grouped = dict(tuple(stored_df.groupby('trade_date', sort=False)))
+                for date_str in stored:
+                    df = grouped.get(date_str)
+                    df = df.reset_index(drop=True) if df is not None else _empty_pool()
+                    self._history.set((pool_type, date_str), df)
+                    pools[date_str] = df
+
+            for date_str in date_strs:
+                if date_str in stored:
+                    continue
+                df = fetch_limit_pool(date_str, pool_type)
+                # 涨停池不可能整日为空，空结果视为抓取异常不落库；跌停池允许为空
+                if df is None or (len(df) == 0 and pool_type == 'up'):
+                    pools[date_str] = _empty_pool()
+                    continue
+                records = df.drop(columns=['trade_date']).replace({np.nan: None}).to_dict('records')
+                save_limit_pool(db, date_str, pool_type, records)
+                self._history.set((pool_type, date_str), df)
+                pools[date_str] = df
+        finally:
+            db.close()
+        return pools
+
+    def get_recent_trade_dates(self, count=3):
+        """获取最近的交易日（含今天，如今天是交易日），按日期倒序"""
+        today = datetime.now().date()
+        cached = self._calendar.get(today)
+        if cached is None:
+            try:
+                import akshare as ak
+                trade_cal = ak.tool_trade_date_hist_sina()
+                cached = pd.to_datetime(trade_cal['trade_date']).dt.date
+                cached = sorted((d for d in cached if d <= today), reverse=True)
+                self._calendar.set(today, cached)
+            except Exception as e:
+                print(f"[API] 获取交易日失败: {e}")
+                traceback.print_exc()
+                cached = []
+
+        if len(cached) >= count:
+            return cached[:count]
+
+        print(f"[API] 交易日数据不足，只有 {len(cached)} 个，按工作日估计")
+        dates = []
+        day = today
+        while len(dates) < count:
+            if day.weekday() < 5:
+                dates.append(day)
+            day -= timedelta(days=1)
+        return dates
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_limit_pool_store():
+    """获取全局涨跌停池存储实例"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = LimitPoolStore()
+    return _store
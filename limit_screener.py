@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""涨停池多日筛选引擎
+
+基于本地存储的涨停池面板（见 limit_pool_store），按参数做向量化筛选：
+回看N个交易日内满足条件的涨停次数、封板截止时间、炸板次数、连板数、行业，以及T日涨跌停排除。
+历史池子全部来自内存/本地库，调整参数重复筛选只需一次批量行情请求。
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from data_fetchers import get_realtime_data_batch
+from limit_pool_store import get_limit_pool_store, parse_cutoff_time, format_time_value
+
+DEFAULT_SCREEN_PARAMS = {
+    'lookback': 2,  # 回看交易日数（不含T日）
+    'min_hits': 2,  # 回看期内最少满足条件的涨停天数
+    'limit_time': '11:30',  # 首次封板截止时间
+    'max_break': None,  # 单日最大炸板次数，None表示不限
+    'min_consecutive': 0,  # 最近一次涨停时的最少连板数
+    'industries': [],  # 行业过滤（包含匹配），空表示不限
+    'exclude_today_up': True,  # 排除T日涨停
+    'exclude_today_down': True,  # 排除T日跌停
+    'with_quotes': True,  # 是否附带实时行情
+}
+
+MAX_LOOKBACK = 20
+
+
+def parse_screen_params(args):
+    """从请求参数（dict-like）解析筛选参数，非法值回退默认值"""
+    params = dict(DEFAULT_SCREEN_PARAMS)
+
+    def _int(name, low, high):
+        try:
+            value = int(args.get(name))
+            return min(max(value, low), high)
+        except (TypeError, ValueError):
+            return params[name]
+
+    def _bool(name):
+        value = args.get(name)
+        if value is None:
+            return params[name]
+        return str(value).lower() in ('1', 'true', 'yes')
+
+    params['lookback'] = _int('lookback', 1, MAX_LOOKBACK)
+    params['min_hits'] = _int('min_hits', 1, MAX_LOOKBACK)
+    params['min_consecutive'] = _int('min_consecutive', 0, 50)
+    if args.get('max_break') not in (None, ''):
+        params['max_break'] = _int('max_break', 0, 100)
+    params['limit_time'] = args.get('limit_time') or params['limit_time']
+    industry = args.get('industry') or ''
+    params['industries'] = [item.strip() for item in industry.split(',') if item.strip()]
+    params['exclude_today_up'] = _bool('exclude_today_up')
+    params['exclude_today_down'] = _bool('exclude_today_down')
+    params['with_quotes'] = _bool('with_quotes')
+    params['min_hits'] = min(params['min_hits'], params['lookback'])
+    return params
+
+
+def screen_limit_up(params):
+    """
+    执行涨停池多日筛选
+
+    Args:
+        params: parse_screen_params 返回的参数dict
+
+    Returns:
+        dict: {'trade_dates': [...], 'stocks': [...]}，stocks按命中次数倒序、最早封板时间正序
+    """
+    store = get_limit_pool_store()
+    lookback = params['lookback']
+    trade_dates = store.get_recent_trade_dates(lookback + 1)
+    t_date, history_dates = trade_dates[0], trade_dates[1:]
+    history_strs = [d.strftime('%Y%m%d') for d in history_dates]
+
+    panel = store.get_panel(history_dates, 'up')
+    cutoff_value = parse_cutoff_time(params['limit_time'])
+
+    # 单日条件：封板时间 + 炸板次数
+    mask = (panel['first_limit_time'] <= cutoff_value).to_numpy()
+    if params['max_break'] is not None:
+        mask = mask & (panel['break_count'] <= params['max_break']).to_numpy()
+    hits_df = panel[mask]
+
+    # 统计命中天数，取每只股票最近一次命中的记录作为展示信息
+    hit_counts = hits_df.groupby('code', sort=False)['trade_date'].nunique()
+    selected = hit_counts[hit_counts >= params['min_hits']].index
+    latest = (hits_df[hits_df['code'].isin(selected)]
+              .sort_values('trade_date', ascending=False, kind='stable')
+              .drop_duplicates(subset='code', keep='first')
+              .set_index('code'))
+
+    if params['min_consecutive'] > 0:
+        latest = latest[latest['consecutive_days'] >= params['min_consecutive']]
+    if params['industries']:
+        pattern = '|'.join(map(re.escape, params['industries']))
+        latest = latest[latest['industry'].str.contains(pattern, regex=True, na=False)]
+
+    # T日排除
+    excluded = np.zeros(len(latest), dtype=bool)
+    if params['exclude_today_up']:
+        excluded |= latest.index.isin(store.get_pool(t_date, 'up')['code'])
+    if params['exclude_today_down']:
+        excluded |= latest.index.isin(store.get_pool(t_date, 'down')['code'])
+    latest = latest[~excluded]
+    if len(latest) == 0:
+        return {'trade_dates': trade_dates, 'stocks': []}
+
+    # 各日封板时间：code x trade_date 透视表
+    limit_times = (hits_df[hits_df['code'].isin(latest.index)]
+                   .pivot_table(index='code', columns='trade_date', values='first_limit_time', aggfunc='min')
+                   .reindex(index=latest.index, columns=history_strs))
+    first_times = limit_times.min(axis=1)
+    order = pd.DataFrame({
+        'hits': hit_counts.reindex(latest.index).to_numpy(),
+        'first_time': first_times.to_numpy(),
+    }, index=latest.index).sort_values(['hits', 'first_time'], ascending=[False, True], kind='stable').index
+
+    quotes = get_realtime_data_batch(list(order)) if params['with_quotes'] and len(order) > 0 else {}
+
+    stocks = []
+    for code in order:
+        row = latest.loc[code]
+        quote = quotes.get(code) or {}
+        times = limit_times.loc[code]
+        stocks.append({
+            'code': code,
+            'name': row['name'],
+            'hits': int(hit_counts[code]),
+            'limit_times': {
+                f"{d[:4]}-{d[4:6]}-{d[6:]}": format_time_value(times[d]) for d in history_strs
+            },
+            'latest_hit_date': row['trade_date'],
+            'consecutive_days': int(row['consecutive_days']),
+            'break_count': int(row['break_count']),
+            'industry': row['industry'],
+            'current_price': quote.get('current_price'),
+            'change_percent': quote.get('change_percent'),
+            'volume': quote.get('volume'),
+            'amount': quote.get('amount'),
+        })
+
+    return {'trade_dates': trade_dates, 'stocks': stocks}
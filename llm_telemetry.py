@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""大模型调用统计
+
+每次 AIService 调用都会生成一条记录（排队等待、首字节、总耗时、token用量、重试次数、估算费用），
+这里按 提供商/模型 累计，并按辩论任务保留最近的调用明细，用于找出拖慢辩论的Agent或提供商。
+"""
+
+import threading
+from collections import deque
+
+from utils import TTLCache
+
+RECENT_LATENCIES = 200  # 每个 提供商/模型 保留的最近耗时样本数（算分位数）
+JOB_CACHE_SIZE = 200
+JOB_CACHE_TTL = 24 * 3600
+MAX_CALLS_PER_JOB = 2000
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(q * (len(ordered) - 1))), len(ordered) - 1)
+    return round(ordered[index], 3)
+
+
+def summarize_calls(calls):
+    """
+    汇总一组调用记录（LLMCallResult.to_dict() 的结果）
+
+    Returns:
+        dict: {'total': 汇总, 'by_provider': {provider/model: 汇总}, 'by_agent': {agent: 汇总}}
+    """
+    def empty():
+        return {'calls': 0, 'errors': 0, 'canceled': 0, 'retries': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                'cost': 0.0, 'total_seconds': 0.0, 'max_seconds': 0.0, 'queue_wait_seconds': 0.0}
+
+    def add(bucket, call):
+        bucket['calls'] += 1
+        if call.get('canceled'):
+            bucket['canceled'] += 1
+        elif call.get('error'):
+            bucket['errors'] += 1
+        bucket['retries'] += call.get('retries') or 0
+        bucket['prompt_tokens'] += call.get('prompt_tokens') or 0
+        bucket['completion_tokens'] += call.get('completion_tokens') or 0
+        bucket['cost'] += call.get('cost') or 0.0
+        bucket['total_seconds'] += call.get('total') or 0.0
+        bucket['max_seconds'] = max(bucket['max_seconds'], call.get('total') or 0.0)
+        bucket['queue_wait_seconds'] += call.get('queue_wait') or 0.0
+
+    def finish(bucket):
+        for key in ('cost', 'total_seconds', 'max_seconds', 'queue_wait_seconds'):
+            bucket[key] = round(bucket[key], 4 if key == 'cost' else 3)
+        bucket['avg_seconds'] = round(bucket['total_seconds'] / bucket['calls'], 3) if bucket['calls'] else None
+        return bucket
+
+    total = empty()
+    by_provider = {}
+    by_agent = {}
+    for call in calls:
+        add(total, call)
+        add(by_provider.setdefault(f"{call.get('provider')}/{call.get('model')}", empty()), call)
+        if call.get('agent'):
+            add(by_agent.setdefault(call['agent'], empty()), call)
+    return {
+        'total': finish(total),
+        'by_provider': {key: finish(value) for key, value in by_provider.items()},
+        'by_agent': {key: finish(value) for key, value in by_agent.items()},
+    }
+
+
+class LLMTelemetry:
+    """全局调用统计（按 提供商/模型 累计，按任务保留明细）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._providers = {}  # 'provider/model' -> 累计值
+        self._jobs = TTLCache(maxsize=JOB_CACHE_SIZE, ttl=JOB_CACHE_TTL)  # job_id -> [调用记录]
+
+    def record(self, result, job_id=None, agent=None):
+        """记录一次调用（result 为 LLMCallResult）"""
+        call = result.to_dict()
+        if agent:
+            call['agent'] = agent
+        key = f"{result.provider}/{result.model}"
+        with self._lock:
+            entry = self._providers.get(key)
+            if entry is None:
+                entry = self._providers[key] = {
+                    'calls': 0, 'errors': 0, 'canceled': 0, 'retries': 0, 'prompt_tokens': 0,
+                    'completion_tokens': 0, 'cost': 0.0, 'latencies': deque(maxlen=RECENT_LATENCIES),
+                    'ttfbs': deque(maxlen=RECENT_LATENCIES),
+                }
+            entry['calls'] += 1
+            if result.canceled:
+                entry['canceled'] += 1
+            elif result.error:
+                entry['errors'] += 1
+            entry['retries'] += result.retries
+            entry['prompt_tokens'] += result.prompt_tokens or 0
+            entry['completion_tokens'] += result.completion_tokens or 0
+            entry['cost'] += result.cost or 0.0
+            if result.total is not None and not result.canceled:
+                entry['latencies'].append(result.total)
+            if result.ttfb is not None:
+                entry['ttfbs'].append(result.ttfb)
+            if job_id:
+                calls = self._jobs.get(job_id)
+                if calls is None:
+                    calls = []
+                    self._jobs.set(job_id, calls)
+                if len(calls) < MAX_CALLS_PER_JOB:
+                    calls.append(call)
+        return call
+
+    def job_calls(self, job_id):
+        """任务的调用明细（服务重启后为None）"""
+        with self._lock:
+            calls = self._jobs.get(job_id)
+            return list(calls) if calls is not None else None
+
+    def latency_percentile(self, provider, model, q, min_samples=1):
+        """提供商/模型最近调用耗时的分位数（秒），样本不足 min_samples 时返回None"""
+        with self._lock:
+            entry = self._providers.get(f"{provider}/{model}")
+            latencies = list(entry['latencies']) if entry is not None else []
+        if len(latencies) < min_samples:
+            return None
+        return _percentile(latencies, q)
+
+    def stats(self):
+        with self._lock:
+            providers = {}
+            for key, entry in self._providers.items():
+                latencies = list(entry['latencies'])
+                ttfbs = list(entry['ttfbs'])
+                providers[key] = {
+                    'calls': entry['calls'],
+                    'errors': entry['errors'],
+                    'canceled': entry['canceled'],
+                    'retries': entry['retries'],
+                    'prompt_tokens': entry['prompt_tokens'],
+                    'completion_tokens': entry['completion_tokens'],
+                    'cost': round(entry['cost'], 4),
+                    'p50_seconds': _percentile(latencies, 0.5),
+                    'p95_seconds': _percentile(latencies, 0.95),
+                    'p50_ttfb_seconds': _percentile(ttfbs, 0.5),
+                }
+        return {'providers': providers}
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_llm_telemetry():
+    """获取全局大模型调用统计实例"""
+    global _telemetry
+    if _telemetry is None:
+        with _telemetry_lock:
+            if _telemetry is None:
+                _telemetry = LLMTelemetry()
+    return _telemetry
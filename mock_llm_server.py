@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""本地模拟大模型服务（OpenAI chat/completions 兼容）
+
+用于在不调用真实提供商的情况下压测辩论流程。支持普通和流式（stream=true，SSE）响应，
+可配置延迟分布、错误率、限流率和输出速度。通过已有的 base URL 环境变量接入 AIService：
+    python mock_llm_server.py --port 8900 --latency lognormal:1.0,0.5 --error-rate 0.02
+    SILICONFLOW_API_BASE=http://127.0.0.1:8900 python api_server.py      # provider=siliconflow
+    DASHSCOPE_API_BASE=http://127.0.0.1:8900/v1 python api_server.py     # provider=qwen
+
+延迟分布格式: fixed:秒 | uniform:最小,最大 | exp:均值 | lognormal:中位数,sigma
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_COMPLETION_TOKENS = 400
+DEFAULT_TOKENS_PER_SECOND = 80
+_CJK_RE = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+FILLER = "从技术面看，均线多头排列，成交量温和放大；资金面主力净流入，但需警惕短期获利盘回吐风险。"
+
+
+def estimate_tokens(text):
+    """粗略估算token数（与 context_budget.estimate_tokens 相同的规则；模拟服务不导入应用模块，避免打开数据库）"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def parse_latency(spec):
+    """延迟分布字符串 -> 采样函数（返回秒）"""
+    kind, _, args = (spec or 'fixed:0').partition(':')
+    values = [float(v) for v in args.split(',') if v.strip()] if args else []
+    if kind == 'fixed':
+        value = values[0] if values else 0.0
+        return lambda: value
+    if kind == 'uniform':
+        low, high = values
+        return lambda: random.uniform(low, high)
+    if kind == 'exp':
+        mean, = values
+        return lambda: random.expovariate(1.0 / mean) if mean > 0 else 0.0
+    if kind == 'lognormal':
+        median, sigma = values
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"未知的延迟分布: {spec}")
+
+
+class MockLLMConfig:
+    """模拟服务的行为参数"""
+
+    def __init__(self, latency='fixed:0.5', error_rate=0.0, rate_limit_rate=0.0,
+                 tokens_per_second=DEFAULT_TOKENS_PER_SECOND, completion_tokens=DEFAULT_COMPLETION_TOKENS):
+        self.latency_spec = latency
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'streams': 0, 'errors': 0, 'rate_limited': 0,
+                      'prompt_tokens': 0, 'completion_tokens': 0}
+
+    def count(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+
+
+def _completion_text(tokens):
+    """生成约 tokens 个token的中文文本"""
+    repeat = tokens // max(estimate_tokens(FILLER), 1) + 1
+    return (FILLER * repeat)[:tokens]
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config = None  # MockLLMConfig，由 make_server 设置
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'mock-model', 'object': 'model'}]})
+        elif self.path.rstrip('/').endswith('/stats'):
+            self._send_json(200, dict(self.config.stats, latency=self.config.latency_spec))
+        else:
+            self._send_json(404, {'error': {'message': 'not found'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'invalid json'}})
+            return
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+
+        config = self.config
+        config.count(requests=1)
+        prompt = "\n".join(str(m.get('content', '')) for m in request.get('messages', []))
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = max(int(request.get('max_tokens') or config.completion_tokens), 1)
+        completion_tokens = min(completion_tokens, config.completion_tokens)
+
+        time.sleep(max(config.latency(), 0.0))
+        roll = random.random()
+        if roll < config.rate_limit_rate:
+            config.count(rate_limited=1)
+            self._send_json(429, {'error': {'message': 'rate limited (mock)', 'type': 'rate_limit'}},
+                            headers={'Retry-After': '1'})
+            return
+        if roll < config.rate_limit_rate + config.error_rate:
+            config.count(errors=1)
+            self._send_json(500, {'error': {'message': 'internal error (mock)'}})
+            return
+
+        config.count(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        text = _completion_text(completion_tokens)
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                 'total_tokens': prompt_tokens + completion_tokens}
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        model = request.get('model') or 'mock-model'
+        if request.get('stream'):
+            config.count(streams=1)
+            self._stream(completion_id, model, text, usage)
+            return
+
+        if config.tokens_per_second:
+            time.sleep(completion_tokens / config.tokens_per_second)
+        self._send_json(200, {
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+            'usage': usage,
+        })
+
+    def _stream(self, completion_id, model, text, usage, chunk_tokens=8):
+        """按 tokens_per_second 的速度分块输出 SSE"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def write_event(payload):
+            data = f"data: {payload}\n\n".encode('utf-8')
+            self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None, extra=None):
+            payload = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                       'model': model, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+            payload.update(extra or {})
+            write_event(json.dumps(payload, ensure_ascii=False))
+
+        try:
+            chunk({'role': 'assistant'})
+            for start in range(0, len(text), chunk_tokens):
+                if self.config.tokens_per_second:
+                    time.sleep(chunk_tokens / self.config.tokens_per_second)
+                chunk({'content': text[start:start + chunk_tokens]})
+            chunk({}, finish_reason='stop', extra={'usage': usage})
+            write_event('[DONE]')
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 客户端已断开（如任务被终止）
+
+
+def make_server(config, host='127.0.0.1', port=0):
+    """创建模拟服务（port=0 时随机端口，见 server.server_port），调用方负责 serve_forever"""
+    handler = type('ConfiguredMockLLMHandler', (MockLLMHandler,), {'config': config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(config, host='127.0.0.1', port=0):
+    """在后台线程启动模拟服务，返回 (server, base_url)"""
+    server = make_server(config, host, port)
+    threading.Thread(target=server.serve_forever, name='mock-llm-server', daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description='本地模拟大模型服务（OpenAI兼容）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', default='fixed:0.5', help='首字节前的延迟分布，如 lognormal:1.0,0.5')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回500的比例')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='返回429的比例')
+    parser.add_argument('--tps', type=float, default=DEFAULT_TOKENS_PER_SECOND, help='输出速度（token/秒），0为不限')
+    parser.add_argument('--completion-tokens', type=int, default=DEFAULT_COMPLETION_TOKENS, help='每次回复的token数')
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_arg_parser().parse_args()
+    config = MockLLMConfig(args.latency, args.error_rate, args.rate_limit_rate, args.tps, args.completion_tokens)
+    server = make_server(config, args.host, args.port)
+    print(f"模拟大模型服务: http://{args.host}:{server.server_port}  (POST /v1/chat/completions, GET /v1/models, GET /stats)")
+    print(f"延迟 {args.latency}，错误率 {args.error_rate}，限流率 {args.rate_limit_rate}，"
+          f"输出 {args.completion_tokens} tokens @ {args.tps} tok/s")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 """数据库模型定义"""
 
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, Text, DateTime, Float
+from sqlalchemy import create_engine, Column, Integer, String, Boolean, Text, DateTime, Float, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -40,6 +40,7 @@ class Agent(Base):
     ai_provider = Column(String(20))  # 'openai', 'deepseek', 'qwen', 'gemini', 'grok'
     model = Column(String(50))
     sort_order = Column(Integer, default=0)
+    data_sections = Column(String(200))  # 逗号分隔的数据区块（见 data_formatters.DATA_SECTIONS），为空时使用全部
     created_at = Column(DateTime, default=datetime.now)
 
 class AnalysisCache(Base):
@@ -71,13 +72,131 @@ class DebateJob(Base):
     report_md = Column(Text)
     error = Column(Text)
     canceled = Column(Boolean, default=False)
+    checkpoint = Column(Text)  # JSON：已获取的股票/舆情数据，进程重启后据此和steps恢复任务
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+class LimitPoolDay(Base):
+    """涨跌停池落库记录表（每个交易日每种池子一行，空池也记录，避免重复抓取）"""
+    __tablename__ = 'limit_pool_days'
+    
+    trade_date = Column(String(8), primary_key=True)  # YYYYMMDD
+    pool_type = Column(String(4), primary_key=True)  # 'up'=涨停池, 'down'=跌停池
+    count = Column(Integer, default=0)
+    fetched_at = Column(DateTime, default=datetime.now)
+
+class LimitPoolRecord(Base):
+    """涨跌停池明细表（已规整为固定类型的列）"""
+    __tablename__ = 'limit_pool_records'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    trade_date = Column(String(8), nullable=False, index=True)  # YYYYMMDD
+    pool_type = Column(String(4), nullable=False)  # 'up' / 'down'
+    code = Column(String(6), nullable=False, index=True)
+    name = Column(String(50))
+    first_limit_time = Column(Integer)  # 首次封板时间，HHMMSS整数，如 92500
+    last_limit_time = Column(Integer)  # 最后封板时间，HHMMSS整数
+    consecutive_days = Column(Integer, default=0)  # 连板数
+    break_count = Column(Integer, default=0)  # 炸板次数
+    industry = Column(String(50))
+
+class MoneyFlowDaily(Base):
+    """个股日线资金流向表（净流入单位：万元，净比单位：%）"""
+    __tablename__ = 'money_flow_daily'
+    
+    code = Column(String(6), primary_key=True)
+    trade_date = Column(String(10), primary_key=True)  # YYYY-MM-DD
+    main_net_inflow = Column(Float)
+    super_large_net_inflow = Column(Float)
+    large_net_inflow = Column(Float)
+    medium_net_inflow = Column(Float)
+    small_net_inflow = Column(Float)
+    main_net_ratio = Column(Float)
+    super_large_net_ratio = Column(Float)
+    large_net_ratio = Column(Float)
+    medium_net_ratio = Column(Float)
+    small_net_ratio = Column(Float)
+    close = Column(Float)
+    change_percent = Column(Float)
+
+class SentimentItem(Base):
+    """舆情条目表（新闻、股吧帖子），标题全文索引见 sentiment_fts"""
+    __tablename__ = 'sentiment_items'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)  # 全文索引的rowid
+    item_key = Column(String(300), unique=True, nullable=False)  # 'post:<post_id>' / 'news:<code>:<url或标题>'
+    code = Column(String(6), nullable=False)
+    kind = Column(String(8), nullable=False)  # 'news' / 'post'
+    title = Column(Text, nullable=False)
+    url = Column(Text)
+    author = Column(String(100))
+    source = Column(String(50))
+    published_at = Column(String(19))  # YYYY-MM-DD HH:MM:SS
+    read_count = Column(Integer, default=0)
+    comment_count = Column(Integer, default=0)
+    fetched_at = Column(DateTime, default=datetime.now)
+    
+    __table_args__ = (
+        Index('ix_sentiment_items_code_time', 'code', 'published_at'),
+    )
+
+# 舆情标题全文索引（FTS5 trigram 分词，支持中文子串检索），通过触发器与 sentiment_items 同步
+SENTIMENT_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS sentiment_fts USING fts5("
+    "title, content='sentiment_items', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS sentiment_items_ai AFTER INSERT ON sentiment_items BEGIN "
+    "INSERT INTO sentiment_fts(rowid, title) VALUES (new.id, new.title); END",
+    "CREATE TRIGGER IF NOT EXISTS sentiment_items_ad AFTER DELETE ON sentiment_items BEGIN "
+    "INSERT INTO sentiment_fts(sentiment_fts, rowid, title) VALUES ('delete', old.id, old.title); END",
+    "CREATE TRIGGER IF NOT EXISTS sentiment_items_au AFTER UPDATE OF title ON sentiment_items BEGIN "
+    "INSERT INTO sentiment_fts(sentiment_fts, rowid, title) VALUES ('delete', old.id, old.title); "
+    "INSERT INTO sentiment_fts(rowid, title) VALUES (new.id, new.title); END",
+]
+
+def init_sentiment_fts(engine):
+    """创建舆情全文索引，返回是否可用（SQLite未编译FTS5或版本低于3.34不支持trigram时返回False）"""
+    try:
+        with engine.begin() as conn:
+            for ddl in SENTIMENT_FTS_DDL:
+                conn.execute(text(ddl))
+        return True
+    except Exception as e:
+        print(f"[数据库] 舆情全文索引不可用，检索将退化为LIKE匹配: {e}")
+        return False
+
+# 建表后新增的列：(表名, 列名, 列定义)。create_all不会修改已存在的表，启动时补齐
+ADDED_COLUMNS = [
+    ('agents', 'data_sections', 'VARCHAR(200)'),
+    ('debate_jobs', 'checkpoint', 'TEXT'),
+]
+
+def migrate_columns(engine):
+    """为旧数据库补齐 ADDED_COLUMNS 中缺少的列"""
+    with engine.begin() as conn:
+        for table, column, ddl in ADDED_COLUMNS:
+            existing = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+            if column not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                print(f"[数据库] 已为 {table} 添加列 {column}")
+
+def migrate_sentiment_keys(engine):
+    """旧版新闻 item_key 为 'news:<url>'（不含股票代码，同一新闻只能归到一只股票），改为 'news:<code>:<url>'"""
+    with engine.begin() as conn:
+        result = conn.execute(text(
+            "UPDATE sentiment_items SET item_key = 'news:' || code || ':' || substr(item_key, 6) "
+            "WHERE kind = 'news' AND item_key NOT LIKE 'news:' || code || ':%'"
+        ))
+        if result.rowcount:
+            print(f"[数据库] 已迁移 {result.rowcount} 条新闻舆情的 item_key")
+
 # 数据库初始化
-DB_PATH = os.path.join(os.path.dirname(__file__), 'database.db')
+# STOCK_DB_PATH 可指定其他数据库文件（如基准测试用的临时库）
+DB_PATH = os.getenv('STOCK_DB_PATH') or os.path.join(os.path.dirname(__file__), 'database.db')
 engine = create_engine(f'sqlite:///{DB_PATH}', echo=False)
 Base.metadata.create_all(engine)
+migrate_columns(engine)
+migrate_sentiment_keys(engine)
+SENTIMENT_FTS_AVAILABLE = init_sentiment_fts(engine)
 SessionLocal = sessionmaker(bind=engine)
 
 def get_db():
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""个股日线资金流向本地存储模块
+
+历史资金流向按 (代码, 交易日) 落库（SQLite），内存中每只股票保存为一个日期数组 + NumPy矩阵；
+之后只抓取最后一个已存日期以来的数据（最后一天盘中仍在变化，每次都重新抓取覆盖）。
+N日累计净流入、连续流入/流出天数等聚合直接在矩阵上做前缀和运算。
+"""
+
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from models import SessionLocal
+from db import MONEY_FLOW_DAILY_FIELDS, load_money_flow_daily, save_money_flow_daily
+from data_fetchers import get_money_flow_history_matrix, MONEY_FLOW_NET_FIELDS
+from response_decoder import matrix_to_records
+from utils import TTLCache
+
+FIELD_INDEX = {field: i for i, field in enumerate(MONEY_FLOW_DAILY_FIELDS)}
+SUMMARY_WINDOWS = (3, 5, 10, 20, 60)
+SERIES_CACHE_SIZE = 512
+TRADING_REFRESH_TTL = 60  # 交易时段内多久重新抓取一次当日数据（秒）
+CLOSED_REFRESH_TTL = 30 * 60  # 非交易时段
+INCREMENTAL_BUFFER_DAYS = 3  # 增量抓取时额外多取的天数（节假日估算误差）
+
+
+def _is_trading_time(now=None):
+    """粗略判断是否处于A股交易时段（工作日 9:15-11:30、13:00-15:00）"""
+    now = now or datetime.now()
+    if now.weekday() >= 5:
+        return False
+    hhmm = now.hour * 100 + now.minute
+    return 915 <= hhmm <= 1130 or 1300 <= hhmm <= 1500
+
+
+def _business_days_since(date_str, today=None):
+    """从date_str（不含）到今天（含）之间的工作日数"""
+    today = today or datetime.now().date()
+    try:
+        start = datetime.strptime(date_str, '%Y-%m-%d').date() + timedelta(days=1)
+    except ValueError:
+        return None
+    if start > today:
+        return 0
+    return int(np.busday_count(start, today + timedelta(days=1)))
+
+
+class MoneyFlowSeries:
+    """单只股票的日线资金流向（列式，按日期升序，只读）"""
+
+    __slots__ = ('code', 'dates', 'values', '_cumsum')
+
+    def __init__(self, code, dates, values):
+        self.code = code
+        self.dates = dates
+        self.values = values
+        self._cumsum = None
+
+    @classmethod
+    def empty(cls, code):
+        return cls(code, np.empty(0, dtype=object), np.empty((0, len(MONEY_FLOW_DAILY_FIELDS)), dtype='float64'))
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def last_date(self):
+        return self.dates[-1] if len(self.dates) else None
+
+    def column(self, field):
+        return self.values[:, FIELD_INDEX[field]]
+
+    def tail(self, days):
+        """最近days天（days<=0 返回全部）"""
+        if days <= 0 or days >= len(self):
+            return self
+        return MoneyFlowSeries(self.code, self.dates[-days:], self.values[-days:])
+
+    def merge(self, dates, values):
+        """合并新抓取的数据：与已有日期重叠的部分以新数据为准，返回新的序列"""
+        if len(dates) == 0:
+            return self
+        keep = ~np.isin(self.dates, dates)
+        merged_dates = np.concatenate([self.dates[keep], dates])
+        merged_values = np.vstack([self.values[keep], values])
+        order = np.argsort(merged_dates, kind='stable')
+        return MoneyFlowSeries(self.code, merged_dates[order], merged_values[order])
+
+    def to_records(self, date_key='date'):
+        return matrix_to_records(self.dates, date_key, self.values, MONEY_FLOW_DAILY_FIELDS)
+
+    def _prefix_sums(self):
+        """各列前缀和（NaN按0计），首行补0：区间[i, j)之和 = cs[j] - cs[i]"""
+        if self._cumsum is None:
+            cumsum = np.zeros((len(self) + 1, self.values.shape[1]), dtype='float64')
+            np.nancumsum(self.values, axis=0, out=cumsum[1:])
+            self._cumsum = cumsum
+        return self._cumsum
+
+    def cumulative(self, field, window):
+        """最近window天的累计值（数据不足时按已有天数计算）"""
+        cumsum = self._prefix_sums()[:, FIELD_INDEX[field]]
+        window = min(window, len(self))
+        return float(cumsum[-1] - cumsum[-1 - window])
+
+    def rolling_sum(self, field, window):
+        """逐日的window日滚动累计，前window-1天为NaN"""
+        cumsum = self._prefix_sums()[:, FIELD_INDEX[field]]
+        result = np.full(len(self), np.nan)
+        if window <= len(self):
+            result[window - 1:] = cumsum[window:] - cumsum[:-window]
+        return result
+
+    def streak(self, field='main_net_inflow'):
+        """最近连续净流入(>0)/净流出(<0)天数，返回 (方向, 天数)；方向为 'inflow'/'outflow'/None"""
+        column = self.column(field)
+        if len(column) == 0 or not column[-1] or np.isnan(column[-1]):
+            return None, 0
+        positive = column[-1] > 0
+        same = column > 0 if positive else column < 0
+        breaks = np.flatnonzero(~same[::-1])
+        days = int(breaks[0]) if len(breaks) else len(column)
+        return ('inflow' if positive else 'outflow'), days
+
+    def positive_days(self, field, window):
+        """最近window天中净流入为正的天数"""
+        column = self.column(field)[-window:]
+        return int(np.count_nonzero(column > 0))
+
+    def summary(self, windows=SUMMARY_WINDOWS):
+        """资金流向趋势摘要：各类资金的N日累计净流入、主力连续流入/流出天数等"""
+        if len(self) == 0:
+            return {'code': self.code, 'count': 0, 'last_date': None}
+        latest = self.tail(1).to_records()[0]
+        cumulative = {
+            field: {str(window): round(self.cumulative(field, window), 2) for window in windows}
+            for field in MONEY_FLOW_NET_FIELDS
+        }
+        direction, days = self.streak('main_net_inflow')
+        return {
+            'code': self.code,
+            'count': len(self),
+            'first_date': self.dates[0],
+            'last_date': self.last_date,
+            'latest': latest,
+            'cumulative': cumulative,
+            'main_inflow_days': {str(window): self.positive_days('main_net_inflow', window) for window in windows},
+            'main_streak': {'direction': direction, 'days': days},
+        }
+
+
+def summary_prompt_lines(summary, windows=(5, 10, 20)):
+    """根据 MoneyFlowSeries.summary() 生成给AI的资金流向趋势描述"""
+    if not summary or not summary.get('count'):
+        return []
+    lines = []
+    main = summary['cumulative']['main_net_inflow']
+    for window in windows:
+        key = str(window)
+        if key not in main or window > summary['count']:
+            continue
+        status = "流入" if main[key] > 0 else "流出"
+        lines.append(f"近{window}日主力累计净{status}: {abs(main[key]):.2f} 万元"
+                     f"（净流入 {summary['main_inflow_days'][key]}/{window} 天）")
+    streak = summary['main_streak']
+    if streak['direction']:
+        status = "流入" if streak['direction'] == 'inflow' else "流出"
+        lines.append(f"主力已连续{streak['days']}日净{status}（截至 {summary['last_date']}）")
+    return lines
+
+
+class MoneyFlowStore:
+    """日线资金流向存储：内存 -> SQLite -> 东方财富 三级读取，增量更新"""
+
+    def __init__(self):
+        self._series = TTLCache(maxsize=SERIES_CACHE_SIZE)  # code -> MoneyFlowSeries，不过期
+        self._fresh = TTLCache(maxsize=SERIES_CACHE_SIZE)  # code -> True，TTL内不再请求网络
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock_for(self, code):
+        with self._locks_guard:
+            lock = self._locks.get(code)
+            if lock is None:
+                lock = self._locks[code] = threading.Lock()
+            return lock
+
+    def get_series(self, code, refresh=True):
+        """
+        获取个股全部日线资金流向
+
+        Args:
+            code: 股票代码
+            refresh: 是否按需增量更新（False时只读内存/数据库）
+        """
+        series = self._series.get(code)
+        if series is not None and (not refresh or self._fresh.get(code)):
+            return series
+
+        with self._lock_for(code):
+            # 加锁后再查一次，避免并发请求重复抓取
+            series = self._series.get(code)
+            if series is not None and (not refresh or self._fresh.get(code)):
+                return series
+            if series is None:
+                series = self._load(code)
+            if refresh:
+                series = self._update(code, series)
+            self._series.set(code, series)
+            return series
+
+    def get_history(self, code, days=60):
+        """最近days天（0表示全部），与 get_money_flow_history 返回相同结构的记录列表"""
+        return self.get_series(code).tail(days).to_records()
+
+    def get_summary(self, code, windows=SUMMARY_WINDOWS):
+        return self.get_series(code).summary(windows)
+
+    def _load(self, code):
+        db = SessionLocal()
+        try:
+            rows = load_money_flow_daily(db, code)
+        finally:
+            db.close()
+        if not rows:
+            return MoneyFlowSeries.empty(code)
+        dates = np.array([row[0] for row in rows], dtype=object)
+        values = np.array([row[1:] for row in rows], dtype='float64')  # None -> NaN
+        print(f"[资金流向] {code} 从数据库加载 {len(rows)} 天")
+        return MoneyFlowSeries(code, dates, values)
+
+    def _update(self, code, series):
+        """抓取最后一个已存日期（含）以来的数据并落库"""
+        last_date = series.last_date
+        if last_date is None:
+            lmt = 0  # 本地无数据，抓取全部历史
+        else:
+            missing = _business_days_since(last_date)
+            lmt = 0 if missing is None else missing + 1 + INCREMENTAL_BUFFER_DAYS
+
+        result = get_money_flow_history_matrix(code, days=lmt)
+        if result is None:
+            return series  # 抓取失败时返回已有数据，下次请求重试
+        dates, values = result
+        if last_date is not None:
+            newer = dates >= last_date
+            dates, values = dates[newer], values[newer]
+
+        if len(dates):
+            records = matrix_to_records(dates, 'trade_date', values, MONEY_FLOW_DAILY_FIELDS)
+            db = SessionLocal()
+            try:
+                save_money_flow_daily(db, code, records)
+            except Exception as e:
+                db.rollback()
+                print(f"[资金流向] {code} 保存失败: {e}")
+                traceback.print_exc()
+            finally:
+                db.close()
+            series = series.merge(dates, values)
+            print(f"[资金流向] {code} 增量更新 {len(dates)} 天，共 {len(series)} 天")
+
+        self._fresh.set(code, True, ttl=TRADING_REFRESH_TTL if _is_trading_time() else CLOSED_REFRESH_TTL)
+        return series
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_money_flow_store():
+    """获取全局资金流向存储实例"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = MoneyFlowStore()
+    return _store
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""提供商熔断与故障转移
+
+每个提供商一个熔断器：连续失败（超时、连接错误、429、5xx，或耗时超过慢调用阈值）达到阈值后熔断，
+熔断期间直接跳过该提供商；冷却结束后进入半开状态，只放行一个探测调用，成功则恢复，失败则再次熔断
+（冷却时间翻倍）。
+
+配置项 ai_failover_chain 给出故障转移顺序，如 "deepseek,qwen,siliconflow"，也可写 "qwen:qwen-plus"
+指定模型（默认用 {provider}_model）。某个提供商熔断或调用失败时，依次改用它在链中之后的提供商
+（不在链中则用整条链），没有配置API Key的提供商会被跳过。
+"""
+
+import threading
+import time
+
+import requests
+
+from models import SessionLocal
+from db import get_config
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_SLOW_SECONDS = 90  # 超过该耗时的调用也记为失败
+OPEN_SECONDS = 30  # 熔断后的冷却秒数（连续熔断时翻倍）
+MAX_OPEN_SECONDS = 300
+SETTINGS_TTL = 30
+
+DEFAULT_MODELS = {
+    'openai': 'gpt-3.5-turbo',
+    'deepseek': 'deepseek-chat',
+    'qwen': 'qwen-turbo',
+    'gemini': 'gemini-pro',
+    'siliconflow': 'Qwen/Qwen2.5-7B-Instruct',
+    'grok': 'grok-4-0709',
+}
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def is_provider_fault(error):
+    """该错误是否说明提供商本身不可用（计入熔断）；鉴权失败、参数错误等不计入"""
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return False
+
+
+class _Settings:
+    """熔断阈值和故障转移链（从配置读取，缓存 SETTINGS_TTL 秒）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self.failure_threshold = DEFAULT_FAILURE_THRESHOLD
+        self.slow_seconds = DEFAULT_SLOW_SECONDS
+        self.chain = []  # [(provider, model或None)]
+        self.targets = {}  # provider -> (api_key, 默认model)
+
+    def refresh(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._loaded_at is not None and now - self._loaded_at < SETTINGS_TTL:
+                return self
+            db = SessionLocal()
+            try:
+                self.failure_threshold = self._int(get_config(db, 'circuit_failure_threshold'),
+                                                   DEFAULT_FAILURE_THRESHOLD)
+                self.slow_seconds = self._int(get_config(db, 'circuit_slow_seconds'), DEFAULT_SLOW_SECONDS)
+                chain = []
+                for part in (get_config(db, 'ai_failover_chain') or '').split(','):
+                    provider, _, model = part.strip().partition(':')
+                    if provider:
+                        chain.append((provider, model.strip() or None))
+                self.chain = chain
+                self.targets = {
+                    provider: (get_config(db, f'{provider}_api_key'),
+                               get_config(db, f'{provider}_model', DEFAULT_MODELS.get(provider)))
+                    for provider, _ in chain
+                }
+            except Exception as e:
+                print(f"[熔断] 读取配置失败: {e}")
+            finally:
+                db.close()
+            self._loaded_at = now
+            return self
+
+    @staticmethod
+    def _int(value, default):
+        try:
+            return max(int(value), 1) if value else default
+        except (TypeError, ValueError):
+            return default
+
+
+class CircuitBreaker:
+    """单个提供商的熔断器"""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0  # 连续失败次数
+        self.open_seconds = OPEN_SECONDS
+        self.opened_at = None
+        self.probing = False
+        self.total_failures = 0
+        self.times_opened = 0
+
+    def allow(self):
+        """是否可以调用（半开状态下只放行一个探测调用）"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    return False
+                self.state = HALF_OPEN
+                self.probing = False
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+
+    def record_success(self, seconds, slow_seconds, threshold):
+        if seconds is not None and seconds > slow_seconds:
+            self.record_failure(threshold, f'慢调用 {seconds:.0f}s')
+            return
+        with self._lock:
+            if self.state != CLOSED:
+                print(f"[熔断] {self.provider} 探测成功，恢复")
+            self.state = CLOSED
+            self.failures = 0
+            self.open_seconds = OPEN_SECONDS
+            self.probing = False
+
+    def record_failure(self, threshold, reason):
+        with self._lock:
+            self.failures += 1
+            self.total_failures += 1
+            if self.state == HALF_OPEN:
+                # 探测失败，冷却时间翻倍
+                self.open_seconds = min(self.open_seconds * 2, MAX_OPEN_SECONDS)
+                self._open(reason)
+            elif self.state == CLOSED and self.failures >= threshold:
+                self._open(reason)
+
+    def release_probe(self):
+        with self._lock:
+            self.probing = False
+
+    def _open(self, reason):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.probing = False
+        self.times_opened += 1
+        print(f"[熔断] {self.provider} 连续失败 {self.failures} 次（{reason}），熔断 {self.open_seconds}s")
+
+    def status(self):
+        with self._lock:
+            remaining = None
+            if self.state == OPEN:
+                remaining = round(max(self.open_seconds - (time.monotonic() - self.opened_at), 0), 1)
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'total_failures': self.total_failures,
+                'times_opened': self.times_opened,
+                'open_remaining_seconds': remaining,
+            }
+
+
+class CircuitBreakers:
+    """所有提供商的熔断器"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def get(self, provider):
+        with self._lock:
+            breaker = self._breakers.get(provider)
+            if breaker is None:
+                breaker = self._breakers[provider] = CircuitBreaker(provider)
+            return breaker
+
+    def allow(self, provider):
+        return self.get(provider).allow()
+
+    def record_success(self, provider, seconds):
+        settings = _settings.refresh()
+        self.get(provider).record_success(seconds, settings.slow_seconds, settings.failure_threshold)
+
+    def record_failure(self, provider, error):
+        self.get(provider).record_failure(_settings.refresh().failure_threshold, type(error).__name__)
+
+    def release(self, provider):
+        """调用失败但不计入熔断时，归还半开状态的探测名额"""
+        self.get(provider).release_probe()
+
+    def status(self):
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.provider: breaker.status() for breaker in breakers}
+
+
+def failover_targets(provider):
+    """
+    provider 失败时依次改用的 (provider, api_key, model)
+
+    Returns:
+        list: 按 ai_failover_chain 顺序，不含 provider 本身和未配置API Key/模型的提供商
+    """
+    settings = _settings.refresh()
+    chain = settings.chain
+    providers = [p for p, _ in chain]
+    if provider in providers:
+        chain = chain[providers.index(provider) + 1:]
+    targets = []
+    for target, model in chain:
+        api_key, default_model = settings.targets.get(target, (None, None))
+        model = model or default_model
+        if target != provider and api_key and model:
+            targets.append((target, api_key, model))
+    return targets
+
+
+_settings = _Settings()
+_breakers = None
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breakers():
+    """获取全局熔断器集合"""
+    global _breakers
+    if _breakers is None:
+        with _breakers_lock:
+            if _breakers is None:
+                _breakers = CircuitBreakers()
+    return _breakers
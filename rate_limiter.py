@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""上游数据源限流模块
+
+每个host一个令牌桶，所有行情/资金流/舆情请求都通过 http_get 发出：
+- 令牌不足时排队等待，替代原来的固定 time.sleep
+- 遇到 HTTP 403/429、空响应或超时自动退避（暂停该host并减半速率），之后成功请求逐步恢复速率
+- 按host统计请求数、等待时间、各类错误次数
+"""
+
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# host -> (每秒请求数, 桶容量)
+HOST_LIMITS = {
+    'hq.sinajs.cn': (10.0, 20),
+    'money.finance.sina.com.cn': (5.0, 10),
+    'vip.stock.finance.sina.com.cn': (2.0, 4),
+    'push2.eastmoney.com': (8.0, 16),
+    'push2his.eastmoney.com': (4.0, 8),
+    'gbapi.eastmoney.com': (2.0, 4),
+    'np-listapi.eastmoney.com': (2.0, 4),
+}
+DEFAULT_LIMIT = (5.0, 10)
+
+BACKOFF_BASE = 1.0  # 首次退避秒数
+BACKOFF_MAX = 60.0  # 最大退避秒数
+MIN_RATE_RATIO = 0.1  # 退避后速率下限（相对配置速率）
+RECOVER_RATIO = 0.1  # 每次成功恢复的速率（相对配置速率）
+MAX_QUEUE_WAIT = 15.0  # 单次请求最长排队秒数，超过直接报错
+THROTTLE_STATUS = (403, 429)
+
+
+class RateLimitExceeded(requests.RequestException):
+    """排队等待超过上限（上游处于退避期）"""
+
+
+class HostLimiter:
+    """单个host的令牌桶 + 自适应退避"""
+
+    def __init__(self, host, rate, burst):
+        self.host = host
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._backoff = 0.0
+        self._lock = threading.Lock()
+        self.metrics = {
+            'requests': 0,
+            'success': 0,
+            'throttled': 0,  # 403/429
+            'empty': 0,
+            'timeouts': 0,
+            'errors': 0,
+            'rejected': 0,  # 排队超时
+            'wait_seconds': 0.0,
+        }
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, max_wait=MAX_QUEUE_WAIT):
+        """取一个令牌，必要时等待；预计等待超过max_wait时抛出RateLimitExceeded"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = max(self._blocked_until - now, 0.0)
+                if wait == 0 and self._tokens >= 1:
+                    self._tokens -= 1
+                    self.metrics['requests'] += 1
+                    self.metrics['wait_seconds'] += waited
+                    return waited
+                if wait == 0:
+                    wait = (1 - self._tokens) / self.rate
+                if waited + wait > max_wait:
+                    self.metrics['rejected'] += 1
+                    raise RateLimitExceeded(f"{self.host} 限流中，需等待 {wait:.1f}s")
+            time.sleep(wait)
+            waited += wait
+
+    def on_success(self):
+        with self._lock:
+            self.metrics['success'] += 1
+            self._backoff = self._backoff / 2 if self._backoff > BACKOFF_BASE else 0.0
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVER_RATIO)
+
+    def on_failure(self, kind):
+        """记录失败并退避：暂停host一段时间，速率减半"""
+        with self._lock:
+            self.metrics[kind] += 1
+            self._backoff = min(max(self._backoff * 2, BACKOFF_BASE), BACKOFF_MAX)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + self._backoff)
+            self.rate = max(self.max_rate * MIN_RATE_RATIO, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+            backoff = self._backoff
+        print(f"[限流] {self.host} {kind}，退避 {backoff:.1f}s，速率降为 {self.rate:.2f}/s")
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            result = dict(self.metrics)
+            result.update({
+                'rate': round(self.rate, 3),
+                'max_rate': self.max_rate,
+                'tokens': round(self._tokens, 2),
+                'backoff': round(self._backoff, 2),
+                'blocked_for': round(max(self._blocked_until - now, 0.0), 2),
+            })
+        result['wait_seconds'] = round(result['wait_seconds'], 3)
+        return result
+
+
+class RateLimiter:
+    """按host管理限流器，并提供共享连接池的Session"""
+
+    def __init__(self, limits=None):
+        self._limits = dict(HOST_LIMITS if limits is None else limits)
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def for_host(self, host):
+        limiter = self._hosts.get(host)
+        if limiter is None:
+            with self._lock:
+                limiter = self._hosts.get(host)
+                if limiter is None:
+                    rate, burst = self._limits.get(host, DEFAULT_LIMIT)
+                    limiter = HostLimiter(host, rate, burst)
+                    self._hosts[host] = limiter
+        return limiter
+
+    def get(self, url, **kwargs):
+        """限流后的GET请求，返回requests.Response；超时/连接错误照常抛出"""
+        limiter = self.for_host(urlsplit(url).hostname or '')
+        limiter.acquire()
+        try:
+            response = self.session.get(url, **kwargs)
+        except requests.Timeout:
+            limiter.on_failure('timeouts')
+            raise
+        except requests.RequestException:
+            limiter.on_failure('errors')
+            raise
+
+        if response.status_code in THROTTLE_STATUS:
+            limiter.on_failure('throttled')
+        elif response.status_code == 200 and not response.content.strip():
+            limiter.on_failure('empty')
+        else:
+            limiter.on_success()
+        return response
+
+    def stats(self):
+        with self._lock:
+            hosts = list(self._hosts.values())
+        return {limiter.host: limiter.stats() for limiter in hosts}
+
+
+_limiter = RateLimiter()
+
+
+def get_rate_limiter():
+    """获取全局限流器"""
+    return _limiter
+
+
+def http_get(url, **kwargs):
+    """经过限流的 requests.get 替代品（参数同 requests.get）"""
+    return _limiter.get(url, **kwargs)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""上游响应解码模块
+
+- JSONP 外壳按下标剥离（首个'{'到最后一个'}'），直接从字节解码，不再用正则扫描并复制整段文本
+- 可选使用 orjson 加速
+- 东方财富 klines（每行逗号分隔的字符串）整体交给C解析器，一次得到NumPy列
+"""
+
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
+
+def strip_jsonp(content):
+    """
+    去掉JSONP外壳，返回JSON部分（bytes/memoryview 或 str，与输入类型对应）
+
+    以'{'或'['开头的内容原样返回；否则取首个'{'到最后一个'}'之间的内容。
+    """
+    if isinstance(content, str):
+        text = content.lstrip()
+        if not text or text[0] in '{[':
+            return text
+        start, end = text.find('{'), text.rfind('}')
+        return text[start:end + 1] if 0 <= start < end else text
+
+    view = memoryview(content)
+    length = len(content)
+    pos = 0
+    while pos < length and content[pos] in b' \t\r\n':
+        pos += 1
+    if pos < length and content[pos] in b'{[':
+        return view[pos:]
+    start, end = content.find(b'{', pos), content.rfind(b'}')
+    if 0 <= start < end:
+        return view[start:end + 1]
+    return view[pos:]
+
+
+def loads(data):
+    """JSON解码（bytes/memoryview/str），优先orjson"""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def decode_json(content):
+    """解码JSON或JSONP响应体（bytes或str）"""
+    return loads(strip_jsonp(content))
+
+
+def decode_response(response):
+    """解码requests响应（JSON或JSONP）"""
+    return decode_json(response.content)
+
+
+def parse_klines(klines, min_fields=1):
+    """
+    批量解析 klines 字符串列表（首列为日期/时间，其余为数值）
+
+    各行字段数一致且无空值时（绝大多数情况），数值部分整体交给 np.loadtxt 的C解析器；
+    否则回退到 pandas C解析器，空值/非法值为NaN、短行补NaN。
+
+    Args:
+        klines: ['2024-01-02,123.0,456.0,...', ...]
+        min_fields: 每行最少字段数（含首列），不足的行丢弃
+
+    Returns:
+        tuple: (labels, values)，labels 为首列字符串数组，values 为 (行数, 字段数-1) 的float64矩阵，
+               values[:, i] 对应原始第 i+1 列
+    """
+    empty = (np.empty(0, dtype=object), np.empty((0, max(min_fields - 1, 0)), dtype='float64'))
+    if not klines:
+        return empty
+    lines = [line for line in klines if isinstance(line, str)]
+    counts = np.fromiter((line.count(',') for line in lines), dtype=np.int64, count=len(lines)) + 1
+    keep = counts >= min_fields
+    if not keep.any():
+        return empty
+    if not keep.all():
+        lines = [line for line, ok in zip(lines, keep) if ok]
+        counts = counts[keep]
+    width = int(counts.max())
+    labels = np.array([line.split(',', 1)[0] for line in lines], dtype=object)
+    if width == 1:
+        return labels, np.empty((len(lines), 0), dtype='float64')
+
+    text = '\n'.join(lines)
+    if counts.min() == width:
+        try:
+            values = np.loadtxt(io.StringIO(text), delimiter=',', dtype='float64',
+                                usecols=range(1, width), ndmin=2)
+            return labels, values
+        except ValueError:
+            pass  # 含空值等，走通用路径
+
+    frame = pd.read_csv(io.StringIO(text), header=None, names=range(width), usecols=range(1, width),
+                        dtype=str, keep_default_na=False, engine='c')
+    values = frame.apply(pd.to_numeric, errors='coerce').to_numpy(dtype='float64')
+    return labels, values
+
+
+def matrix_to_records(labels, label_key, values, names):
+    """
+    (labels, values) 转记录列表，NaN转为None
+
+    Args:
+        labels: 首列数组
+        label_key: 首列字段名
+        values: (行数, len(names)) 矩阵
+        names: 数值列字段名
+    """
+    keys = [label_key] + list(names)
+    mask = np.isnan(values)
+    if mask.any():
+        columns = values.T.astype(object)
+        columns[mask.T] = None
+        columns = columns.tolist()
+    else:
+        columns = values.T.tolist()
+    return [dict(zip(keys, row)) for row in zip(labels.tolist(), *columns)]
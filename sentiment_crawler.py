@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""舆情增量爬取与本地检索
+
+后台线程定期为自选股抓取新闻和股吧帖子，写入 sentiment_items 表（标题建 FTS5 全文索引）。
+每只股票按类型记录已入库的最新发布时间（高水位）：帖子按页往前翻，翻到高水位之前就停止，
+所以重复爬取只拉新内容。Agent 和前端从本地索引按关键词/时间检索，不再每次实时抓取。
+"""
+
+import threading
+import time
+import traceback
+from datetime import datetime
+
+from models import SessionLocal
+from db import get_watchlist, save_sentiment_items, get_sentiment_high_water, search_sentiment, count_sentiment_items
+from data_fetchers import fetch_stock_news, fetch_guba_list
+
+CRAWL_INTERVAL = 10 * 60  # 两轮爬取间隔（秒）
+POSTS_PAGE_SIZE = 50
+MAX_POST_PAGES = 5  # 首次爬取（无高水位）时最多翻的页数
+STARTUP_DELAY = 30  # 服务启动后延迟开始，避免和首批请求抢上游配额
+
+
+def index_sentiment(code, news_list=None, posts_list=None):
+    """把已抓到的新闻/帖子写入本地索引（实时接口抓到的数据也顺带入库），返回新增条数"""
+    items = list(news_list or []) + list(posts_list or [])
+    if not items:
+        return 0
+    db = SessionLocal()
+    try:
+        return save_sentiment_items(db, code, items)
+    except Exception as e:
+        db.rollback()
+        print(f"[舆情索引] {code} 保存失败: {e}")
+        return 0
+    finally:
+        db.close()
+
+
+def query_sentiment(query=None, code=None, kind=None, days=None, sort=None, limit=20):
+    """检索本地舆情索引（参数见 db.search_sentiment）"""
+    db = SessionLocal()
+    try:
+        return search_sentiment(db, query=query, code=code, kind=kind, days=days, sort=sort, limit=limit)
+    finally:
+        db.close()
+
+
+def build_sentiment_context(code, days=7, news_limit=10, posts_limit=15):
+    """
+    从本地索引生成给AI的舆情文本：最近的新闻 + 按热度排序的帖子（带时间和阅读/评论数）
+
+    Returns:
+        str: 舆情文本；本地没有该股票的数据时返回None
+    """
+    news_list = query_sentiment(code=code, kind='news', days=days, sort='time', limit=news_limit)
+    posts_list = query_sentiment(code=code, kind='post', days=days, sort='hot', limit=posts_limit)
+    if not news_list and not posts_list:
+        return None
+    news_lines = [f"- [{n['time'][5:16]}] {n['title']}" for n in news_list]
+    post_lines = [f"- [{p['time'][5:16]}] {p['title']} (read {p['read_count']}, comments {p['comment_count']})"
+                  for p in posts_list]
+    return "News:\n" + "\n".join(news_lines) + "\n\nPosts:\n" + "\n".join(post_lines)
+
+
+class SentimentCrawler:
+    """自选股舆情增量爬取（后台守护线程）"""
+
+    def __init__(self, interval=CRAWL_INTERVAL):
+        self.interval = interval
+        self._thread = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()  # 同一时刻只跑一轮
+        self.stats = {
+            'rounds': 0,
+            'last_started_at': None,
+            'last_finished_at': None,
+            'last_duration': None,
+            'last_new_items': 0,
+            'total_new_items': 0,
+            'errors': 0,
+        }
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sentiment-crawler', daemon=True)
+        self._thread.start()
+        print(f"[舆情爬取] 后台爬取已启动，间隔 {self.interval}s")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def trigger(self):
+        """立即开始下一轮爬取（后台线程未启动时单独跑一轮）"""
+        if self._thread is not None and self._thread.is_alive():
+            self._wake.set()
+        else:
+            threading.Thread(target=self.crawl_watchlist, name='sentiment-crawl-once', daemon=True).start()
+
+    def _run(self):
+        self._wake.wait(STARTUP_DELAY)
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                self.crawl_watchlist()
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"[舆情爬取] 本轮爬取失败: {e}")
+                traceback.print_exc()
+            self._wake.wait(self.interval)
+
+    def crawl_watchlist(self):
+        """爬取全部自选股，返回新增条数"""
+        db = SessionLocal()
+        try:
+            codes = [item.code for item in get_watchlist(db)]
+        finally:
+            db.close()
+        return self.crawl(codes)
+
+    def crawl(self, codes):
+        """爬取指定股票，返回新增条数"""
+        with self._lock:
+            started = time.monotonic()
+            self.stats['last_started_at'] = datetime.now().isoformat()
+            new_items = 0
+            for code in codes:
+                if self._stop.is_set():
+                    break
+                try:
+                    new_items += self.crawl_code(code)
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    print(f"[舆情爬取] {code} 爬取失败: {e}")
+            self.stats['rounds'] += 1
+            self.stats['last_finished_at'] = datetime.now().isoformat()
+            self.stats['last_duration'] = round(time.monotonic() - started, 2)
+            self.stats['last_new_items'] = new_items
+            self.stats['total_new_items'] += new_items
+            print(f"[舆情爬取] 完成 {len(codes)} 只股票，新增 {new_items} 条")
+            return new_items
+
+    def crawl_code(self, code):
+        """爬取单只股票高水位之后的新闻和帖子，返回新增条数"""
+        db = SessionLocal()
+        try:
+            news_mark = get_sentiment_high_water(db, code, 'news')
+            post_mark = get_sentiment_high_water(db, code, 'post')
+        finally:
+            db.close()
+
+        news_list = fetch_stock_news(code) or []
+        news_list = [n for n in news_list if not news_mark or (n.get('time') or '') >= news_mark]
+
+        posts_list = []
+        for page in range(1, MAX_POST_PAGES + 1):
+            page_posts = fetch_guba_list(code, 'latest', POSTS_PAGE_SIZE, page)
+            if not page_posts:
+                break
+            posts_list.extend(page_posts)
+            if len(page_posts) < POSTS_PAGE_SIZE:
+                break  # 已是最后一页
+            # 本页最早的帖子已不晚于高水位，更早的页都已入库
+            oldest = min((p.get('time') or '') for p in page_posts)
+            if post_mark and oldest <= post_mark:
+                break
+        # 热门帖子只取第一页（阅读/评论数会更新）
+        posts_list.extend(fetch_guba_list(code, 'hot', POSTS_PAGE_SIZE) or [])
+
+        return index_sentiment(code, news_list, posts_list)
+
+    def status(self):
+        db = SessionLocal()
+        try:
+            total = count_sentiment_items(db)
+        finally:
+            db.close()
+        return dict(self.stats, running=self._thread is not None and self._thread.is_alive(),
+                    interval=self.interval, indexed_items=total)
+
+
+_crawler = None
+_crawler_lock = threading.Lock()
+
+
+def get_sentiment_crawler():
+    """获取全局舆情爬取器实例"""
+    global _crawler
+    if _crawler is None:
+        with _crawler_lock:
+            if _crawler is None:
+                _crawler = SentimentCrawler()
+    return _crawler
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""请求合并（single-flight）模块
+
+同一时刻对同一数据源、同一参数的并发调用只真正执行一次，
+其余调用方等待这次调用完成后共享结果（拿到浅拷贝，避免互相修改）。
+"""
+
+import copy
+import functools
+import inspect
+import threading
+
+
+class _Call:
+    """一次进行中的调用"""
+
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """按key合并并发调用，并统计合并次数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {}
+
+    def do(self, name, key, fn, *args, **kwargs):
+        """
+        执行 fn(*args, **kwargs)；同一key已有调用在进行时等待并共享其结果
+
+        Returns:
+            tuple: (结果, 是否为共享结果)
+        """
+        with self._lock:
+            stats = self._stats.setdefault(name, {'calls': 0, 'executed': 0, 'coalesced': 0})
+            stats['calls'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                stats['executed'] += 1
+            else:
+                stats['coalesced'] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result, False
+
+    def stats(self):
+        """各数据源的调用/实际执行/合并次数"""
+        with self._lock:
+            result = {name: dict(item) for name, item in self._stats.items()}
+            in_flight = len(self._calls)
+        for item in result.values():
+            item['coalesce_rate'] = round(item['coalesced'] / item['calls'], 4) if item['calls'] else 0
+        return {'in_flight': in_flight, 'fetchers': result}
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+
+_default_group = SingleFlight()
+
+
+def get_singleflight():
+    """获取全局single-flight实例"""
+    return _default_group
+
+
+def coalesce(name=None, group=None):
+    """
+    装饰器：并发的相同参数调用合并为一次
+
+    参数按函数签名补齐默认值后作为key（get_minute_kline(c) 与 get_minute_kline(c, scale=5) 视为同一调用）；
+    参数不可哈希时直接调用，不做合并。
+    """
+    def decorator(fn):
+        label = name or fn.__name__
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            flight = group or _default_group
+            try:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                key = (label, tuple(bound.arguments.items()))
+                hash(key)
+            except TypeError:
+                return fn(*args, **kwargs)
+            result, shared = flight.do(label, key, fn, *args, **kwargs)
+            return copy.copy(result) if shared else result
+
+        return wrapper
+    return decorator
@@ -2,7 +2,7 @@ import { useEffect, useRef, useState } from 'react';
 import { createChart, ColorType } from 'lightweight-charts';
 import type { IChartApi, ISeriesApi } from 'lightweight-charts';
 import { useQuery } from '@tanstack/react-query';
-import { stockAPI } from '../../services/api';
+import { stockAPI, fetchChartRows } from '../../services/api';
 
 interface CandlestickChartProps {
   code: string;
@@ -25,26 +25,8 @@ export default function CandlestickChart({ code, buyZones, sellZones, indicators
   const { data: dailyKlineData } = useQuery({
     queryKey: ['daily-kline', code],
     queryFn: async () => {
-      const apiUrl = import.meta.env.VITE_API_BASE_URL || 'http://127.0.0.1:5000';
-      const response = await fetch(`${apiUrl}/api/sina/daily/${code}?count=240`);
-      if (!response.ok) {
-        throw new Error('Failed to fetch daily K-line data');
-      }
-      const result = await response.json();
-      
-      if (Array.isArray(result)) {
-        return result;
-      } else if (result && typeof result === 'object') {
-        if (Array.isArray(result.data)) {
-          return result.data;
-        } else if (result.error) {
-          throw new Error(result.message || result.error);
-        } else {
-          return [];
-        }
-      } else {
-        return [];
-      }
+      // 列式紧凑格式：时间字段为epoch秒（日线为UTC零点）
+      return fetchChartRows(`/api/sina/daily/${code}?count=240`);
     },
     enabled: !!code && klineType === 'daily',
   });
@@ -53,29 +35,9 @@ export default function CandlestickChart({ code, buyZones, sellZones, indicators
   const { data: minute1KlineData } = useQuery({
     queryKey: ['minute1-kline', code],
     queryFn: async () => {
-      const apiUrl = import.meta.env.VITE_API_BASE_URL || 'http://127.0.0.1:5000';
-      const response = await fetch(`${apiUrl}/api/sina/timeline/${code}`);
-      if (!response.ok) {
-        throw new Error('Failed to fetch timeline data');
-      }
-      const result = await response.json();
-      
-      // timeline API返回格式: { code, data: [...], count }
       // timeline数据有price字段，需要转换为K线格式（open/high/low/close）
-      let timelineData: any[] = [];
-      if (Array.isArray(result)) {
-        timelineData = result;
-      } else if (result && typeof result === 'object') {
-        if (Array.isArray(result.data)) {
-          timelineData = result.data;
-        } else if (result.error) {
-          throw new Error(result.message || result.error);
-        } else {
-          return [];
-        }
-      } else {
-        return [];
-      }
+      // 列式紧凑格式下 datetime 已是epoch秒
+      const timelineData = await fetchChartRows(`/api/sina/timeline/${code}`);
 
       // 将timeline数据转换为K线格式
       // timeline数据格式: { datetime, price, volume, amount }
@@ -108,26 +70,8 @@ export default function CandlestickChart({ code, buyZones, sellZones, indicators
   const { data: minute5KlineData } = useQuery({
     queryKey: ['minute5-kline', code],
     queryFn: async () => {
-      const apiUrl = import.meta.env.VITE_API_BASE_URL || 'http://127.0.0.1:5000';
-      const response = await fetch(`${apiUrl}/api/sina/minute/${code}?scale=5&datalen=240`);
-      if (!response.ok) {
-        throw new Error('Failed to fetch 5-minute K-line data');
-      }
-      const result = await response.json();
-      
-      if (Array.isArray(result)) {
-        return result;
-      } else if (result && typeof result === 'object') {
-        if (Array.isArray(result.data)) {
-          return result.data;
-        } else if (result.error) {
-          throw new Error(result.message || result.error);
-        } else {
-          return [];
-        }
-      } else {
-        return [];
-      }
+      // 列式紧凑格式：时间字段为epoch秒（日线为UTC零点）
+      return fetchChartRows(`/api/sina/minute/${code}?scale=5&datalen=240`);
     },
     enabled: !!code && klineType === 'minute5',
     refetchInterval: klineType === 'minute5' ? 30000 : false, // 5分钟K线每30秒刷新一次
@@ -137,26 +81,8 @@ export default function CandlestickChart({ code, buyZones, sellZones, indicators
   const { data: minute30KlineData } = useQuery({
     queryKey: ['minute30-kline', code],
     queryFn: async () => {
-      const apiUrl = import.meta.env.VITE_API_BASE_URL || 'http://127.0.0.1:5000';
-      const response = await fetch(`${apiUrl}/api/sina/minute/${code}?scale=30&datalen=240`);
-      if (!response.ok) {
-        throw new Error('Failed to fetch 30-minute K-line data');
-      }
-      const result = await response.json();
-      
-      if (Array.isArray(result)) {
-        return result;
-      } else if (result && typeof result === 'object') {
-        if (Array.isArray(result.data)) {
-          return result.data;
-        } else if (result.error) {
-          throw new Error(result.message || result.error);
-        } else {
-          return [];
-        }
-      } else {
-        return [];
-      }
+      // 列式紧凑格式：时间字段为epoch秒（日线为UTC零点）
+      return fetchChartRows(`/api/sina/minute/${code}?scale=30&datalen=240`);
     },
     enabled: !!code && klineType === 'minute30',
     refetchInterval: klineType === 'minute30' ? 60000 : false, // 30分钟K线每60秒刷新一次
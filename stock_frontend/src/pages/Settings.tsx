@@ -69,6 +69,13 @@ export default function Settings() {
     enabled: !!selectedProvider && !!apiKey,
   });
 
+  // Key池状态（配置多个Key时显示各Key用量和暂停情况）
+  const { data: keyPool } = useQuery({
+    queryKey: ['key-pool', selectedProvider],
+    queryFn: () => stockAPI.getKeyPoolStatus(selectedProvider),
+    refetchInterval: 10000,
+  });
+
   const handleSave = async () => {
     setSaving(true);
     setMessage('');
@@ -184,7 +191,7 @@ export default function Settings() {
                   setApiKey(e.target.value);
                   setSelectedModel(''); // 清空模型选择
                 }}
-                placeholder={`输入${AI_PROVIDERS.find(p => p.value === selectedProvider)?.label}的API Key`}
+                placeholder={`输入${AI_PROVIDERS.find(p => p.value === selectedProvider)?.label}的API Key，多个Key用逗号分隔，key|权重 指定权重`}
                 className="flex-1 px-4 py-2 border border-gray-300 dark:border-gray-600 rounded-lg focus:ring-2 focus:ring-blue-500 dark:bg-gray-700 dark:text-white"
               />
               <button
@@ -215,6 +222,47 @@ export default function Settings() {
             )}
           </div>
 
+          {/* Key池状态 */}
+          {keyPool && keyPool.keys.length > 0 && (
+            <div>
+              <label className="block text-sm font-medium text-gray-700 dark:text-gray-300 mb-2">
+                Key池状态（{keyPool.strategy === 'round_robin' ? '加权轮询' : '最少负载'}）
+              </label>
+              <table className="w-full text-sm text-gray-700 dark:text-gray-300">
+                <thead>
+                  <tr className="text-left text-gray-500 dark:text-gray-400">
+                    <th className="py-1">Key</th>
+                    <th className="py-1">权重</th>
+                    <th className="py-1">进行中</th>
+                    <th className="py-1">RPM</th>
+                    <th className="py-1">TPM</th>
+                    <th className="py-1">请求/错误</th>
+                    <th className="py-1">状态</th>
+                  </tr>
+                </thead>
+                <tbody>
+                  {keyPool.keys.map((k) => (
+                    <tr key={k.key} className="border-t border-gray-200 dark:border-gray-700">
+                      <td className="py-1 font-mono">{k.key}</td>
+                      <td className="py-1">{k.weight}</td>
+                      <td className="py-1">{k.in_flight}</td>
+                      <td className="py-1">{k.rpm}{keyPool.rpm_limit ? `/${keyPool.rpm_limit}` : ''}</td>
+                      <td className="py-1">{k.tpm}{keyPool.tpm_limit ? `/${keyPool.tpm_limit}` : ''}</td>
+                      <td className="py-1">{k.requests}/{k.errors}</td>
+                      <td className="py-1">
+                        {k.sidelined_seconds
+                          ? <span className="text-red-600 dark:text-red-400">
+                              {k.sideline_reason === 'unauthorized' ? '鉴权失败' : '限流'}，{Math.ceil(k.sidelined_seconds)}s后恢复
+                            </span>
+                          : <span className="text-green-600 dark:text-green-400">可用</span>}
+                      </td>
+                    </tr>
+                  ))}
+                </tbody>
+              </table>
+            </div>
+          )}
+
           {/* 模型选择 */}
           <div>
             <label className="block text-sm font-medium text-gray-700 dark:text-gray-300 mb-2">
@@ -44,6 +44,7 @@ export interface Agent {
   ai_provider: string | null;
   model: string | null;
   sort_order: number;
+  data_sections?: string[] | null;
 }
 
 export interface AnalysisResult {
@@ -94,6 +95,74 @@ export interface DebateJobStatus {
   updated_at: string;
 }
 
+export interface KeyPoolKeyStatus {
+  key: string;
+  weight: number;
+  in_flight: number;
+  rpm: number;
+  tpm: number;
+  requests: number;
+  tokens: number;
+  errors: number;
+  rate_limited: number;
+  auth_failures: number;
+  sidelined_seconds: number | null;
+  sideline_reason: 'rate_limited' | 'unauthorized' | null;
+}
+
+export interface KeyPoolStatus {
+  strategy: 'least_loaded' | 'round_robin' | null;
+  rpm_limit: number | null;
+  tpm_limit: number | null;
+  keys: KeyPoolKeyStatus[];
+}
+
+export interface ColumnarChartResponse {
+  code: string;
+  count: number;
+  format: 'columnar';
+  fields: string[];
+  time_fields: string[];
+  data: Record<string, Array<number | string | null>>;
+}
+
+/**
+ * 列式图表数据展开为逐行对象（时间字段为epoch秒）
+ */
+export function decodeColumnar(result: ColumnarChartResponse): Record<string, any>[] {
+  const count = result.count || 0;
+  const rows: Record<string, any>[] = new Array(count);
+  for (let i = 0; i < count; i++) {
+    rows[i] = {};
+  }
+  for (const field of result.fields) {
+    const column = result.data[field] || [];
+    for (let i = 0; i < count; i++) {
+      rows[i][field] = column[i];
+    }
+  }
+  return rows;
+}
+
+/**
+ * 获取图表数据（列式紧凑格式），返回逐行对象数组
+ */
+export async function fetchChartRows(path: string): Promise<Record<string, any>[]> {
+  const separator = path.includes('?') ? '&' : '?';
+  const response = await fetch(`${API_BASE_URL}${path}${separator}format=columnar`);
+  if (!response.ok) {
+    throw new Error(`API Error: ${response.statusText}`);
+  }
+  const result = await response.json();
+  if (result && result.error) {
+    throw new Error(result.message || result.error);
+  }
+  if (result && result.format === 'columnar') {
+    return decodeColumnar(result);
+  }
+  return Array.isArray(result?.data) ? result.data : [];
+}
+
 class StockAPI {
   private baseURL: string;
 
@@ -299,6 +368,24 @@ class StockAPI {
     return this.request(`/api/strategy/strong_stocks?limit_time=${encodeURIComponent(limitTime)}`);
   }
 
+  async getLimitUpScreen(params: {
+    lookback?: number;
+    minHits?: number;
+    limitTime?: string;
+    maxBreak?: number;
+    minConsecutive?: number;
+    industry?: string;
+  }): Promise<any> {
+    const query = new URLSearchParams();
+    if (params.lookback !== undefined) query.append('lookback', String(params.lookback));
+    if (params.minHits !== undefined) query.append('min_hits', String(params.minHits));
+    if (params.limitTime) query.append('limit_time', params.limitTime);
+    if (params.maxBreak !== undefined) query.append('max_break', String(params.maxBreak));
+    if (params.minConsecutive !== undefined) query.append('min_consecutive', String(params.minConsecutive));
+    if (params.industry) query.append('industry', params.industry);
+    return this.request(`/api/strategy/limit_up_screen?${query.toString()}`);
+  }
+
   async stopDebateJob(jobId: string): Promise<boolean> {
     const data = await this.request<{ success: boolean }>(`/api/ai/debate/stop/${jobId}`, {
       method: 'POST',
@@ -323,6 +410,12 @@ class StockAPI {
     return data.data;
   }
 
+  async getKeyPoolStatus(provider: string): Promise<KeyPoolStatus | null> {
+    const params = new URLSearchParams({ provider });
+    const data = await this.request<{ success: boolean; data: Record<string, KeyPoolStatus> }>(`/api/ai/key-pool?${params.toString()}`);
+    return data.data[provider] || null;
+  }
+
   async testAIConnection(provider: string, apiKey: string, model?: string): Promise<{ success: boolean; message: string; response?: string }> {
     const data = await this.request<{ success: boolean; message: string; response?: string }>('/api/ai/test', {
       method: 'POST',
@@ -5,9 +5,10 @@
 import pandas as pd
 import numpy as np
 import warnings
-import time
 from datetime import datetime
 from data_fetchers import get_daily_kline, get_timeline_data, get_minute_kline, get_realtime_data, get_sector_info, get_money_flow, get_fundamental_data, get_industry_comparison
+from utils import TTLCache
+from money_flow_store import get_money_flow_store
 warnings.filterwarnings("ignore")
 
 def calculate_ma(df, periods=[5, 10, 20, 30, 60]):
@@ -119,6 +120,158 @@ def calculate_indicators(df, indicators=['MA', 'EMA', 'MACD', 'RSI', 'KDJ', 'BOL
     return result_df
 
 
+# ==================== 指标快照 ====================
+
+SNAPSHOT_CACHE_SIZE = 512
+_snapshot_cache = TTLCache(maxsize=SNAPSHOT_CACHE_SIZE)
+
+
+def _is_ma_column(col):
+    return col.startswith('MA') and not col.startswith('MACD')
+
+
+class IndicatorSnapshot:
+    """最新一根K线的技术指标快照，供接口JSON和AI提示词共用"""
+
+    __slots__ = ('code', 'bar_time', 'close', 'ma', 'ema', 'macd', 'rsi', 'kdj', 'boll',
+                 'obv', 'prev_obv', '_dict', '_lines')
+
+    def __init__(self, code, bar_time=None):
+        self.code = code
+        self.bar_time = bar_time
+        self.close = None
+        self.ma = []  # [(列名, 值)]，按列顺序
+        self.ema = []
+        self.macd = None  # (DIF, DEA, MACD)
+        self.rsi = None
+        self.kdj = None  # (K, D, J)
+        self.boll = None  # (upper, mid, lower)
+        self.obv = None
+        self.prev_obv = None
+        self._dict = None
+        self._lines = None
+
+    @classmethod
+    def from_frame(cls, code, df):
+        """从已计算指标的日K线DataFrame提取最新值（只读取最后两行）"""
+        snapshot = cls(code, _last_bar_time(df))
+        if df is None or len(df) == 0:
+            return snapshot
+
+        columns = [col for col in df.columns if isinstance(col, str)]
+        wanted = [col for col in columns if _is_ma_column(col) or col.startswith('EMA') or col in (
+            'close', 'MACD_DIF', 'MACD_DEA', 'MACD', 'RSI14', 'KDJ_K', 'KDJ_D', 'KDJ_J',
+            'BOLL_UPPER', 'BOLL_MID', 'BOLL_LOWER', 'OBV')]
+        tail = df[wanted].iloc[-2:].apply(pd.to_numeric, errors='coerce').to_numpy(dtype='float64')
+        latest = {col: value for col, value in zip(wanted, tail[-1].tolist()) if value == value}
+
+        def _or_zero(col):
+            return latest.get(col, 0)
+
+        snapshot.close = latest.get('close')
+        snapshot.ma = [(col, latest[col]) for col in wanted if _is_ma_column(col) and col in latest]
+        snapshot.ema = [(col, latest[col]) for col in wanted if col.startswith('EMA') and col in latest]
+        if 'MACD_DIF' in latest:
+            snapshot.macd = (latest['MACD_DIF'], _or_zero('MACD_DEA'), _or_zero('MACD'))
+        snapshot.rsi = latest.get('RSI14')
+        if 'KDJ_K' in latest:
+            snapshot.kdj = (latest['KDJ_K'], _or_zero('KDJ_D'), _or_zero('KDJ_J'))
+        if 'BOLL_UPPER' in latest:
+            snapshot.boll = (latest['BOLL_UPPER'], _or_zero('BOLL_MID'), _or_zero('BOLL_LOWER'))
+        snapshot.obv = latest.get('OBV')
+        if snapshot.obv is not None and len(tail) >= 2:
+            prev_obv = tail[0][wanted.index('OBV')]
+            snapshot.prev_obv = prev_obv if prev_obv == prev_obv else 0
+        return snapshot
+
+    def to_dict(self):
+        """JSON摘要（结果缓存，调用方不要修改）"""
+        if self._dict is None:
+            summary = {}
+            if self.ma:
+                summary['MA'] = dict(self.ma)
+            if self.ema:
+                summary['EMA'] = dict(self.ema)
+            if self.macd is not None:
+                summary['MACD'] = dict(zip(('DIF', 'DEA', 'MACD'), self.macd))
+            if self.rsi is not None:
+                summary['RSI'] = self.rsi
+            if self.kdj is not None:
+                summary['KDJ'] = dict(zip(('K', 'D', 'J'), self.kdj))
+            if self.boll is not None:
+                summary['BOLL'] = dict(zip(('upper', 'mid', 'lower'), self.boll))
+            if self.obv is not None:
+                summary['OBV'] = self.obv
+            self._dict = summary
+        return self._dict
+
+    def to_prompt_lines(self):
+        """AI提示词中的【技术指标分析】各行（不含标题）"""
+        if self._lines is None:
+            lines = []
+            ma_info = [f"{col}: {value:.2f}" for col, value in sorted(self.ma)]
+            if ma_info:
+                lines.append("移动平均线(MA): " + ", ".join(ma_info))
+            ema_info = [f"{col}: {value:.2f}" for col, value in sorted(self.ema)]
+            if ema_info:
+                lines.append("指数移动平均线(EMA): " + ", ".join(ema_info))
+            if self.macd is not None:
+                dif, dea, hist = self.macd
+                macd_signal = "金叉" if dif > dea else "死叉"
+                lines.append(f"MACD: DIF={dif:.3f}, DEA={dea:.3f}, MACD柱={hist:.3f} ({macd_signal})")
+            if self.rsi is not None:
+                rsi_status = "超买" if self.rsi > 70 else ("超卖" if self.rsi < 30 else "正常")
+                lines.append(f"RSI(14): {self.rsi:.2f} ({rsi_status})")
+            if self.kdj is not None:
+                k, d, j = self.kdj
+                kdj_signal = "金叉" if k > d else "死叉"
+                lines.append(f"KDJ: K={k:.2f}, D={d:.2f}, J={j:.2f} ({kdj_signal})")
+            if self.boll is not None:
+                upper, mid, lower = self.boll
+                current_price = self.close if self.close is not None else 0
+                boll_position = ""
+                if current_price > 0:
+                    if current_price > upper:
+                        boll_position = "突破上轨"
+                    elif current_price < lower:
+                        boll_position = "跌破下轨"
+                    else:
+                        boll_position = "轨道内"
+                lines.append(f"布林带: 上轨={upper:.2f}, 中轨={mid:.2f}, 下轨={lower:.2f} ({boll_position})")
+            if self.obv is not None and self.prev_obv is not None:
+                obv_trend = "上升" if self.obv - self.prev_obv > 0 else "下降"
+                lines.append(f"OBV: {self.obv:.0f} ({obv_trend})")
+            self._lines = lines
+        return self._lines
+
+
+def _last_bar_time(df):
+    """最后一根K线的时间（date/datetime/day列），取不到返回None"""
+    if df is None or len(df) == 0:
+        return None
+    for col in ('date', 'datetime', 'day'):
+        if col in df.columns:
+            value = df[col].iloc[-1]
+            return None if pd.isna(value) else str(value)
+    return None
+
+
+def get_indicator_snapshot(code, df):
+    """
+    获取指标快照，按 (code, 最后K线时间) 缓存
+
+    当日K线盘中仍在变化，缓存键额外带上最后一根的收盘价和成交量。
+    """
+    if df is None or len(df) == 0:
+        return IndicatorSnapshot(code)
+    last = df.iloc[-1]
+    key = (code, _last_bar_time(df), last.get('close'), last.get('volume'), len(df.columns))
+    snapshot = _snapshot_cache.get(key)
+    if snapshot is None:
+        snapshot = IndicatorSnapshot.from_frame(code, df)
+        _snapshot_cache.set(key, snapshot)
+    return snapshot
+
 # ==================== 数据整合函数 ====================
 
 def get_comprehensive_data(code):
@@ -140,39 +293,30 @@ def get_comprehensive_data(code):
     
     print(f"[API] 获取 {code} 实时行情...")
     result['realtime'] = get_realtime_data(code)
-    time.sleep(0.1)
     
     print(f"[API] 获取 {code} 5分钟K线...")
     result['minute_5'] = get_minute_kline(code, scale=5, datalen=240)
-    time.sleep(0.1)
     
     print(f"[API] 获取 {code} 15分钟K线...")
     result['minute_15'] = get_minute_kline(code, scale=15, datalen=160)
-    time.sleep(0.1)
     
     print(f"[API] 获取 {code} 30分钟K线...")
     result['minute_30'] = get_minute_kline(code, scale=30, datalen=80)
-    time.sleep(0.1)
     
     print(f"[API] 获取 {code} 分时数据...")
     result['timeline'] = get_timeline_data(code)
-    time.sleep(0.1)
     
     print(f"[API] 获取 {code} 日K线...")
     result['daily'] = get_daily_kline(code, count=240)
-    time.sleep(0.1)
     
     print(f"[API] 获取 {code} 板块/行业信息...")
     result['sector_info'] = get_sector_info(code)
-    time.sleep(0.1)
     
     print(f"[API] 获取 {code} 资金流向...")
     result['money_flow'] = get_money_flow(code)
-    time.sleep(0.1)
     
     print(f"[API] 获取 {code} 基本面数据...")
     result['fundamental'] = get_fundamental_data(code)
-    time.sleep(0.1)
     
     print(f"[API] 获取 {code} 行业对比数据...")
     result['industry_comparison'] = get_industry_comparison(code, sector_info=result.get('sector_info'))
@@ -208,29 +352,25 @@ def get_comprehensive_data_with_indicators(code):
         'indicators': None,  # 技术指标摘要
         'sector_info': None,  # 板块/行业信息
         'money_flow': None,   # 资金流向
+        'money_flow_trend': None,  # 资金流向趋势（日线累计/连续流入）
         'fundamental': None,  # 基本面数据
         'industry_comparison': None,  # 行业对比数据
     }
     
     print(f"[API] 获取 {code} 实时行情...")
     result['realtime'] = get_realtime_data(code)
-    time.sleep(0.1)
     
     print(f"[API] 获取 {code} 5分钟K线...")
     result['minute_5'] = get_minute_kline(code, scale=5, datalen=240)
-    time.sleep(0.1)
     
     print(f"[API] 获取 {code} 15分钟K线...")
     result['minute_15'] = get_minute_kline(code, scale=15, datalen=160)
-    time.sleep(0.1)
     
     print(f"[API] 获取 {code} 30分钟K线...")
     result['minute_30'] = get_minute_kline(code, scale=30, datalen=80)
-    time.sleep(0.1)
     
     print(f"[API] 获取 {code} 分时数据...")
     result['timeline'] = get_timeline_data(code)
-    time.sleep(0.1)
     
     print(f"[API] 获取 {code} 日K线...")
     daily_df = get_daily_kline(code, count=240)
@@ -240,62 +380,25 @@ def get_comprehensive_data_with_indicators(code):
         result['daily'] = daily_df
         
         # 提取最新技术指标摘要
-        if len(daily_df) > 0:
-            latest = daily_df.iloc[-1]
-            indicators_summary = {}
-            
-            ma_cols = [col for col in daily_df.columns if col.startswith('MA') and not col.startswith('MACD')]
-            if ma_cols:
-                indicators_summary['MA'] = {col: float(latest[col]) for col in ma_cols if pd.notna(latest[col])}
-            
-            ema_cols = [col for col in daily_df.columns if col.startswith('EMA')]
-            if ema_cols:
-                indicators_summary['EMA'] = {col: float(latest[col]) for col in ema_cols if pd.notna(latest[col])}
-            
-            if 'MACD_DIF' in daily_df.columns and pd.notna(latest['MACD_DIF']):
-                indicators_summary['MACD'] = {
-                    'DIF': float(latest['MACD_DIF']),
-                    'DEA': float(latest.get('MACD_DEA', 0)) if pd.notna(latest.get('MACD_DEA')) else 0,
-                    'MACD': float(latest.get('MACD', 0)) if pd.notna(latest.get('MACD')) else 0
-                }
-            
-            if 'RSI14' in daily_df.columns and pd.notna(latest['RSI14']):
-                indicators_summary['RSI'] = float(latest['RSI14'])
-            
-            if 'KDJ_K' in daily_df.columns and pd.notna(latest['KDJ_K']):
-                indicators_summary['KDJ'] = {
-                    'K': float(latest['KDJ_K']),
-                    'D': float(latest.get('KDJ_D', 0)) if pd.notna(latest.get('KDJ_D')) else 0,
-                    'J': float(latest.get('KDJ_J', 0)) if pd.notna(latest.get('KDJ_J')) else 0
-                }
-            
-            if 'BOLL_UPPER' in daily_df.columns and pd.notna(latest['BOLL_UPPER']):
-                indicators_summary['BOLL'] = {
-                    'upper': float(latest['BOLL_UPPER']),
-                    'mid': float(latest.get('BOLL_MID', 0)) if pd.notna(latest.get('BOLL_MID')) else 0,
-                    'lower': float(latest.get('BOLL_LOWER', 0)) if pd.notna(latest.get('BOLL_LOWER')) else 0
-                }
-            
-            if 'OBV' in daily_df.columns and pd.notna(latest['OBV']):
-                indicators_summary['OBV'] = float(latest['OBV'])
-            
-            result['indicators'] = indicators_summary
+        result['indicators'] = get_indicator_snapshot(code, daily_df).to_dict()
     else:
         result['daily'] = None
     
-    time.sleep(0.1)
     
     print(f"[API] 获取 {code} 板块/行业信息...")
     result['sector_info'] = get_sector_info(code)
-    time.sleep(0.1)
     
     print(f"[API] 获取 {code} 资金流向...")
     result['money_flow'] = get_money_flow(code)
-    time.sleep(0.1)
+    
+    print(f"[API] 获取 {code} 资金流向趋势...")
+    try:
+        result['money_flow_trend'] = get_money_flow_store().get_summary(code)
+    except Exception as e:
+        print(f"[API] 获取 {code} 资金流向趋势失败: {e}")
     
     print(f"[API] 获取 {code} 基本面数据...")
     result['fundamental'] = get_fundamental_data(code)
-    time.sleep(0.1)
     
     print(f"[API] 获取 {code} 行业对比数据...")
     result['industry_comparison'] = get_industry_comparison(code, sector_info=result.get('sector_info'))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""分钟K线重采样校验
+
+用新浪5分钟K线重采样出15/30/60分钟K线，与新浪直接返回的同周期K线逐根对比（需要网络）。
+用法:
+    python verify_resample.py                  # 默认几只股票
+    python verify_resample.py 600000 000001    # 指定股票
+"""
+
+import sys
+
+import numpy as np
+
+from bar_resampler import resample_bars, DERIVED_SCALES, SINA_MAX_DATALEN
+from data_fetchers import fetch_minute_kline
+
+DEFAULT_CODES = ['600000', '000001', '300750', '601318']
+PRICE_TOLERANCE = 1e-3
+VOLUME_TOLERANCE = 1e-6  # 相对误差
+
+
+def compare(derived, upstream):
+    """按K线时间对齐后比较OHLCV，返回 (重叠根数, 不一致根数, 不一致样例)"""
+    merged = derived.merge(upstream, on='day', suffixes=('', '_upstream'))
+    if len(merged) == 0:
+        return 0, 0, []
+    bad = np.zeros(len(merged), dtype=bool)
+    for col in ['open', 'high', 'low', 'close']:
+        bad |= ~np.isclose(merged[col], merged[f'{col}_upstream'], rtol=0, atol=PRICE_TOLERANCE)
+    bad |= ~np.isclose(merged['volume'], merged['volume_upstream'], rtol=VOLUME_TOLERANCE)
+    samples = merged.loc[bad, ['day', 'open', 'open_upstream', 'close', 'close_upstream',
+                               'volume', 'volume_upstream']].head(3).to_dict('records')
+    return len(merged), int(bad.sum()), samples
+
+
+if __name__ == '__main__':
+    codes = sys.argv[1:] or DEFAULT_CODES
+    failed = False
+    print(f"{'code':<8}{'scale':>6}{'overlap':>9}{'mismatch':>10}")
+    for code in codes:
+        base = fetch_minute_kline(code, scale=5, datalen=SINA_MAX_DATALEN)
+        if base is None or len(base) == 0:
+            print(f"{code:<8} 获取5分钟K线失败")
+            failed = True
+            continue
+        for scale in DERIVED_SCALES:
+            upstream = fetch_minute_kline(code, scale=scale, datalen=SINA_MAX_DATALEN)
+            if upstream is None:
+                print(f"{code:<8}{scale:>6} 获取上游K线失败")
+                failed = True
+                continue
+            overlap, mismatch, samples = compare(resample_bars(base, scale), upstream)
+            print(f"{code:<8}{scale:>6}{overlap:>9}{mismatch:>10}")
+            for sample in samples:
+                print(f"    {sample}")
+            failed = failed or mismatch > 0 or overlap == 0
+    sys.exit(1 if failed else 0)